@@ -3,8 +3,13 @@
 from typing import Final
 
 from beaker import *
+from beaker.lib.storage import BoxMapping
 from pyteal import *
 
+from build_options import expiry_check
+from events import emit
+from terms import LoanView, owed, status
+
 
 class State:
     nft: Final[GlobalStateValue] = GlobalStateValue(
@@ -25,10 +30,10 @@ class State:
         descr="Amount of tokens requested to borrow",
     )
 
-    interest: Final[GlobalStateValue] = GlobalStateValue(  # 2 decimal points
+    interest: Final[GlobalStateValue] = GlobalStateValue(  # basis points
         stack_type=TealType.uint64,
         default=Int(0),
-        descr="Amount of interest the borrower asks for",
+        descr="Yearly interest rate, in basis points, accruing by the second",
     )
 
     start: Final[GlobalStateValue] = GlobalStateValue(
@@ -43,6 +48,12 @@ class State:
         descr="Timestamp that the loan is ended",
     )
 
+    bundle: Final[GlobalStateValue] = GlobalStateValue(
+        stack_type=TealType.bytes,
+        default=Bytes(""),
+        descr="IDs of the NFTs pledged along with nft, 8 bytes each",
+    )
+
     duration: Final[GlobalStateValue] = GlobalStateValue(
         stack_type=TealType.uint64,
         default=Int(0),
@@ -61,9 +72,38 @@ class State:
         descr="ID of the lender",
     )
 
+    bid_end: Final[GlobalStateValue] = GlobalStateValue(
+        stack_type=TealType.uint64,
+        default=Int(0),
+        descr="Timestamp that the interest auction closes, 0 when there is none",
+    )
+
+    best_bid: Final[GlobalStateValue] = GlobalStateValue(
+        stack_type=TealType.uint64,
+        default=Int(0),
+        descr="Lowest interest bid so far",
+    )
+
+    best_bidder: Final[GlobalStateValue] = GlobalStateValue(
+        stack_type=TealType.bytes,
+        default=Bytes(""),
+        descr="ID of the lowest bidder, whose tokens the app holds",
+    )
+
+    # Tokens owed back to each bidder, keyed by the bidder and the token
+    refunds: Final[BoxMapping] = BoxMapping(
+        abi.Tuple2[abi.Address, abi.Uint64], abi.Uint64
+    )
+
 
 app = Application("NFTasCollateral", state=State)
 
+# NFTs in a bundle, which every call that moves them must reference
+MAX_BUNDLE = 8
+# Minimum balance of a refund box: 2500 + 400 per byte of its 40 byte key and
+# 8 byte value, which the bidder pays on their first bid
+REFUND_MBR = 2500 + 400 * (40 + 8)
+
 
 @app.create(bare=True)
 def create() -> Expr:
@@ -71,6 +111,51 @@ def create() -> Expr:
     return app.initialize_global_state()
 
 
+def bundle_size() -> Expr:
+    # NFTs besides `nft`
+    return Len(app.state.bundle.get()) / Int(8)
+
+
+def bundle_nft(i: Expr) -> Expr:
+    return ExtractUint64(app.state.bundle.get(), i * Int(8))
+
+
+def opt_in(nft: Expr) -> dict[TxnField, Expr | list[Expr]]:
+    return {
+        TxnField.type_enum: TxnType.AssetTransfer,
+        TxnField.xfer_asset: nft,
+        TxnField.asset_amount: Int(0),
+        TxnField.asset_receiver: Global.current_application_address(),
+        TxnField.fee: Int(0),
+    }
+
+
+def nft_transfer(nft: Expr, receiver: Expr) -> dict[TxnField, Expr | list[Expr]]:
+    return {
+        TxnField.type_enum: TxnType.AssetTransfer,
+        TxnField.xfer_asset: nft,
+        TxnField.asset_amount: Int(1),
+        TxnField.asset_receiver: receiver,
+        TxnField.fee: Int(0),
+        TxnField.asset_close_to: receiver,
+    }
+
+
+def release(receiver: Expr) -> Expr:
+    # Sends the NFT and the rest of its bundle to `receiver` in one inner
+    # group, closing the app's holdings
+    i = ScratchVar(TealType.uint64)
+    return Seq(
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields(nft_transfer(app.state.nft.get(), receiver)),
+        For(i.store(Int(0)), i.load() < bundle_size(), i.store(i.load() + Int(1))).Do(
+            InnerTxnBuilder.Next(),
+            InnerTxnBuilder.SetFields(nft_transfer(bundle_nft(i.load()), receiver)),
+        ),
+        InnerTxnBuilder.Submit(),
+    )
+
+
 # ---------------------------- Borrower ----------------------------
 @app.external()
 def opt_app_in_nft(nft: abi.Asset) -> Expr:
@@ -91,6 +176,41 @@ def opt_app_in_nft(nft: abi.Asset) -> Expr:
         # State
         app.state.borrower.set(Txn.sender()),
         app.state.nft.set(nft.asset_id()),
+        # Event
+        emit("NftOptedIn", nft.asset_id(), Txn.sender()),
+    )
+
+
+@app.external()
+def opt_app_in_bundle(nfts: abi.DynamicArray[abi.Uint64]) -> Expr:
+    # opt_app_in_nft for up to MAX_BUNDLE NFTs pledged together, all of
+    # which the call must reference. The first one is `nft`, and the IDs must
+    # be strictly increasing so that no NFT is pledged twice
+    i = ScratchVar(TealType.uint64)
+    nft = ExtractUint64(nfts.encode(), Int(2) + i.load() * Int(8))
+    previous = ExtractUint64(nfts.encode(), Int(2) + (i.load() - Int(1)) * Int(8))
+    return Seq(
+        # Checks
+        Assert(app.state.borrower == Bytes("")),
+        Assert(app.state.nft == Int(0)),
+        Assert(nfts.length() > Int(0)),
+        Assert(nfts.length() <= Int(MAX_BUNDLE)),
+        # Transaction
+        InnerTxnBuilder.Begin(),
+        For(i.store(Int(0)), i.load() < nfts.length(), i.store(i.load() + Int(1))).Do(
+            If(i.load() > Int(0)).Then(
+                Assert(nft > previous),
+                InnerTxnBuilder.Next(),
+            ),
+            InnerTxnBuilder.SetFields(opt_in(nft)),
+        ),
+        InnerTxnBuilder.Submit(),
+        # State
+        app.state.borrower.set(Txn.sender()),
+        app.state.nft.set(ExtractUint64(nfts.encode(), Int(2))),
+        app.state.bundle.set(Suffix(nfts.encode(), Int(10))),
+        # Event
+        emit("NftOptedIn", app.state.nft.get(), Txn.sender()),
     )
 
 
@@ -102,6 +222,8 @@ def request_loan(
     interest: abi.Uint64,
     axfer: abi.AssetTransferTransaction,
 ) -> Expr:
+    i = ScratchVar(TealType.uint64)
+    nft = Gtxn[axfer.index() - bundle_size() + i.load()]
     return Seq(
         # Checks
         Assert(Txn.sender() == app.state.borrower),
@@ -109,32 +231,93 @@ def request_loan(
         Assert(axfer.get().asset_receiver() == Global.current_application_address()),
         Assert(axfer.get().xfer_asset() == app.state.nft),
         Assert(axfer.get().asset_amount() == Int(1)),
+        # The rest of a bundle is transferred just before `axfer`, in order
+        For(i.store(Int(0)), i.load() < bundle_size(), i.store(i.load() + Int(1))).Do(
+            Assert(nft.type_enum() == TxnType.AssetTransfer),
+            Assert(nft.asset_receiver() == Global.current_application_address()),
+            Assert(nft.xfer_asset() == bundle_nft(i.load())),
+            Assert(nft.asset_amount() == Int(1)),
+        ),
         # State
         app.state.token.set(token.get()),
         app.state.amount.set(amount.get()),
         app.state.duration.set(duration.get()),
         app.state.interest.set(interest.get()),
+        # Event
+        emit(
+            "LoanRequested",
+            app.state.nft.get(),
+            token.get(),
+            amount.get(),
+            duration.get(),
+            interest.get(),
+        ),
     )
 
 
 @app.external()
-def delete_request() -> Expr:
+def list_loan(
+    nft: abi.Asset,
+    token: abi.Uint64,
+    amount: abi.Uint64,
+    duration: abi.Uint64,
+    interest: abi.Uint64,
+) -> Expr:
+    # opt_app_in_nft and request_loan in one call. The NFT can only be sent
+    # once the app has opted in, so its transfer follows this call in the group
+    axfer = Gtxn[Txn.group_index() + Int(1)]
     return Seq(
         # Checks
-        Assert(Txn.sender() == app.state.borrower),
-        Assert(app.state.lender == Bytes("")),
+        Assert(app.state.borrower == Bytes("")),
+        Assert(app.state.nft == Int(0)),
+        Assert(Txn.group_index() + Int(1) < Global.group_size()),
+        Assert(axfer.type_enum() == TxnType.AssetTransfer),
+        Assert(axfer.sender() == Txn.sender()),
+        Assert(axfer.asset_receiver() == Global.current_application_address()),
+        Assert(axfer.xfer_asset() == nft.asset_id()),
+        Assert(axfer.asset_amount() == Int(1)),
         # Transaction
         InnerTxnBuilder.Execute(
             {
                 TxnField.type_enum: TxnType.AssetTransfer,
-                TxnField.xfer_asset: app.state.nft,
-                TxnField.asset_amount: Int(1),
-                TxnField.asset_receiver: app.state.borrower.get(),
+                TxnField.xfer_asset: nft.asset_id(),
+                TxnField.asset_amount: Int(0),
+                TxnField.asset_receiver: Global.current_application_address(),
                 TxnField.fee: Int(0),
-                TxnField.asset_close_to: app.state.borrower.get(),
             }
         ),
         # State
+        app.state.borrower.set(Txn.sender()),
+        app.state.nft.set(nft.asset_id()),
+        app.state.token.set(token.get()),
+        app.state.amount.set(amount.get()),
+        app.state.duration.set(duration.get()),
+        app.state.interest.set(interest.get()),
+        # Event
+        emit("NftOptedIn", nft.asset_id(), Txn.sender()),
+        emit(
+            "LoanRequested",
+            nft.asset_id(),
+            token.get(),
+            amount.get(),
+            duration.get(),
+            interest.get(),
+        ),
+    )
+
+
+@app.external()
+def delete_request() -> Expr:
+    return Seq(
+        # Checks
+        Assert(Txn.sender() == app.state.borrower),
+        Assert(app.state.lender == Bytes("")),
+        Assert(app.state.bid_end.get() == Int(0)),
+        # Transaction
+        release(app.state.borrower.get()),
+        # Event
+        emit("RequestDeleted", app.state.nft.get()),
+        # State
         app.initialize_global_state()
     )
 
@@ -148,21 +331,83 @@ def repay_loan(loan: abi.AssetTransferTransaction) -> Expr:
         Assert(Global.latest_timestamp() <= app.state.start.get()
          + app.state.duration.get()),
         Assert(loan.get().xfer_asset() == app.state.token.get()),
-        Assert(loan.get().asset_amount() == app.state.amount.get()),
+        Assert(loan.get().asset_amount() >= owed(
+            app.state.amount.get(), app.state.interest.get(), app.state.start.get()
+        )),
         Assert(loan.get().asset_receiver() == app.state.lender.get()),
         # Transaction 
+        release(app.state.borrower.get()),
+        # Event
+        emit("LoanRepaid", app.state.nft.get(), loan.get().asset_amount()),
+        # State
+        app.initialize_global_state()
+    )
+
+
+@app.external()
+def start_auction(window: abi.Uint64) -> Expr:
+    # Lenders bid the interest down from the requested one for `window`
+    # seconds, instead of accepting it as is
+    return Seq(
+        # Checks
+        Assert(Txn.sender() == app.state.borrower),
+        Assert(app.state.token.get() != Int(0)),
+        Assert(app.state.lender == Bytes("")),
+        Assert(app.state.bid_end.get() == Int(0)),
+        # Transaction
         InnerTxnBuilder.Execute(
             {
                 TxnField.type_enum: TxnType.AssetTransfer,
-                TxnField.xfer_asset: app.state.nft,
-                TxnField.asset_amount: Int(1),
-                TxnField.asset_receiver: app.state.borrower,
+                TxnField.xfer_asset: app.state.token,
+                TxnField.asset_amount: Int(0),
+                TxnField.asset_receiver: Global.current_application_address(),
                 TxnField.fee: Int(0),
-                TxnField.asset_close_to: app.state.borrower,
             }
         ),
         # State
-        app.initialize_global_state()
+        app.state.bid_end.set(Global.latest_timestamp() + window.get()),
+    )
+
+
+@app.external
+def refinance_loan(
+    duration: abi.Uint64,
+    interest: abi.Uint64,
+    payoff: abi.AssetTransferTransaction,
+) -> Expr:
+    # A new lender pays off the current one, and lends what it paid on new
+    # terms. The NFT stays in the app
+    return Seq(
+        # Checks
+        Assert(Txn.sender() == app.state.borrower),
+        Assert(app.state.lender != Bytes("")),
+        Assert(
+            Global.latest_timestamp()
+            <= app.state.start.get() + app.state.duration.get()
+        ),
+        Assert(payoff.get().xfer_asset() == app.state.token.get()),
+        Assert(
+            payoff.get().asset_amount()
+            >= owed(
+                app.state.amount.get(), app.state.interest.get(), app.state.start.get()
+            )
+        ),
+        Assert(payoff.get().asset_receiver() == app.state.lender.get()),
+        # State
+        app.state.lender.set(payoff.get().sender()),
+        app.state.amount.set(payoff.get().asset_amount()),
+        app.state.start.set(Global.latest_timestamp()),
+        app.state.duration.set(duration.get()),
+        app.state.interest.set(interest.get()),
+        # Event
+        emit(
+            "LoanRefinanced",
+            app.state.nft.get(),
+            payoff.get().sender(),
+            payoff.get().asset_amount(),
+            duration.get(),
+            interest.get(),
+        ),
     )
 
 
@@ -172,38 +417,301 @@ def accept_loan(loan: abi.AssetTransferTransaction) -> Expr:
     return Seq(
         # Checks
         Assert(app.state.lender == Bytes("")),
+        Assert(app.state.bid_end.get() == Int(0)),
         Assert(loan.get().xfer_asset() == app.state.token.get()),
         Assert(loan.get().asset_amount() == app.state.amount.get()),
         Assert(loan.get().asset_receiver() == app.state.borrower.get()),
         # State
         app.state.lender.set(loan.get().sender()),
         app.state.start.set(Global.latest_timestamp()),
+        # Event
+        emit(
+            "LoanAccepted",
+            app.state.nft.get(),
+            loan.get().sender(),
+            app.state.interest.get(),
+            Global.latest_timestamp(),
+        ),
     )
 
 
+def refund_box(bidder: Expr, token: Expr) -> BoxMapping.Element:
+    return app.state.refunds[Concat(bidder, Itob(token))]
+
+
 @app.external
-def liquidate_loan() -> Expr:
+def place_bid(
+    interest: abi.Uint64,
+    loan: abi.AssetTransferTransaction,
+    pay: abi.PaymentTransaction,
+) -> Expr:
+    # The app keeps the tokens of every bid, and the bid it beats is owed back
+    # to its bidder, who claims it with claim_refund. Sending it back here
+    # would fail, and the auction with it, once that bidder opts out of the
+    # token. The box keeping count is paid for by `pay` on the first bid
+    outbid = app.state.best_bidder != Bytes("")
+    mine = refund_box(loan.get().sender(), app.state.token.get())
+    theirs = refund_box(app.state.best_bidder.get(), app.state.token.get())
     return Seq(
         # Checks
-        Assert(Txn.sender() == app.state.lender),
-        # Loan end check is commented out for automated testing
-        # Assert(
-        #     Global.latest_timestamp() > app.state.start.get()
-        #  + app.state.duration.get()
-        # ),
+        Assert(Global.latest_timestamp() < app.state.bid_end.get()),
+        Assert(
+            If(
+                outbid,
+                interest.get() < app.state.best_bid.get(),
+                interest.get() <= app.state.interest.get(),
+            )
+        ),
+        Assert(loan.get().xfer_asset() == app.state.token.get()),
+        Assert(loan.get().asset_amount() == app.state.amount.get()),
+        Assert(loan.get().asset_receiver() == Global.current_application_address()),
+        Assert(pay.get().receiver() == Global.current_application_address()),
+        # State
+        If(Not(mine.exists())).Then(
+            Assert(pay.get().amount() >= Int(REFUND_MBR)),
+            mine.set(Itob(Int(0))),
+        ),
+        If(outbid).Then(
+            BoxReplace(
+                theirs.key,
+                Int(0),
+                Itob(Btoi(theirs.get()) + app.state.amount.get()),
+            )
+        ),
+        app.state.best_bidder.set(loan.get().sender()),
+        app.state.best_bid.set(interest.get()),
+    )
+
+
+@app.external
+def settle_auction() -> Expr:
+    # Anyone may settle once bidding closed. The best bidder becomes the
+    # lender at their interest; with no bids the request stays open
+    won = app.state.best_bidder != Bytes("")
+    payout = If(won, app.state.amount.get(), Int(0))
+    held = AssetHolding.balance(
+        Global.current_application_address(), app.state.token.get()
+    )
+    return Seq(
+        # Checks
+        Assert(app.state.bid_end.get() != Int(0)),
+        Assert(Global.latest_timestamp() >= app.state.bid_end.get()),
         # Transaction
-        InnerTxnBuilder.Execute(
+        held,
+        If(held.value() == payout)
+        .Then(
+            InnerTxnBuilder.Execute(
+                {
+                    TxnField.type_enum: TxnType.AssetTransfer,
+                    TxnField.xfer_asset: app.state.token,
+                    TxnField.asset_amount: Int(0),
+                    TxnField.asset_receiver: app.state.borrower,
+                    TxnField.fee: Int(0),
+                    # Hands the winning bid, if any, to the borrower; with no
+                    # refunds left to claim the app no longer holds the token
+                    TxnField.asset_close_to: app.state.borrower,
+                }
+            )
+        )
+        .ElseIf(won)
+        .Then(
+            InnerTxnBuilder.Execute(
+                {
+                    TxnField.type_enum: TxnType.AssetTransfer,
+                    TxnField.xfer_asset: app.state.token,
+                    TxnField.asset_amount: app.state.amount,
+                    TxnField.asset_receiver: app.state.borrower,
+                    TxnField.fee: Int(0),
+                }
+            )
+        ),
+        # State
+        If(won).Then(
+            Seq(
+                app.state.lender.set(app.state.best_bidder),
+                app.state.interest.set(app.state.best_bid),
+                app.state.start.set(Global.latest_timestamp()),
+                emit(
+                    "LoanAccepted",
+                    app.state.nft.get(),
+                    app.state.lender.get(),
+                    app.state.interest.get(),
+                    Global.latest_timestamp(),
+                ),
+            )
+        ),
+        app.state.bid_end.set(Int(0)),
+        app.state.best_bid.set(Int(0)),
+        app.state.best_bidder.set(Bytes("")),
+    )
+
+
+@app.external
+def claim_refund(token: abi.Asset) -> Expr:
+    # A bidder takes back the tokens of the bids they lost in `token`, and the
+    # minimum balance of the box that kept count
+    box = refund_box(Txn.sender(), token.asset_id())
+    owed = ScratchVar(TealType.uint64)
+    held = AssetHolding.balance(Global.current_application_address(), token.asset_id())
+    return Seq(
+        # Checks
+        Assert(Txn.sender() != app.state.best_bidder.get()),
+        owed.store(Btoi(box.get())),
+        # Transaction
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields(
             {
-                TxnField.type_enum: TxnType.AssetTransfer,
-                TxnField.xfer_asset: app.state.nft,
-                TxnField.asset_amount: Int(1),
-                TxnField.asset_receiver: app.state.lender,
+                TxnField.type_enum: TxnType.Payment,
+                TxnField.amount: Int(REFUND_MBR),
+                TxnField.receiver: Txn.sender(),
                 TxnField.fee: Int(0),
-                TxnField.asset_close_to: app.state.lender,
             }
         ),
+        If(owed.load() > Int(0)).Then(
+            InnerTxnBuilder.Next(),
+            InnerTxnBuilder.SetFields(
+                {
+                    TxnField.type_enum: TxnType.AssetTransfer,
+                    TxnField.xfer_asset: token.asset_id(),
+                    TxnField.asset_amount: owed.load(),
+                    TxnField.asset_receiver: Txn.sender(),
+                    TxnField.fee: Int(0),
+                }
+            ),
+            held,
+            # With the auction settled the last refund closes the app out of
+            # the token
+            If(
+                And(app.state.bid_end.get() == Int(0), held.value() == owed.load())
+            ).Then(InnerTxnBuilder.SetField(TxnField.asset_close_to, Txn.sender())),
+        ),
+        InnerTxnBuilder.Submit(),
+        # State
+        Pop(box.delete()),
+    )
+
+
+@app.external
+def liquidate_loan() -> Expr:
+    return Seq(
+        # Checks
+        Assert(Txn.sender() == app.state.lender),
+        expiry_check(app.state.start.get() + app.state.duration.get()),
+        # Transaction
+        release(app.state.lender.get()),
+        # Event
+        emit("LoanLiquidated", app.state.nft.get(), app.state.lender.get()),
         app.initialize_global_state()
     )
 
+
+@app.external
+def extend_loan(duration: abi.Uint64, payment: abi.AssetTransferTransaction) -> Expr:
+    # The lender rolls the loan over for `duration` more seconds from now,
+    # once the borrower paid the interest accrued so far
+    return Seq(
+        # Checks
+        Assert(Txn.sender() == app.state.lender),
+        Assert(
+            Global.latest_timestamp()
+            <= app.state.start.get() + app.state.duration.get()
+        ),
+        Assert(payment.get().sender() == app.state.borrower.get()),
+        Assert(payment.get().xfer_asset() == app.state.token.get()),
+        Assert(
+            payment.get().asset_amount()
+            >= owed(
+                app.state.amount.get(), app.state.interest.get(), app.state.start.get()
+            )
+            - app.state.amount.get()
+        ),
+        Assert(payment.get().asset_receiver() == app.state.lender.get()),
+        # State
+        app.state.start.set(Global.latest_timestamp()),
+        app.state.duration.set(duration.get()),
+        # Event
+        emit(
+            "LoanExtended",
+            app.state.nft.get(),
+            duration.get(),
+            Global.latest_timestamp(),
+        ),
+    )
+
+
+# ---------------------------- Read-only ----------------------------
+def lent() -> Expr:
+    return app.state.lender != Bytes("")
+
+
+def address(value: Expr) -> Expr:
+    # Empty until set, which an ABI address can't be
+    return If(Len(value) == Int(0), Global.zero_address(), value)
+
+
+def repayment(later: Expr) -> Expr:
+    return If(
+        lent(),
+        owed(
+            app.state.amount.get(),
+            app.state.interest.get(),
+            app.state.start.get(),
+            later,
+        ),
+        app.state.amount.get(),
+    )
+
+
+def current_status() -> Expr:
+    return status(
+        app.state.nft.get(),
+        app.state.token.get(),
+        lent(),
+        app.state.start.get() + app.state.duration.get(),
+    )
+
+
+@app.external(read_only=True)
+def quote(later: abi.Uint64, *, output: abi.Uint64) -> Expr:
+    # What repay_loan takes `later` seconds after the latest block
+    return output.set(repayment(later.get()))
+
+
+@app.external(read_only=True)
+def loan_status(*, output: abi.Uint8) -> Expr:
+    return output.set(current_status())
+
+
+@app.external(read_only=True)
+def view(*, output: LoanView) -> Expr:
+    nft = abi.Uint64()
+    token = abi.Uint64()
+    amount = abi.Uint64()
+    interest = abi.Uint64()
+    start = abi.Uint64()
+    duration = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    owes = abi.Uint64()
+    state = abi.Uint8()
+    return Seq(
+        nft.set(app.state.nft.get()),
+        token.set(app.state.token.get()),
+        amount.set(app.state.amount.get()),
+        interest.set(app.state.interest.get()),
+        start.set(app.state.start.get()),
+        duration.set(app.state.duration.get()),
+        borrower.set(address(app.state.borrower.get())),
+        lender.set(address(app.state.lender.get())),
+        owes.set(repayment(Int(0))),
+        state.set(current_status()),
+        output.set(
+            nft, token, amount, interest, start, duration, borrower, lender, owes, state
+        ),
+    )
+
+
 if __name__ == "__main__":
-    app.build().export("./artifacts")
+    from build import build
+
+    build("app")
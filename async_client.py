@@ -0,0 +1,360 @@
+"""asyncio client for the loan lifecycle methods of app.py.
+
+Many `LoanClient`s share one `AsyncAlgod`, which holds what is worth sharing
+between them:
+
+- one pooled, keep-alive HTTP session to algod (`HttpAlgod`);
+- the suggested params, fetched once per round;
+- a single watcher that confirms every outstanding transaction once per new
+  block, instead of each caller polling algod for its own.
+
+`LocalAlgod` serves the same calls from a blocking `AlgodClient` whose
+requests do no I/O, i.e. the in-process simulator.
+
+A `LoanClient` given an `instrumentation.Metrics` records the phases, fee and
+outcome of each of its calls there.
+"""
+
+import abc
+import asyncio
+import base64
+import copy
+from contextlib import AbstractContextManager, nullcontext
+from typing import Any
+
+import httpx
+from algokit_utils import ApplicationSpecification
+from algosdk import encoding, transaction
+from algosdk.atomic_transaction_composer import (
+    AtomicTransactionComposer,
+    TransactionWithSigner,
+)
+from algosdk.error import AlgodHTTPError
+from algosdk.logic import get_application_address
+from algosdk.v2client.algod import AlgodClient
+from algosdk.v2client.models import SimulateRequest, SimulateRequestTransactionGroup
+from beaker.localnet import LocalAccount
+
+from instrumentation import Metrics
+
+# Watcher passes, i.e. new blocks, a transaction may stay pending for
+MAX_ROUNDS = 10
+# Seconds a repayment may take to be confirmed, whose interest it pays ahead
+REPAY_WITHIN = 60
+
+
+class AsyncAlgod(abc.ABC):
+    def __init__(self) -> None:
+        self.round = 0
+        self._params: tuple[int, transaction.SuggestedParams] | None = None
+        self._params_lock = asyncio.Lock()
+        self._pending: dict[str, tuple[asyncio.Future[dict[str, Any]], int]] = {}
+        self._watcher: asyncio.Task[None] | None = None
+
+    @abc.abstractmethod
+    async def request(
+        self, method: str, path: str, data: bytes | None = None
+    ) -> dict[str, Any]:
+        """Send one request to algod's v2 API and return its JSON response."""
+
+    async def close(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+
+    async def suggested_params(self) -> transaction.SuggestedParams:
+        """algod's suggested params, fetched again only once the round moved on."""
+        async with self._params_lock:
+            if self._params is None or self._params[0] < self.round:
+                params = await self.request("GET", "/transactions/params")
+                self.round = max(self.round, params["last-round"])
+                self._params = (
+                    self.round,
+                    transaction.SuggestedParams(
+                        fee=params["fee"],
+                        first=params["last-round"],
+                        last=params["last-round"] + 1000,
+                        gh=params["genesis-hash"],
+                        gen=params["genesis-id"],
+                        flat_fee=False,
+                        consensus_version=params["consensus-version"],
+                        min_fee=params["min-fee"],
+                    ),
+                )
+            return self._params[1]
+
+    async def send(self, signed: list[transaction.GenericSignedTransaction]) -> str:
+        data = b"".join(
+            base64.b64decode(encoding.msgpack_encode(stxn)) for stxn in signed
+        )
+        return (await self.request("POST", "/transactions", data))["txId"]
+
+    async def simulate(
+        self, signed: list[transaction.GenericSignedTransaction]
+    ) -> dict[str, Any]:
+        request = SimulateRequest(
+            txn_groups=[SimulateRequestTransactionGroup(txns=signed)]
+        )
+        data = base64.b64decode(encoding.msgpack_encode(request))
+        return await self.request("POST", "/transactions/simulate", data)
+
+    async def confirm(self, txid: str) -> dict[str, Any]:
+        """Wait for `txid` to be confirmed; returns its pending info."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending[txid] = (future, 0)
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch())
+        return await future
+
+    async def _watch(self) -> None:
+        while self._pending:
+            txids = list(self._pending)
+            infos = await asyncio.gather(
+                *(
+                    self.request("GET", f"/transactions/pending/{txid}")
+                    for txid in txids
+                ),
+                return_exceptions=True,
+            )
+            for txid, info in zip(txids, infos, strict=True):
+                future, rounds = self._pending[txid]
+                if isinstance(info, BaseException):
+                    del self._pending[txid]
+                    future.set_exception(info)
+                elif info.get("confirmed-round"):
+                    del self._pending[txid]
+                    self.round = max(self.round, info["confirmed-round"])
+                    future.set_result(info)
+                elif info.get("pool-error") or rounds >= MAX_ROUNDS:
+                    del self._pending[txid]
+                    reason = info.get("pool-error") or f"pending after {rounds} rounds"
+                    future.set_exception(AlgodHTTPError(f"{txid}: {reason}"))
+                else:
+                    self._pending[txid] = (future, rounds + 1)
+            if self._pending:
+                status = await self.request(
+                    "GET", f"/status/wait-for-block-after/{self.round}"
+                )
+                self.round = max(self.round, status["last-round"])
+
+
+class HttpAlgod(AsyncAlgod):
+    """Talks to algod over one pooled keep-alive `httpx.AsyncClient`."""
+
+    def __init__(self, address: str, token: str, max_connections: int = 100) -> None:
+        super().__init__()
+        self.session = httpx.AsyncClient(
+            base_url=address,
+            headers={"X-Algo-API-Token": token},
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=30,
+        )
+
+    @classmethod
+    def from_client(
+        cls: type["HttpAlgod"], algod: AlgodClient, max_connections: int = 100
+    ) -> "HttpAlgod":
+        return cls(algod.algod_address, algod.algod_token, max_connections)
+
+    async def request(
+        self, method: str, path: str, data: bytes | None = None
+    ) -> dict[str, Any]:
+        # A simulate request is a msgpack encoded object, not raw transactions
+        kind = "msgpack" if path == "/transactions/simulate" else "x-binary"
+        response = await self.session.request(
+            method,
+            f"/v2{path}",
+            content=data,
+            headers={"Content-Type": f"application/{kind}"} if data else None,
+        )
+        if response.is_error:
+            try:
+                message = response.json()["message"]
+            except (ValueError, KeyError):
+                message = response.text
+            raise AlgodHTTPError(message, response.status_code)
+        return response.json()
+
+    async def close(self) -> None:
+        await super().close()
+        await self.session.aclose()
+
+
+class LocalAlgod(AsyncAlgod):
+    """Serves the requests from a blocking client that does no I/O."""
+
+    def __init__(self, algod: AlgodClient) -> None:
+        super().__init__()
+        self.algod = algod
+
+    async def request(
+        self, method: str, path: str, data: bytes | None = None
+    ) -> dict[str, Any]:
+        response = self.algod.algod_request(method, path, data=data)
+        assert isinstance(response, dict)
+        return response
+
+
+class LoanClient:
+    """One account's calls to one NFTasCollateral app.
+
+    Each method sends its group and returns the app call's confirmed
+    pending info."""
+
+    def __init__(
+        self,
+        algod: AsyncAlgod,
+        app_spec: ApplicationSpecification,
+        app_id: int,
+        account: LocalAccount,
+        metrics: Metrics | None = None,
+    ) -> None:
+        self.algod = algod
+        self.contract = app_spec.contract
+        self.app_id = app_id
+        self.app_addr = get_application_address(app_id)
+        self.account = account
+        self.metrics = metrics
+
+    def _phase(self, name: str) -> AbstractContextManager[None]:
+        return self.metrics.phase(name) if self.metrics else nullcontext()
+
+    async def _params(self, fee: int) -> transaction.SuggestedParams:
+        # A copy: the cached params are shared with every other caller
+        sp = copy.copy(await self.algod.suggested_params())
+        sp.flat_fee = True
+        sp.fee = sp.min_fee * fee
+        return sp
+
+    async def _axfer(
+        self, receiver: str, asset: int, amount: int
+    ) -> TransactionWithSigner:
+        return TransactionWithSigner(
+            txn=transaction.AssetTransferTxn(
+                sender=self.account.address,
+                sp=await self._params(1),
+                receiver=receiver,
+                amt=amount,
+                index=asset,
+            ),
+            signer=self.account.signer,
+        )
+
+    async def call(
+        self,
+        method: str,
+        args: list[Any] | None = None,
+        *,
+        fee: int = 1,
+        foreign_assets: list[int] | None = None,
+        then: list[TransactionWithSigner] | None = None,
+    ) -> dict[str, Any]:
+        """Call `method`, followed in its group by `then`.
+
+        A fee of 2 covers the inner transaction the call sends."""
+        if self.metrics is None:
+            return await self._call(method, args, fee, foreign_assets, then)
+        with self.metrics.call(method):
+            info = await self._call(method, args, fee, foreign_assets, then)
+            self.metrics.record_confirmed(info)
+            return info
+
+    async def _call(
+        self,
+        method: str,
+        args: list[Any] | None,
+        fee: int,
+        foreign_assets: list[int] | None,
+        then: list[TransactionWithSigner] | None,
+    ) -> dict[str, Any]:
+        with self._phase("params"):
+            sp = await self._params(fee)
+        atc = AtomicTransactionComposer()
+        atc.add_method_call(
+            app_id=self.app_id,
+            method=self.contract.get_method_by_name(method),
+            sender=self.account.address,
+            sp=sp,
+            signer=self.account.signer,
+            method_args=args or [],
+            foreign_assets=foreign_assets,
+        )
+        for txn in then or []:
+            atc.add_transaction(txn)
+        with self._phase("sign"):
+            signed = list(atc.gather_signatures())
+        if self.metrics is not None and self.metrics.simulate:
+            with self._phase("simulate"):
+                simulation = await self.algod.simulate(signed)
+            self.metrics.record_simulation(simulation)
+        with self._phase("submit"):
+            await self.algod.send(signed)
+        # The group is confirmed as a whole
+        call = signed[len(signed) - 1 - len(then or [])]
+        with self._phase("confirm"):
+            return await self.algod.confirm(call.get_txid())
+
+    # ---------------------------- Borrower ----------------------------
+    async def opt_app_in_nft(self, nft: int) -> dict[str, Any]:
+        return await self.call("opt_app_in_nft", [nft], fee=2)
+
+    async def request_loan(
+        self, nft: int, token: int, amount: int, duration: int, interest: int
+    ) -> dict[str, Any]:
+        axfer = await self._axfer(self.app_addr, nft, 1)
+        return await self.call(
+            "request_loan", [token, amount, duration, interest, axfer]
+        )
+
+    async def list_loan(
+        self, nft: int, token: int, amount: int, duration: int, interest: int
+    ) -> dict[str, Any]:
+        """opt_app_in_nft and request_loan in a single call."""
+        axfer = await self._axfer(self.app_addr, nft, 1)
+        return await self.call(
+            "list_loan", [nft, token, amount, duration, interest], fee=2, then=[axfer]
+        )
+
+    async def delete_request(self, nft: int) -> dict[str, Any]:
+        return await self.call("delete_request", fee=2, foreign_assets=[nft])
+
+    async def repay_loan(
+        self, nft: int, token: int, lender: str, later: int = REPAY_WITHIN
+    ) -> dict[str, Any]:
+        """Repay what the loan will be owed `later` seconds from now, by when
+        the repayment must be confirmed."""
+        loan = await self._axfer(lender, token, await self.quote(later))
+        return await self.call("repay_loan", [loan], fee=2, foreign_assets=[nft])
+
+    # ---------------------------- Read-only ----------------------------
+    async def quote(self, later: int = 0) -> int:
+        """What repay_loan takes `later` seconds after the latest block. The
+        call is simulated, not sent."""
+        atc = AtomicTransactionComposer()
+        atc.add_method_call(
+            app_id=self.app_id,
+            method=self.contract.get_method_by_name("quote"),
+            sender=self.account.address,
+            sp=await self._params(1),
+            signer=self.account.signer,
+            method_args=[later],
+        )
+        simulation = await self.algod.simulate(list(atc.gather_signatures()))
+        group = simulation["txn-groups"][0]
+        if "failure-message" in group:
+            raise AlgodHTTPError(group["failure-message"])
+        # The last log is the uint64 returned, after a 4 byte prefix
+        log = base64.b64decode(group["txn-results"][0]["txn-result"]["logs"][-1])
+        return int.from_bytes(log[4:], "big")
+
+    # ---------------------------- Lender ----------------------------
+    async def accept_loan(
+        self, token: int, amount: int, borrower: str
+    ) -> dict[str, Any]:
+        loan = await self._axfer(borrower, token, amount)
+        return await self.call("accept_loan", [loan])
+
+    async def liquidate_loan(self, nft: int) -> dict[str, Any]:
+        return await self.call("liquidate_loan", fee=2, foreign_assets=[nft])
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""Opcode cost, budget headroom, program size and minimum fee of every
+NFTasCollateral method, measured with algod's simulate endpoint.
+
+    poetry run python benchmark.py           # compare against benchmark.json
+    poetry run python benchmark.py --update  # rewrite benchmark.json
+    poetry run python benchmark.py --compare-optimized
+
+The profile is of the approval program as built to `artifacts`;
+`--compare-optimized` also profiles a build through optimize.py and prints
+both side by side.
+"""
+
+import argparse
+import base64
+import json
+import sys
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from algokit_utils import ApplicationSpecification
+from algosdk import transaction
+from algosdk.atomic_transaction_composer import (
+    AtomicTransactionComposer,
+    TransactionWithSigner,
+)
+from algosdk.encoding import decode_address
+from algosdk.logic import get_application_address
+from algosdk.v2client.algod import AlgodClient
+from algosdk.v2client.models import SimulateRequest
+from beaker import client, sandbox
+from beaker.localnet import LocalAccount
+
+import build
+from app import MAX_BUNDLE, REFUND_MBR
+
+BASELINE = Path(__file__).parent / "benchmark.json"
+APP_CALL_BUDGET = 700
+
+
+@dataclass
+class MethodProfile:
+    opcode_cost: int
+    budget: int
+    headroom: int
+    inner_txns: int
+    min_fee: int
+
+
+@dataclass
+class Profile:
+    approval_size: int
+    clear_size: int
+    methods: dict[str, MethodProfile]
+
+
+def program_size(algod: AlgodClient, source: str) -> int:
+    return len(base64.b64decode(algod.compile(source)["result"]))
+
+
+def measure(
+    algod: AlgodClient, atc: AtomicTransactionComposer, min_fee: int
+) -> MethodProfile:
+    """Simulate the group, then submit it so the next step sees its effects."""
+    result = atc.simulate(algod, SimulateRequest(txn_groups=[]))
+    if result.failure_message:
+        raise RuntimeError(result.failure_message)
+    group = result.simulate_response["txn-groups"][0]
+    app_calls = [
+        txn
+        for txn in group["txn-results"]
+        if txn["txn-result"]["txn"]["txn"]["type"] == "appl"
+    ]
+    cost = sum(txn.get("app-budget-consumed", 0) for txn in app_calls)
+    budget = group.get("app-budget-added", APP_CALL_BUDGET * len(app_calls))
+    inner_txns = sum(len(txn["txn-result"].get("inner-txns", [])) for txn in app_calls)
+    atc.execute(algod, 0)
+    return MethodProfile(
+        opcode_cost=cost,
+        budget=budget,
+        headroom=budget - cost,
+        inner_txns=inner_txns,
+        min_fee=min_fee * (len(app_calls) + inner_txns),
+    )
+
+
+def profile(
+    algod: AlgodClient,
+    accounts: Sequence[LocalAccount],
+    app_spec: ApplicationSpecification | None = None,
+) -> Profile:
+    """Run every method once through a full loan lifecycle and profile each call.
+
+    The calls that move a bundle of NFTs are profiled again with a bundle of
+    `MAX_BUNDLE`, as e.g. `request_loan[bundle]`."""
+    creator, borrower, lender = accounts[:3]
+    app_spec = app_spec or build.load("app")
+    app_client = client.ApplicationClient(
+        app=app_spec, client=algod, signer=creator.signer
+    )
+    min_fee = app_client.get_suggested_params().min_fee
+
+    def params() -> transaction.SuggestedParams:
+        # Generous flat fee so that simulate never fails on fees, the minimum is
+        # derived from the number of inner transactions instead
+        sp = app_client.get_suggested_params()
+        sp.flat_fee = True
+        sp.fee = min_fee * (MAX_BUNDLE + 1)
+        return sp
+
+    def submit(*txns: TransactionWithSigner) -> list[str]:
+        atc = AtomicTransactionComposer()
+        for txn in txns:
+            atc.add_transaction(txn)
+        return atc.execute(algod, 3).tx_ids
+
+    def create_asset(sender: LocalAccount, total: int, name: str) -> int:
+        (tx_id,) = submit(
+            TransactionWithSigner(
+                txn=transaction.AssetCreateTxn(
+                    sender=sender.address,
+                    total=total,
+                    decimals=0,
+                    default_frozen=False,
+                    unit_name=name,
+                    asset_name=f"Beaker {name}",
+                    sp=params(),
+                ),
+                signer=sender.signer,
+            )
+        )
+        info = algod.pending_transaction_info(tx_id)
+        assert isinstance(info, dict)
+        return info["asset-index"]
+
+    def axfer(
+        sender: LocalAccount, receiver: str, asset: int, amount: int
+    ) -> TransactionWithSigner:
+        return TransactionWithSigner(
+            txn=transaction.AssetTransferTxn(
+                sender=sender.address,
+                sp=params(),
+                receiver=receiver,
+                amt=amount,
+                index=asset,
+            ),
+            signer=sender.signer,
+        )
+
+    methods: dict[str, MethodProfile] = {}
+
+    def run(
+        method: str,
+        signer: LocalAccount,
+        then: TransactionWithSigner | None = None,
+        before: Sequence[TransactionWithSigner] = (),
+        variant: str | None = None,
+        **kwargs: Any,
+    ) -> None:
+        atc = AtomicTransactionComposer()
+        for txn in before:
+            atc.add_transaction(txn)
+        app_client.add_method_call(
+            atc,
+            method,
+            signer=signer.signer,
+            suggested_params=params(),
+            **kwargs,
+        )
+        if then is not None:
+            atc.add_transaction(then)
+        methods[f"{method}[{variant}]" if variant else method] = measure(
+            algod, atc, min_fee
+        )
+
+    def request_loan(nft: int) -> None:
+        run("opt_app_in_nft", borrower, nft=nft)
+        run(
+            "request_loan",
+            borrower,
+            token=token,
+            amount=5,
+            duration=100,
+            interest=1,
+            axfer=axfer(borrower, app_addr, nft, 1),
+        )
+
+    app_client.create()
+    # Covers a bundle, and later the NFT and, during an auction, the token
+    # held by the app
+    app_client.fund(100_000 * (MAX_BUNDLE + 1))
+    app_addr = get_application_address(app_client.app_id)
+    token = create_asset(lender, 20, "TOKEN")
+    submit(axfer(borrower, borrower.address, token, 0))
+
+    # A bundle is pledged, requested and closed three times: deleted, repaid
+    # and then liquidated
+    bundle = [create_asset(borrower, 1, "NFT") for _ in range(MAX_BUNDLE)]
+    submit(*(axfer(lender, lender.address, item, 0) for item in bundle))
+    for close in ("delete_request", "repay_loan", "liquidate_loan"):
+        run("opt_app_in_bundle", borrower, nfts=bundle, foreign_assets=bundle)
+        run(
+            "request_loan",
+            borrower,
+            before=[axfer(borrower, app_addr, item, 1) for item in bundle[1:]],
+            variant="bundle",
+            token=token,
+            amount=5,
+            duration=100,
+            interest=1,
+            axfer=axfer(borrower, app_addr, bundle[0], 1),
+        )
+        if close == "delete_request":
+            run(close, borrower, variant="bundle", foreign_assets=bundle)
+            continue
+        run("accept_loan", lender, loan=axfer(lender, borrower.address, token, 5))
+        if close == "repay_loan":
+            run(
+                close,
+                borrower,
+                variant="bundle",
+                loan=axfer(borrower, lender.address, token, 5),
+                foreign_assets=bundle,
+            )
+        else:
+            run(close, lender, variant="bundle", foreign_assets=bundle)
+
+    # The first loan is extended, refinanced and repaid, the second one is
+    # deleted, listed again and then liquidated
+    for liquidate in (False, True):
+        nft = create_asset(borrower, 1, "NFT")
+        submit(axfer(lender, lender.address, nft, 0))
+        request_loan(nft)
+        if liquidate:
+            run("delete_request", borrower, foreign_assets=[nft])
+            run(
+                "list_loan",
+                borrower,
+                then=axfer(borrower, app_addr, nft, 1),
+                nft=nft,
+                token=token,
+                amount=5,
+                duration=100,
+                interest=1,
+            )
+        run("accept_loan", lender, loan=axfer(lender, borrower.address, token, 5))
+        if not liquidate:
+            # The read-only calls, on a loan that is running
+            run("quote", borrower, later=100)
+            run("loan_status", borrower)
+            run("view", borrower)
+        if liquidate:
+            run("liquidate_loan", lender, foreign_assets=[nft])
+        else:
+            # Rolled over and refinanced in place, the lender paying itself off
+            run(
+                "extend_loan",
+                lender,
+                duration=100,
+                payment=axfer(borrower, lender.address, token, 0),
+            )
+            run(
+                "refinance_loan",
+                borrower,
+                duration=100,
+                interest=1,
+                payoff=axfer(lender, lender.address, token, 5),
+            )
+            run(
+                "repay_loan",
+                borrower,
+                loan=axfer(borrower, lender.address, token, 5),
+                foreign_assets=[nft],
+            )
+
+    # A third loan is auctioned: the lender outbids itself, so that place_bid
+    # is measured with the refund it owes, then bidding closes 100 seconds
+    # later and the lender claims the refund back
+    nft = create_asset(borrower, 1, "NFT")
+    submit(axfer(lender, lender.address, nft, 0))
+    request_loan(nft)
+    run("start_auction", borrower, window=100, foreign_assets=[token])
+    refund_box = (0, decode_address(lender.address) + token.to_bytes(8, "big"))
+    for rate in (1, 0):
+        run(
+            "place_bid",
+            lender,
+            interest=rate,
+            loan=axfer(lender, app_addr, token, 5),
+            pay=TransactionWithSigner(
+                txn=transaction.PaymentTxn(
+                    lender.address, params(), app_addr, REFUND_MBR
+                ),
+                signer=lender.signer,
+            ),
+            boxes=[refund_box],
+            foreign_assets=[token],
+        )
+    algod.set_timestamp_offset(100)
+    submit(axfer(lender, lender.address, token, 0))
+    algod.set_timestamp_offset(0)
+    run(
+        "settle_auction",
+        lender,
+        accounts=[borrower.address],
+        foreign_assets=[token],
+    )
+    run("claim_refund", lender, token=token, boxes=[refund_box])
+
+    return Profile(
+        approval_size=program_size(algod, app_spec.approval_program),
+        clear_size=program_size(algod, app_spec.clear_program),
+        methods=dict(sorted(methods.items())),
+    )
+
+
+def load_baseline(path: Path = BASELINE) -> Profile:
+    data = json.loads(path.read_text())
+    return Profile(
+        approval_size=data["approval_size"],
+        clear_size=data["clear_size"],
+        methods={
+            name: MethodProfile(**method) for name, method in data["methods"].items()
+        },
+    )
+
+
+def save_baseline(result: Profile, path: Path = BASELINE) -> None:
+    path.write_text(json.dumps(asdict(result), indent=2) + "\n")
+
+
+def regressions(
+    current: Profile,
+    baseline: Profile,
+    app_spec: ApplicationSpecification | None = None,
+) -> list[str]:
+    """Everything that got more expensive than the baseline, and every method
+    of `app_spec` left out of the profile; improvements pass."""
+    app_spec = app_spec or build.load("app")
+    profiled = {name.partition("[")[0] for name in current.methods}
+    found = [
+        f"{method.name}: not profiled"
+        for method in app_spec.contract.methods
+        if method.name not in profiled
+    ]
+    found += [
+        f"{name}: {getattr(current, name)} > {getattr(baseline, name)}"
+        for name in ("approval_size", "clear_size")
+        if getattr(current, name) > getattr(baseline, name)
+    ]
+    for method, now in current.methods.items():
+        before = baseline.methods.get(method)
+        if before is None:
+            found.append(f"{method}: missing from the baseline")
+            continue
+        found += [
+            f"{method}.{name}: {getattr(now, name)} > {getattr(before, name)}"
+            for name in ("opcode_cost", "inner_txns", "min_fee")
+            if getattr(now, name) > getattr(before, name)
+        ]
+    return found
+
+
+def report(result: Profile) -> str:
+    lines = [
+        f"approval program: {result.approval_size} bytes, "
+        f"clear program: {result.clear_size} bytes",
+        f"{'method':<24}{'cost':>6}{'budget':>8}{'headroom':>10}"
+        f"{'inner':>7}{'min fee':>9}",
+    ]
+    lines += [
+        f"{name:<24}{m.opcode_cost:>6}{m.budget:>8}{m.headroom:>10}"
+        f"{m.inner_txns:>7}{m.min_fee:>9}"
+        for name, m in result.methods.items()
+    ]
+    return "\n".join(lines)
+
+
+def compare(before: Profile, after: Profile) -> str:
+    lines = [
+        f"approval program: {before.approval_size} -> {after.approval_size} bytes",
+        f"{'method':<24}{'before':>8}{'after':>7}{'saved':>7}",
+    ]
+    lines += [
+        f"{name:<24}{m.opcode_cost:>8}{after.methods[name].opcode_cost:>7}"
+        f"{m.opcode_cost - after.methods[name].opcode_cost:>7}"
+        for name, m in before.methods.items()
+    ]
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--update", action="store_true", help="write the results as the new baseline"
+    )
+    parser.add_argument(
+        "--compare-optimized",
+        action="store_true",
+        help="print the cost of a build through optimize.py next to it",
+    )
+    args = parser.parse_args()
+
+    algod = sandbox.get_algod_client()
+    if args.compare_optimized:
+        accounts = sandbox.get_accounts()
+        optimized = build.load("app", {"optimize": "1"})
+        print(compare(profile(algod, accounts), profile(algod, accounts, optimized)))
+        return 0
+    result = profile(algod, sandbox.get_accounts())
+    print(report(result))
+    if args.update:
+        save_baseline(result)
+        return 0
+    found = regressions(result, load_baseline())
+    for line in found:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""Content-hash cached builds of the contracts' artifacts.
+
+An artifact directory records the fingerprint it was built from in
+`build.json`: the sources of the contract module and of every local module
+it imports, the beaker and pyteal versions, the optimizer if the build uses
+it and the build options. A build whose fingerprint matches is skipped.
+
+Apps are exported by a fresh interpreter, which gets the build options as
+`BUILD_<NAME>` environment variables (see build_options.py). A build with
+options goes next to the target's default artifacts, in a directory named
+after them. With `--option optimize=1` the exported approval program then goes
+through optimize.py.
+
+    poetry run python build.py            # build every stale target
+    poetry run python build.py --force app
+    poetry run python build.py --option expiry_check=1 loan_book
+    poetry run python build.py --matrix expiry_check=0,1 --matrix optimize=0,1
+
+`--matrix` builds every combination of the values given, each variant to its
+own directory, in a pool of worker processes. A worker imports pyteal and
+beaker once and then exports each variant it gets in-process, importing the
+contract modules afresh with that variant's options.
+"""
+
+import argparse
+import ast
+import fcntl
+import hashlib
+import importlib
+import itertools
+import json
+import os
+import subprocess
+import sys
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+from pathlib import Path
+
+from algokit_utils import ApplicationSpecification
+
+import optimize
+
+ROOT = Path(__file__).parent
+TARGETS = {
+    "app": ROOT / "artifacts",
+    "loan_book": ROOT / "artifacts" / "loan_book",
+    "packed_app": ROOT / "artifacts" / "packed_app",
+}
+STAMP = "build.json"
+LOCK = ".build.lock"
+EXPORT = "import {module}; {module}.app.build().export({out_dir!r})"
+
+
+def local_sources(module: str, root: Path = ROOT) -> dict[str, str]:
+    """The module and every module it imports from `root`, transitively."""
+    found: dict[str, str] = {}
+    pending = [module]
+    while pending:
+        name = pending.pop()
+        path = root / f"{name}.py"
+        if name in found or not path.exists():
+            continue
+        source = path.read_text()
+        found[name] = source
+        pending += _imports(ast.parse(source))
+    return dict(sorted(found.items()))
+
+
+def _imports(node: ast.AST) -> list[str]:
+    # The `if __name__ == "__main__":` block does not go into the build
+    if isinstance(node, ast.If) and "__name__" in ast.unparse(node.test):
+        return []
+    if isinstance(node, ast.Import):
+        return [alias.name for alias in node.names]
+    if isinstance(node, ast.ImportFrom):
+        return [node.module] if node.module and not node.level else []
+    return [name for child in ast.iter_child_nodes(node) for name in _imports(child)]
+
+
+def _optimized(options: Mapping[str, str] | None) -> bool:
+    return (options or {}).get("optimize") == "1"
+
+
+def fingerprint(
+    module: str, options: Mapping[str, str] | None = None, root: Path = ROOT
+) -> dict[str, object]:
+    return {
+        "sources": {
+            name: hashlib.sha256(source.encode()).hexdigest()
+            for name, source in local_sources(module, root).items()
+        },
+        "beaker": version("beaker-pyteal"),
+        "pyteal": version("pyteal"),
+        "optimizer": (
+            hashlib.sha256(Path(optimize.__file__).read_bytes()).hexdigest()
+            if _optimized(options)
+            else None
+        ),
+        "options": dict(sorted((options or {}).items())),
+    }
+
+
+def target_dir(module: str, options: Mapping[str, str] | None = None) -> Path:
+    if not options:
+        return TARGETS[module]
+    variant = ",".join(f"{name}={value}" for name, value in sorted(options.items()))
+    return TARGETS[module] / variant
+
+
+def is_stale(
+    module: str,
+    out_dir: Path | None = None,
+    options: Mapping[str, str] | None = None,
+    root: Path = ROOT,
+) -> bool:
+    stamp = (out_dir or target_dir(module, options)) / STAMP
+    if not stamp.exists():
+        return True
+    try:
+        recorded = json.loads(stamp.read_text())
+    except ValueError:
+        return True
+    return recorded != fingerprint(module, options, root)
+
+
+def _environ(options: Mapping[str, str] | None) -> dict[str, str]:
+    env = {
+        name: value
+        for name, value in os.environ.items()
+        if not name.startswith("BUILD_")
+    }
+    return env | {
+        f"BUILD_{name.upper()}": value for name, value in (options or {}).items()
+    }
+
+
+def export(
+    module: str,
+    out_dir: Path,
+    options: Mapping[str, str] | None = None,
+    root: Path = ROOT,
+) -> None:
+    """Export `module.app` from this interpreter.
+
+    The contract module and the local modules it imports are imported again
+    with `options` in the environment, so that nothing of a previous
+    variant's build is reused."""
+    saved = dict(os.environ)
+    os.environ.clear()
+    os.environ.update(_environ(options))
+    if str(root) not in sys.path:
+        sys.path.insert(0, str(root))
+    try:
+        for name in local_sources(module, root):
+            sys.modules.pop(name, None)
+        importlib.import_module(module).app.build().export(str(out_dir))
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def build(
+    module: str,
+    out_dir: Path | None = None,
+    options: Mapping[str, str] | None = None,
+    *,
+    force: bool = False,
+    root: Path = ROOT,
+    in_process: bool = False,
+) -> bool:
+    """Export `module.app` to `out_dir` unless it is up to date.
+
+    The app is exported by a fresh interpreter, or by this one with
+    `in_process`. Returns whether the app was built."""
+    out_dir = out_dir or target_dir(module, options)
+    if not force and not is_stale(module, out_dir, options, root):
+        return False
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with (out_dir / LOCK).open("w") as lock:
+        # Parallel test workers may find a target stale at the same time: one
+        # builds it while the others wait, then find it up to date
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not force and not is_stale(module, out_dir, options, root):
+            return False
+        if in_process:
+            export(module, out_dir, options, root)
+        else:
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    EXPORT.format(module=module, out_dir=str(out_dir)),
+                ],
+                cwd=root,
+                env=_environ(options),
+                check=True,
+            )
+        if _optimized(options):
+            optimize.optimize_artifacts(out_dir)
+        stamp = fingerprint(module, options, root)
+        (out_dir / STAMP).write_text(json.dumps(stamp, indent=2) + "\n")
+    return True
+
+
+def load(
+    module: str, options: Mapping[str, str] | None = None
+) -> ApplicationSpecification:
+    """The app spec of a target, rebuilt first if its artifacts are stale."""
+    build(module, options=options)
+    return ApplicationSpecification.from_json(
+        (target_dir(module, options) / "application.json").read_text()
+    )
+
+
+def variants(axes: Mapping[str, Iterable[str]]) -> list[dict[str, str]]:
+    """Every combination of one value of each option."""
+    names = sorted(axes)
+    return [
+        dict(zip(names, values, strict=True))
+        for values in itertools.product(*(list(axes[name]) for name in names))
+    ]
+
+
+def _warm_up() -> None:
+    # Paid once per worker, not once per variant
+    importlib.import_module("pyteal")
+    importlib.import_module("beaker")
+
+
+def _build_variant(
+    module: str, options: dict[str, str], root: Path, *, force: bool
+) -> bool:
+    return build(module, options=options, force=force, root=root, in_process=True)
+
+
+def build_matrix(
+    modules: Iterable[str],
+    axes: Mapping[str, Iterable[str]],
+    options: Mapping[str, str] | None = None,
+    *,
+    force: bool = False,
+    workers: int | None = None,
+    root: Path = ROOT,
+) -> dict[tuple[str, Path], bool]:
+    """Build every variant of `modules` in parallel, `options` applying to all.
+
+    Returns whether each (module, artifact directory) was built; fresh
+    variants are not handed to a worker at all."""
+    jobs = [
+        (module, {**(options or {}), **variant})
+        for module in modules
+        for variant in variants(axes)
+    ]
+    built = {
+        (module, target_dir(module, opts)): False
+        for module, opts in jobs
+        if not force and not is_stale(module, options=opts, root=root)
+    }
+    stale = [
+        (module, opts)
+        for module, opts in jobs
+        if (module, target_dir(module, opts)) not in built
+    ]
+    if not stale:
+        return built
+    with ProcessPoolExecutor(
+        max_workers=min(workers or os.cpu_count() or 1, len(stale)),
+        initializer=_warm_up,
+    ) as pool:
+        futures = {
+            (module, target_dir(module, opts)): pool.submit(
+                _build_variant, module, opts, root, force=force
+            )
+            for module, opts in stale
+        }
+        built |= {key: future.result() for key, future in futures.items()}
+    return built
+
+
+def parse_option(text: str) -> tuple[str, str]:
+    name, sep, value = text.partition("=")
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text!r}")
+    return name, value
+
+
+def parse_axis(text: str) -> tuple[str, list[str]]:
+    name, value = parse_option(text)
+    return name, value.split(",")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("targets", nargs="*", help=f"any of {', '.join(TARGETS)}")
+    parser.add_argument("--force", action="store_true", help="rebuild even if fresh")
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        type=parse_option,
+        metavar="NAME=VALUE",
+        help="build option, e.g. expiry_check=1",
+    )
+    parser.add_argument(
+        "--matrix",
+        action="append",
+        default=[],
+        type=parse_axis,
+        metavar="NAME=VALUE,...",
+        help="build a variant for each value, e.g. expiry_check=0,1",
+    )
+    parser.add_argument("--workers", type=int, help="worker processes of --matrix")
+    args = parser.parse_args()
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+    options = dict(args.option)
+    if args.matrix:
+        results = build_matrix(
+            args.targets or TARGETS,
+            dict(args.matrix),
+            options,
+            force=args.force,
+            workers=args.workers,
+        )
+        for (module, out_dir), built in results.items():
+            print(f"{module}: {'built' if built else 'up to date'} ({out_dir})")
+        return 0
+    for module in args.targets or TARGETS:
+        built = build(module, options=options, force=args.force)
+        out_dir = target_dir(module, options)
+        print(f"{module}: {'built' if built else 'up to date'} ({out_dir})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+"""Build options of the contracts.
+
+`build.py` hands a build's options to the contract modules as `BUILD_<NAME>`
+environment variables of the interpreter that exports them:
+
+    poetry run python build.py --option expiry_check=1 loan_book
+"""
+
+import os
+
+from pyteal import Assert, Expr, Global, Seq
+
+
+def enabled(name: str) -> bool:
+    return os.environ.get(f"BUILD_{name.upper()}", "") not in ("", "0")
+
+
+def expiry_check(deadline: Expr) -> Expr:
+    # Off by default so that the tests can liquidate a loan straight away
+    if not enabled("expiry_check"):
+        return Seq()
+    return Assert(Global.latest_timestamp() > deadline)
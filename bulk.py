@@ -0,0 +1,108 @@
+"""Funding many listed loans in one atomic group, so that they are all
+accepted together or not at all.
+
+With app.py every loan is its own app, so the group pairs each token transfer
+with that app's `accept_loan` call. With loan_book.py the token transfers are
+followed by a single `accept_loans` call.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from algokit_utils import ApplicationSpecification
+from algosdk import transaction
+from algosdk.atomic_transaction_composer import (
+    AtomicTransactionComposer,
+    TransactionWithSigner,
+)
+from algosdk.v2client.algod import AlgodClient
+from beaker.localnet import LocalAccount
+
+# A token transfer and an app call per loan in a group of at most 16
+MAX_LOANS = 8
+# One box reference per loan on the single accept_loans call
+MAX_BOOK_LOANS = 8
+
+
+@dataclass(frozen=True)
+class Listing:
+    """The terms of a requested loan, as the lender agrees to them."""
+
+    app_id: int
+    nft: int
+    token: int
+    amount: int
+    borrower: str
+
+
+def _transfer(
+    sp: transaction.SuggestedParams, lender: LocalAccount, listing: Listing
+) -> TransactionWithSigner:
+    return TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=lender.address,
+            sp=sp,
+            receiver=listing.borrower,
+            amt=listing.amount,
+            index=listing.token,
+            # Transfers of the same terms in one group would share a txid
+            note=f"loan {listing.app_id}/{listing.nft}".encode(),
+        ),
+        signer=lender.signer,
+    )
+
+
+def _check_size(listings: Sequence[Listing], limit: int) -> None:
+    if not 0 < len(listings) <= limit:
+        raise ValueError(f"can accept 1 to {limit} loans at once, not {len(listings)}")
+
+
+def accept_loans(
+    algod: AlgodClient,
+    app_spec: ApplicationSpecification,
+    lender: LocalAccount,
+    listings: Sequence[Listing],
+) -> list[str]:
+    """Accept loans on up to `MAX_LOANS` NFTasCollateral apps at once."""
+    _check_size(listings, MAX_LOANS)
+    sp = algod.suggested_params()
+    method = app_spec.contract.get_method_by_name("accept_loan")
+    atc = AtomicTransactionComposer()
+    for listing in listings:
+        atc.add_method_call(
+            app_id=listing.app_id,
+            method=method,
+            sender=lender.address,
+            sp=sp,
+            signer=lender.signer,
+            method_args=[_transfer(sp, lender, listing)],
+        )
+    return atc.execute(algod, 3).tx_ids
+
+
+def accept_book_loans(
+    algod: AlgodClient,
+    app_spec: ApplicationSpecification,
+    lender: LocalAccount,
+    listings: Sequence[Listing],
+) -> list[str]:
+    """Accept up to `MAX_BOOK_LOANS` loans of one loan book at once."""
+    _check_size(listings, MAX_BOOK_LOANS)
+    app_ids = {listing.app_id for listing in listings}
+    if len(app_ids) != 1:
+        raise ValueError("the listings must all be on the same loan book")
+    (app_id,) = app_ids
+    sp = algod.suggested_params()
+    atc = AtomicTransactionComposer()
+    for listing in listings:
+        atc.add_transaction(_transfer(sp, lender, listing))
+    atc.add_method_call(
+        app_id=app_id,
+        method=app_spec.contract.get_method_by_name("accept_loans"),
+        sender=lender.address,
+        sp=sp,
+        signer=lender.signer,
+        method_args=[[listing.nft for listing in listings]],
+        boxes=[(0, listing.nft.to_bytes(8, "big")) for listing in listings],
+    )
+    return atc.execute(algod, 3).tx_ids
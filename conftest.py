@@ -0,0 +1,150 @@
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from algokit_utils import ApplicationSpecification
+from algosdk.v2client.algod import AlgodClient
+from beaker import sandbox
+from beaker.localnet import LocalAccount
+
+import build
+import simulator
+from world import World, build_world, provision
+
+BACKENDS = ("localnet", "sim")
+
+
+class SimSession:
+    """One simulator for the whole session, rewound before every test.
+
+    Worlds are built once per app and options, then restored from a ledger
+    snapshot instead of being set up again, and so are the lifecycle stages
+    played on them."""
+
+    def __init__(self) -> None:
+        self.algod = simulator.SimAlgodClient()
+        self.accounts = simulator.get_accounts(self.algod)
+        self.genesis = self.algod.ledger.snapshot()
+        self.worlds: dict[str, tuple[World, simulator.State]] = {}
+        # (state a stage started from, stage) -> state it ended in
+        self.stages: dict[tuple[simulator.State, str], simulator.State] = {}
+
+    def world(self, app_spec: ApplicationSpecification, **options: Any) -> World:
+        key = repr((app_spec.to_json(), sorted(options.items())))
+        if key not in self.worlds:
+            self.algod.ledger.restore(self.genesis)
+            world = build_world(self.algod, self.accounts, app_spec, **options)
+            self.worlds[key] = (world, self.algod.ledger.snapshot())
+        world, snapshot = self.worlds[key]
+        self.algod.ledger.restore(snapshot)
+        return world
+
+    def stage(self, name: str, setup: Callable[[], object]) -> None:
+        """Play `setup` from the current state, the first time only.
+
+        Committed states are never written to again, so each later test that
+        reaches the same state restores where `setup` left it and branches
+        off from there, copying only what it changes."""
+        key = (self.algod.ledger.snapshot(), name)
+        if key not in self.stages:
+            setup()
+            self.stages[key] = self.algod.ledger.snapshot()
+        self.algod.ledger.restore(self.stages[key])
+
+
+def pytest_sessionstart(session: pytest.Session) -> None:
+    # Rebuild any artifacts that no longer match their contract's sources,
+    # once, before any pytest-xdist worker starts
+    if hasattr(session.config, "workerinput"):
+        return
+    reporter = session.config.pluginmanager.get_plugin("terminalreporter")
+    for module in build.TARGETS:
+        if build.build(module) and reporter is not None:
+            reporter.write_line(f"rebuilt stale artifacts of {module}")
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--backend",
+        choices=BACKENDS,
+        default="localnet",
+        help="run against a localnet algod or the in-process simulator",
+    )
+
+
+@pytest.fixture(scope="session")
+def backend(request: pytest.FixtureRequest) -> str:
+    return request.config.getoption("--backend")
+
+
+@pytest.fixture(scope="session")
+def sim(backend: str) -> SimSession | None:
+    return SimSession() if backend == "sim" else None
+
+
+@pytest.fixture(scope="function")
+def algod(sim: SimSession | None) -> AlgodClient:
+    # The session's simulator rewound to genesis, the same localnet otherwise
+    if sim is None:
+        return sandbox.get_algod_client()
+    sim.algod.ledger.restore(sim.genesis)
+    return sim.algod
+
+
+@pytest.fixture(scope="session")
+def pool(sim: SimSession | None) -> list[LocalAccount]:
+    """This process's own creator, borrower and lender.
+
+    On localnet they are fresh accounts funded by its dispenser, so that
+    pytest-xdist workers (`pytest -n auto`) never share an account, nor the
+    assets and apps the tests make with them. Each worker has its own
+    simulator already."""
+    if sim is not None:
+        return sim.accounts
+    return provision(sandbox.get_algod_client(), sandbox.get_accounts()[0])
+
+
+@pytest.fixture(scope="function")
+def accounts(pool: list[LocalAccount]) -> list[LocalAccount]:
+    return list(pool)
+
+
+@pytest.fixture(scope="function")
+def make_world(
+    sim: SimSession | None, algod: AlgodClient, accounts: list[LocalAccount]
+) -> Callable[..., World]:
+    """Set up a fresh `World` for `app_spec`, see `world.build_world`."""
+
+    def make(app_spec: ApplicationSpecification, **options: Any) -> World:
+        if sim is None:
+            return build_world(algod, accounts, app_spec, **options)
+        return sim.world(app_spec, **options)
+
+    return make
+
+
+@pytest.fixture(scope="function")
+def stage(sim: SimSession | None) -> Callable[[str, Callable[[], object]], None]:
+    """Play a lifecycle stage, `stage(name, setup)`, see `SimSession.stage`.
+
+    `setup` may only touch the ledger: anything else a fixture sets, such as
+    the loan terms, goes outside it. On localnet it is played every time."""
+
+    def play(name: str, setup: Callable[[], object]) -> None:
+        if sim is None:
+            setup()
+        else:
+            sim.stage(name, setup)
+
+    return play
+
+
+@pytest.fixture(scope="session")
+def app_spec() -> ApplicationSpecification:
+    # Built on first use rather than when a test module is collected
+    return build.load("app")
+
+
+@pytest.fixture(scope="session")
+def book_spec() -> ApplicationSpecification:
+    return build.load("loan_book")
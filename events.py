@@ -0,0 +1,164 @@
+"""ARC-28 events of the NFTasCollateral app, and a stream decoding them.
+
+An event is logged as the first 4 bytes of the SHA-512/256 hash of its
+signature, e.g. `LoanRepaid(uint64,uint64)`, followed by its ABI encoded
+arguments. `emit` logs one from the contract; `EventStream` reads them back
+from the blocks as they are made, so that following the loans takes one
+block request per round instead of polling every app's global state.
+"""
+
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any
+
+import msgpack
+from algosdk import abi, encoding
+from algosdk.v2client.algod import AlgodClient
+from pyteal import Bytes, Concat, Expr, Itob, Log
+
+# name: [(argument, ABI type)], every type static
+EVENTS: dict[str, list[tuple[str, str]]] = {
+    "NftOptedIn": [("nft", "uint64"), ("borrower", "address")],
+    "LoanRequested": [
+        ("nft", "uint64"),
+        ("token", "uint64"),
+        ("amount", "uint64"),
+        ("duration", "uint64"),
+        ("interest", "uint64"),
+    ],
+    "RequestDeleted": [("nft", "uint64")],
+    "LoanAccepted": [
+        ("nft", "uint64"),
+        ("lender", "address"),
+        ("interest", "uint64"),
+        ("start", "uint64"),
+    ],
+    "LoanExtended": [("nft", "uint64"), ("duration", "uint64"), ("start", "uint64")],
+    "LoanRefinanced": [
+        ("nft", "uint64"),
+        ("lender", "address"),
+        ("amount", "uint64"),
+        ("duration", "uint64"),
+        ("interest", "uint64"),
+    ],
+    "LoanRepaid": [("nft", "uint64"), ("paid", "uint64")],
+    "LoanLiquidated": [("nft", "uint64"), ("lender", "address")],
+}
+
+
+def signature(name: str) -> str:
+    return f"{name}({','.join(kind for _, kind in EVENTS[name])})"
+
+
+def selector(name: str) -> bytes:
+    return encoding.checksum(signature(name).encode())[:4]
+
+
+SELECTORS = {selector(name): name for name in EVENTS}
+CODECS = {
+    name: abi.ABIType.from_string(f"({','.join(kind for _, kind in args)})")
+    for name, args in EVENTS.items()
+}
+
+
+def emit(name: str, *values: Expr) -> Expr:
+    """Log event `name`; a uint64 is given as an int, an address as its bytes."""
+    kinds = [kind for _, kind in EVENTS[name]]
+    if len(values) != len(kinds):
+        raise ValueError(f"{name} takes {len(kinds)} values, not {len(values)}")
+    return Log(
+        Concat(
+            Bytes(selector(name)),
+            *(
+                Itob(value) if kind == "uint64" else value
+                for value, kind in zip(values, kinds, strict=True)
+            ),
+        )
+    )
+
+
+@dataclass(frozen=True)
+class Event:
+    name: str
+    args: dict[str, Any]
+    app_id: int
+    confirmed_round: int
+    # Position of the top-level transaction in its block
+    intra: int
+
+
+def unpack_block(block: bytes) -> dict[str, Any]:
+    """A msgpack block, with its map keys as str and every other string as bytes.
+
+    algod packs Go strings as msgpack str whatever their bytes, logs and
+    global state deltas included, so they can't be unpacked as UTF-8."""
+    return _decode_keys(msgpack.unpackb(block, raw=True, strict_map_key=False))
+
+
+def _decode_keys(value: Any) -> Any:  # noqa: ANN401
+    if isinstance(value, dict):
+        return {
+            # State keys can be any bytes too
+            (k.decode("utf-8", "surrogateescape") if isinstance(k, bytes) else k): (
+                _decode_keys(v)
+            )
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_decode_keys(v) for v in value]
+    return value
+
+
+def decode(log: bytes) -> tuple[str, dict[str, Any]] | None:
+    """The name and arguments of an event log, None for any other log."""
+    name = SELECTORS.get(log[:4])
+    if name is None:
+        return None
+    values = CODECS[name].decode(log[4:])
+    return name, dict(zip((arg for arg, _ in EVENTS[name]), values, strict=True))
+
+
+class EventStream:
+    """The events of `app_ids` in the blocks after `after`, in order."""
+
+    def __init__(self, algod: AlgodClient, app_ids: set[int], after: int = 0) -> None:
+        self.algod = algod
+        self.app_ids = app_ids
+        self.round = after
+
+    def poll(self) -> list[Event]:
+        """The events of every block made since the last poll."""
+        status = self.algod.status()
+        assert isinstance(status, dict)
+        events = []
+        for number in range(self.round + 1, status["last-round"] + 1):
+            events += self.block_events(number)
+        self.round = max(self.round, status["last-round"])
+        return events
+
+    def follow(self) -> Iterator[Event]:
+        """Every event as its block is made, waiting for the next one forever."""
+        while True:
+            yield from self.poll()
+            self.algod.status_after_block(self.round)
+
+    def block_events(self, number: int) -> list[Event]:
+        block = self.algod.block_info(round_num=number, response_format="msgpack")
+        assert isinstance(block, bytes)
+        decoded = unpack_block(block)
+        events = []
+        for intra, stxn in enumerate(decoded["block"].get("txns", [])):
+            app_id = stxn["txn"].get("apid") or stxn.get("apid", 0)
+            for found_in, log in self._logs(stxn, app_id):
+                if found_in in self.app_ids and (event := decode(log)) is not None:
+                    events.append(Event(*event, found_in, number, intra))
+        return events
+
+    def _logs(self, stxn: dict[str, Any], app_id: int) -> Iterator[tuple[int, bytes]]:
+        # Inner app calls log under their own app
+        delta = stxn.get("dt", {})
+        if stxn["txn"].get("type") == b"appl":
+            for log in delta.get("lg", []):
+                yield app_id, log
+        for inner in delta.get("itx", []):
+            yield from self._logs(inner, inner["txn"].get("apid", 0))
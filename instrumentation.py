@@ -0,0 +1,300 @@
+"""Client-side metrics and traces of NFTasCollateral method calls.
+
+A call goes through phases, each timed on its own:
+
+- `params`: fetching the suggested params;
+- `sign`: signing the group;
+- `simulate`: simulating it first, only with `Metrics(simulate=True)`, which
+  gives the opcode cost of the call at the price of one more request;
+- `submit`: sending it;
+- `confirm`: waiting for it to be confirmed;
+- `read`: reading state back, e.g. an app's global state or a box;
+
+and `total` is the whole call.
+
+`Metrics` keeps a latency histogram per method and phase, the fees paid, the
+opcode cost and the rejection reasons, and prints them in the Prometheus text
+format. Given an OpenTelemetry tracer, each call is also a span, with a child
+span per phase:
+
+    metrics = Metrics(tracer=trace.get_tracer("nft-loans"))
+
+async_client.LoanClient records its calls when given `metrics`. A blocking
+beaker `ApplicationClient` does through `instrument`, which routes every algod
+request to the phase it belongs to and times the signer:
+
+    app_client = instrument(app_client, metrics)
+    with metrics.call("repay_loan"):
+        result = app_client.call("repay_loan", ...)
+        metrics.record_confirmed(result.tx_info)
+"""
+
+import re
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Protocol
+
+from algosdk import transaction
+from algosdk.atomic_transaction_composer import TransactionSigner
+from algosdk.v2client.algod import AlgodClient
+from beaker import client
+
+# Prometheus' default buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Up to the budget of a group of 16 app calls
+COST_BUCKETS = (50, 100, 200, 350, 700, 1400, 2800, 5600, 11200)
+PREFIX = "nft_loan"
+
+
+class Tracer(Protocol):
+    # The part of opentelemetry.trace.Tracer used here
+    def start_as_current_span(
+        self, name: str, **kwargs: Any
+    ) -> AbstractContextManager[Any]: ...
+
+
+def reason(err: Exception) -> str:
+    """The part of an error that is the same for every call it happens to."""
+    message = str(err)
+    # A rejected app call's program trace differs from call to call
+    message = re.sub(r"\. Details: .*", "", message)
+    message = re.sub(r"\b[A-Z2-7]{52}\b", "<txid>", message)
+    message = re.sub(r"\b[A-Z2-7]{58}\b", "<address>", message)
+    message = re.sub(r"\d+", "<n>", message)
+    return message.splitlines()[0][:160] if message else type(err).__name__
+
+
+def opcode_cost(simulation: dict[str, Any]) -> int:
+    """The opcodes the app calls of a simulated group took."""
+    group = simulation["txn-groups"][0]
+    return sum(txn.get("app-budget-consumed", 0) for txn in group["txn-results"])
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...]
+    counts: list[int] = field(default_factory=list)
+    total: float = 0
+    count: int = 0
+
+    def observe(self, value: float) -> None:
+        if not self.counts:
+            self.counts = [0] * len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+@dataclass
+class Call:
+    method: str
+    # The open span of the call, if traced
+    span: Any = None
+
+
+_current: ContextVar[Call | None] = ContextVar("call", default=None)
+
+
+def _labels(**labels: str) -> str:
+    escaped = {
+        name: value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for name, value in labels.items()
+    }
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+class Metrics:
+    def __init__(self, tracer: Tracer | None = None, *, simulate: bool = False) -> None:
+        self.tracer = tracer
+        self.simulate = simulate
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.calls: Counter[tuple[str, str]] = Counter()
+        self.fees: Counter[str] = Counter()
+        self.cost: dict[str, Histogram] = {}
+        self.rejections: Counter[tuple[str, str]] = Counter()
+
+    def _span(self, name: str) -> AbstractContextManager[Any]:
+        if self.tracer is None:
+            return nullcontext()
+        return self.tracer.start_as_current_span(name)
+
+    @contextmanager
+    def call(self, method: str) -> Iterator[Call]:
+        """Record a call of `method`, and of its phases, until the block ends.
+
+        An exception leaving the block counts as a rejection."""
+        start = time.perf_counter()
+        with self._span(method) as span:
+            call = Call(method, span)
+            token = _current.set(call)
+            try:
+                yield call
+            except Exception as err:
+                why = reason(err)
+                self.calls[method, "rejected"] += 1
+                self.rejections[method, why] += 1
+                if span is not None:
+                    span.set_attribute("rejection", why)
+                raise
+            else:
+                self.calls[method, "ok"] += 1
+            finally:
+                _current.reset(token)
+                self._observe(method, "total", time.perf_counter() - start)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time phase `name` of the call in progress; outside of one, nothing."""
+        call = _current.get()
+        if call is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            with self._span(f"{call.method}.{name}"):
+                yield
+        finally:
+            self._observe(call.method, name, time.perf_counter() - start)
+
+    def _observe(self, method: str, phase: str, seconds: float) -> None:
+        self.latency.setdefault((method, phase), Histogram(LATENCY_BUCKETS)).observe(
+            seconds
+        )
+
+    def record_confirmed(self, info: dict[str, Any]) -> None:
+        """The fee of the confirmed app call, which pays for its inner ones."""
+        call = _current.get()
+        if call is None:
+            return
+        fee = info["txn"]["txn"].get("fee", 0)
+        self.fees[call.method] += fee
+        if call.span is not None:
+            call.span.set_attribute("fee", fee)
+
+    def record_simulation(self, simulation: dict[str, Any]) -> None:
+        call = _current.get()
+        if call is None:
+            return
+        cost = opcode_cost(simulation)
+        self.cost.setdefault(call.method, Histogram(COST_BUCKETS)).observe(cost)
+        if call.span is not None:
+            call.span.set_attribute("opcode_cost", cost)
+
+    def prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {PREFIX}_call_seconds Latency of each phase of a method call",
+            f"# TYPE {PREFIX}_call_seconds histogram",
+        ]
+        for (method, phase), histogram in sorted(self.latency.items()):
+            lines += _histogram(
+                f"{PREFIX}_call_seconds", histogram, method=method, phase=phase
+            )
+        lines += [
+            f"# HELP {PREFIX}_calls_total Method calls by outcome",
+            f"# TYPE {PREFIX}_calls_total counter",
+        ]
+        lines += [
+            f"{PREFIX}_calls_total{_labels(method=method, outcome=outcome)} {count}"
+            for (method, outcome), count in sorted(self.calls.items())
+        ]
+        lines += [
+            f"# HELP {PREFIX}_fees_microalgos_total Fees paid by the app calls",
+            f"# TYPE {PREFIX}_fees_microalgos_total counter",
+        ]
+        lines += [
+            f"{PREFIX}_fees_microalgos_total{_labels(method=method)} {fee}"
+            for method, fee in sorted(self.fees.items())
+        ]
+        lines += [
+            f"# HELP {PREFIX}_opcode_cost Opcodes a call took, when simulated",
+            f"# TYPE {PREFIX}_opcode_cost histogram",
+        ]
+        for method, histogram in sorted(self.cost.items()):
+            lines += _histogram(f"{PREFIX}_opcode_cost", histogram, method=method)
+        lines += [
+            f"# HELP {PREFIX}_rejections_total Rejected calls by reason",
+            f"# TYPE {PREFIX}_rejections_total counter",
+        ]
+        lines += [
+            f"{PREFIX}_rejections_total{_labels(method=method, reason=why)} {count}"
+            for (method, why), count in sorted(self.rejections.items())
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _histogram(name: str, histogram: Histogram, **labels: str) -> list[str]:
+    lines = [
+        f"{name}_bucket{_labels(**labels, le=str(bound))} {count}"
+        for bound, count in zip(histogram.buckets, histogram.counts, strict=True)
+    ]
+    return [
+        *lines,
+        f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}",
+        f"{name}_sum{_labels(**labels)} {histogram.total}",
+        f"{name}_count{_labels(**labels)} {histogram.count}",
+    ]
+
+
+def phase_of(method: str, path: str) -> str:
+    """The phase an algod request of a call belongs to."""
+    path = path.partition("?")[0]
+    if path == "/transactions/params":
+        return "params"
+    if path == "/transactions/simulate":
+        return "simulate"
+    if path == "/transactions" and method == "POST":
+        return "submit"
+    if path.startswith(("/transactions/pending/", "/status")):
+        return "confirm"
+    return "read"
+
+
+class InstrumentedAlgod(AlgodClient):
+    """Times every request of `algod` as a phase of the call in progress."""
+
+    def __init__(self, algod: AlgodClient, metrics: Metrics) -> None:
+        super().__init__(algod.algod_token, algod.algod_address, algod.headers)
+        self.algod = algod
+        self.metrics = metrics
+
+    def algod_request(
+        self, method: str, requrl: str, *args: Any, **kwargs: Any
+    ) -> Any:  # noqa: ANN401
+        with self.metrics.phase(phase_of(method, requrl)):
+            return self.algod.algod_request(method, requrl, *args, **kwargs)
+
+
+class TimedSigner(TransactionSigner):
+    """Times `signer` as the sign phase of the call in progress."""
+
+    def __init__(self, signer: TransactionSigner, metrics: Metrics) -> None:
+        super().__init__()
+        self.signer = signer
+        self.metrics = metrics
+
+    def sign_transactions(
+        self, txn_group: list[transaction.Transaction], indexes: list[int]
+    ) -> list[transaction.GenericSignedTransaction]:
+        with self.metrics.phase("sign"):
+            return self.signer.sign_transactions(txn_group, indexes)
+
+
+def instrument(
+    app_client: client.ApplicationClient, metrics: Metrics
+) -> client.ApplicationClient:
+    """A copy of `app_client` whose requests and signing `metrics` times."""
+    assert app_client.signer is not None
+    return client.ApplicationClient(
+        InstrumentedAlgod(app_client.client, metrics),
+        app_client.algokit_app_client.app_spec,
+        app_id=app_client.app_id,
+        signer=TimedSigner(app_client.signer, metrics),
+        sender=app_client.sender,
+    )
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Liquidation keeper for a lender's loans on a loan book app (see loan_book.py).
+
+The lender's accepted loans sit in a min-heap keyed by their deadline,
+`start + duration`. Each round the keeper syncs the loans the round touched
+(see loan_index.py), pushes their new deadlines and pops the expired ones,
+so a round costs O(log n) per changed or expired loan instead of a rescan.
+Superseded heap entries are dropped as they reach the top.
+
+The contract only lets a loan be liquidated once the latest block's
+timestamp is past its deadline when it is built with the `expiry_check`
+option; the keeper submits the calls from the first round where that holds,
+up to `GROUP_SIZE` of them per atomic group. Liquidating closes the NFT out
+to the lender, so the group also opts the lender in to each NFT they don't
+hold yet. A loan whose liquidation fails
+while it is still the lender's is queued again, `RETRY_DELAY` seconds later,
+twice that after another failure and so on up to `MAX_RETRY_DELAY`.
+
+    poetry run python keeper.py APP_ID
+"""
+
+import argparse
+import heapq
+import logging
+import sys
+
+from algosdk import transaction
+from algosdk.atomic_transaction_composer import (
+    AtomicTransactionComposer,
+    TransactionWithSigner,
+)
+from algosdk.error import AlgodHTTPError
+from beaker import client, sandbox
+
+from loan_book import app
+from loan_index import LoanBookReader, LoanRecord
+
+# Calls per atomic group, each maybe with an opt-in: 16 transactions at most
+GROUP_SIZE = 8
+# Seconds of block time
+RETRY_DELAY = 10
+MAX_RETRY_DELAY = 600
+
+log = logging.getLogger(__name__)
+
+
+class Keeper:
+    def __init__(
+        self, app_client: client.ApplicationClient, reader: LoanBookReader
+    ) -> None:
+        # Liquidations are sent by, and to, the app client's sender
+        self.app_client = app_client
+        self.lender = app_client.get_sender()
+        self.reader = reader
+        # Heap of (due, nft, expiry), due at the expiry or at the next retry
+        self.deadlines: list[tuple[int, int, int]] = []
+        self.failures: dict[int, int] = {}  # nft -> failed liquidations in a row
+
+    def start(self) -> None:
+        """Load the loan book and queue every loan of the lender."""
+        self.reader.load()
+        for loan in self.reader.index.by_lender(self.lender):
+            self._track(loan)
+
+    def _track(self, loan: LoanRecord | None) -> None:
+        if loan is not None and loan.lender == self.lender and loan.expiry is not None:
+            heapq.heappush(self.deadlines, (loan.expiry, loan.nft, loan.expiry))
+
+    def _is_current(self, nft: int, expiry: int) -> bool:
+        loan = self.reader.index.by_nft(nft)
+        return loan is not None and loan.lender == self.lender and loan.expiry == expiry
+
+    def next_deadline(self) -> int | None:
+        while self.deadlines and not self._is_current(*self.deadlines[0][1:]):
+            heapq.heappop(self.deadlines)
+        return self.deadlines[0][0] if self.deadlines else None
+
+    def due(self, now: int) -> list[int]:
+        """Pop the loans whose deadline is before `now`, soonest first."""
+        nfts: list[int] = []
+        while (deadline := self.next_deadline()) is not None and deadline < now:
+            nft = heapq.heappop(self.deadlines)[1]
+            if nft not in nfts:
+                nfts.append(nft)
+        return nfts
+
+    def liquidate(self, nfts: list[int], now: int) -> list[int]:
+        """Liquidate in groups of up to `GROUP_SIZE` calls.
+
+        A failed group is retried one call at a time, so one loan repaid in
+        the meantime does not hold the others back; what still fails is
+        queued again from `now`. Returns the liquidated NFT IDs."""
+        done = []
+        for at in range(0, len(nfts), GROUP_SIZE):
+            batch = nfts[at : at + GROUP_SIZE]
+            try:
+                liquidated = self._liquidate(batch)
+            except Exception:
+                # Not a rejection but e.g. algod being unreachable, which must
+                # not stop the keeper
+                log.exception("liquidating the loans on NFTs %s failed", batch)
+                liquidated = []
+            for nft in batch:
+                if nft in liquidated:
+                    self.failures.pop(nft, None)
+                else:
+                    self._retry(nft, now)
+            done += liquidated
+        return done
+
+    def _liquidate(self, nfts: list[int]) -> list[int]:
+        try:
+            self._submit(nfts)
+            return nfts
+        except AlgodHTTPError:
+            pass
+        done = []
+        for nft in nfts:
+            try:
+                self._submit([nft])
+                done.append(nft)
+            except AlgodHTTPError as err:
+                log.warning("liquidating the loan on NFT %d failed: %s", nft, err)
+        return done
+
+    def _retry(self, nft: int, now: int) -> None:
+        loan = self.reader.index.by_nft(nft)
+        if loan is None or loan.lender != self.lender or loan.expiry is None:
+            # Repaid or liquidated in the meantime
+            self.failures.pop(nft, None)
+            return
+        failures = self.failures[nft] = self.failures.get(nft, 0) + 1
+        delay = min(RETRY_DELAY * 2 ** (failures - 1), MAX_RETRY_DELAY)
+        heapq.heappush(self.deadlines, (now + delay, nft, loan.expiry))
+
+    def _opted_in(self, nft: int) -> bool:
+        try:
+            self.app_client.client.account_asset_info(self.lender, nft)
+        except AlgodHTTPError as err:
+            if err.code != 404:
+                raise
+            return False
+        return True
+
+    def _submit(self, nfts: list[int]) -> None:
+        opt_in_sp = self.app_client.get_suggested_params()
+        sp = self.app_client.get_suggested_params()
+        sp.flat_fee = True
+        sp.fee = sp.min_fee * 3
+        atc = AtomicTransactionComposer()
+        for nft in nfts:
+            loan = self.reader.index.by_nft(nft)
+            assert loan is not None
+            if not self._opted_in(nft):
+                opt_in = transaction.AssetOptInTxn(self.lender, opt_in_sp, nft)
+                atc.add_transaction(
+                    TransactionWithSigner(opt_in, self.app_client.get_signer())
+                )
+            # The borrower gets the loan's minimum balance back
+            self.app_client.add_method_call(
+                atc,
+                "liquidate_loan",
+                nft=nft,
+                suggested_params=sp,
+                boxes=[(0, nft.to_bytes(8, "big"))],
+                accounts=[loan.borrower],
+            )
+        atc.execute(self.app_client.client, 3)
+
+    def step(self) -> list[int]:
+        """Sync the rounds made since the last step and liquidate what expired.
+
+        Returns the liquidated NFT IDs."""
+        for nft in self.reader.sync():
+            self._track(self.reader.index.by_nft(nft))
+        now = self.latest_timestamp()
+        return self.liquidate(self.due(now), now)
+
+    def latest_timestamp(self) -> int:
+        block = self.app_client.client.block_info(round_num=self.reader.round)
+        assert isinstance(block, dict)
+        return block["block"].get("ts", 0)
+
+    def run(self) -> None:
+        """Step once per new round, forever."""
+        self.start()
+        while True:
+            for nft in self.step():
+                print(f"liquidated the loan on NFT {nft}")
+            self.app_client.client.status_after_block(self.reader.round)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("app_id", type=int)
+    parser.add_argument(
+        "--account", type=int, default=0, help="index of the localnet lender account"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    algod = sandbox.get_algod_client()
+    lender = sandbox.get_accounts()[args.account]
+    app_client = client.ApplicationClient(
+        algod, app, app_id=args.app_id, signer=lender.signer
+    )
+    Keeper(app_client, LoanBookReader(algod, args.app_id)).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
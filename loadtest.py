@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""Throughput and latency of full NFTasCollateral loan lifecycles.
+
+Every borrower/lender pair gets its own app, NFT and tokens, then runs
+opt_app_in_nft -> request_loan -> accept_loan -> repay_loan or
+liquidate_loan through the async client, with at most `--concurrency`
+lifecycles in flight at once.
+
+    poetry run python loadtest.py --pairs 100 --concurrency 20
+    poetry run python loadtest.py --backend sim --close mixed
+    poetry run python loadtest.py --metrics metrics.prom --simulate
+
+`--metrics` writes where the time of each method went, phase by phase, with
+the fees paid and the rejection reasons, in the Prometheus text format (see
+instrumentation.py); `--simulate` adds each call's opcode cost to it.
+"""
+
+import argparse
+import asyncio
+import math
+import sys
+import time
+from collections import Counter, defaultdict
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass, field
+
+from algokit_utils import ApplicationSpecification
+from algosdk import account, transaction
+from algosdk.atomic_transaction_composer import (
+    AtomicTransactionComposer,
+    TransactionWithSigner,
+)
+from algosdk.v2client.algod import AlgodClient
+from beaker import sandbox
+from beaker.localnet import LocalAccount
+
+import build
+import simulator
+from async_client import AsyncAlgod, HttpAlgod, LoanClient, LocalAlgod
+from instrumentation import Metrics, reason
+from world import World, build_world
+
+AMOUNT = 5
+DURATION = 1_000_000
+INTEREST = 1
+CLOSES = ("repay", "liquidate", "mixed")
+# Covers the pair's app creation, opt-ins, app funding and fees
+PAIR_FUNDING = 2_000_000
+
+
+@dataclass
+class Report:
+    seconds: float = 0
+    cycles: int = 0
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    failures: Counter[str] = field(default_factory=Counter)
+
+    @property
+    def throughput(self) -> float:
+        """Completed lifecycles per second."""
+        return self.cycles / self.seconds if self.seconds else 0.0
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile, `q` in 0-100."""
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def make_pairs(
+    algod: AlgodClient,
+    funder: LocalAccount,
+    count: int,
+    app_spec: ApplicationSpecification | None = None,
+) -> list[World]:
+    """`count` worlds, each with its own fresh borrower and lender.
+
+    `funder` pays for everything and creates the apps, of app.py's current
+    build unless given another `app_spec`."""
+    app_spec = app_spec or build.load("app")
+    parties = []
+    for _ in range(count * 2):
+        private_key, address = account.generate_account()
+        parties.append(LocalAccount(address=address, private_key=private_key))
+    sp = algod.suggested_params()
+    for at in range(0, len(parties), 16):
+        atc = AtomicTransactionComposer()
+        for i, party in enumerate(parties[at : at + 16], start=at):
+            # Borrowers get a little more, as build_world ranks by balance
+            amount = PAIR_FUNDING + (1 - i % 2)
+            atc.add_transaction(
+                TransactionWithSigner(
+                    txn=transaction.PaymentTxn(
+                        funder.address, sp, party.address, amount
+                    ),
+                    signer=funder.signer,
+                )
+            )
+        atc.execute(algod, 3)
+    return [
+        build_world(algod, [funder, parties[i], parties[i + 1]], app_spec)
+        for i in range(0, len(parties), 2)
+    ]
+
+
+async def lifecycle(
+    aio: AsyncAlgod,
+    world: World,
+    close: str,
+    report: Report,
+    metrics: Metrics | None = None,
+) -> None:
+    app_spec = world.app_client.algokit_app_client.app_spec
+    app_id = world.app_client.app_id
+    borrower = LoanClient(aio, app_spec, app_id, world.borrower, metrics)
+    lender = LoanClient(aio, app_spec, app_id, world.lender, metrics)
+    steps: list[tuple[str, Callable[[], Awaitable[object]]]] = [
+        ("opt_app_in_nft", lambda: borrower.opt_app_in_nft(world.nft)),
+        (
+            "request_loan",
+            lambda: borrower.request_loan(
+                world.nft, world.token, AMOUNT, DURATION, INTEREST
+            ),
+        ),
+        (
+            "accept_loan",
+            lambda: lender.accept_loan(world.token, AMOUNT, world.borrower.address),
+        ),
+        (
+            (
+                "repay_loan",
+                lambda: borrower.repay_loan(
+                    world.nft, world.token, world.lender.address
+                ),
+            )
+            if close == "repay"
+            else ("liquidate_loan", lambda: lender.liquidate_loan(world.nft))
+        ),
+    ]
+    for method, step in steps:
+        start = time.perf_counter()
+        try:
+            await step()
+        except Exception as err:
+            report.failures[f"{method}: {reason(err)}"] += 1
+            return
+        report.latencies[method].append(time.perf_counter() - start)
+    report.cycles += 1
+
+
+async def run(
+    aio: AsyncAlgod,
+    worlds: Sequence[World],
+    concurrency: int,
+    close: str = "repay",
+    metrics: Metrics | None = None,
+) -> Report:
+    """One lifecycle per world; `close="mixed"` alternates repay and liquidate."""
+    report = Report()
+    gate = asyncio.Semaphore(concurrency)
+
+    async def limited(i: int, world: World) -> None:
+        async with gate:
+            closing = close if close != "mixed" else ("repay", "liquidate")[i % 2]
+            await lifecycle(aio, world, closing, report, metrics)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited(i, world) for i, world in enumerate(worlds)))
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def format_report(report: Report) -> str:
+    attempted = report.cycles + sum(report.failures.values())
+    lines = [
+        f"{report.cycles}/{attempted} lifecycles in {report.seconds:.2f}s: "
+        f"{report.throughput:.2f} lifecycles/s",
+        f"{'method':<16}{'calls':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}",
+    ]
+    for method, values in report.latencies.items():
+        p50, p95, p99 = (percentile(values, q) * 1000 for q in (50, 95, 99))
+        lines.append(f"{method:<16}{len(values):>7}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}")
+    if report.failures:
+        lines.append("failures:")
+        lines += [f"{count:>7} {why}" for why, count in report.failures.most_common()]
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pairs", type=int, default=10, help="borrower/lender pairs")
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="lifecycles in flight at once"
+    )
+    parser.add_argument("--close", choices=CLOSES, default="mixed")
+    parser.add_argument("--backend", choices=("localnet", "sim"), default="localnet")
+    parser.add_argument("--metrics", help="write the call metrics to this file")
+    parser.add_argument(
+        "--simulate", action="store_true", help="simulate each call for its cost"
+    )
+    args = parser.parse_args()
+
+    aio: AsyncAlgod
+    if args.backend == "sim":
+        sim = simulator.SimAlgodClient()
+        algod: AlgodClient = sim
+        funder = simulator.get_accounts(sim, count=1)[0]
+        aio = LocalAlgod(sim)
+    else:
+        algod = sandbox.get_algod_client()
+        funder = sandbox.get_accounts()[0]
+        aio = HttpAlgod.from_client(algod, max_connections=args.concurrency)
+    worlds = make_pairs(algod, funder, args.pairs)
+    metrics = Metrics(simulate=args.simulate) if args.metrics else None
+
+    async def measure() -> Report:
+        try:
+            return await run(aio, worlds, args.concurrency, args.close, metrics)
+        finally:
+            await aio.close()
+
+    report = asyncio.run(measure())
+    print(format_report(report))
+    if metrics is not None:
+        with open(args.metrics, "w") as out:
+            out.write(metrics.prometheus())
+    return 1 if report.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
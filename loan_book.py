@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+
+from typing import Final
+
+from beaker import *
+from beaker.lib.storage import BoxMapping
+from pyteal import *
+
+from build_options import expiry_check
+from terms import LoanView, owed, status
+
+
+class Loan(abi.NamedTuple):
+    nft: abi.Field[abi.Uint64]
+    token: abi.Field[abi.Uint64]
+    amount: abi.Field[abi.Uint64]
+    interest: abi.Field[abi.Uint64]  # yearly rate in basis points
+    start: abi.Field[abi.Uint64]
+    duration: abi.Field[abi.Uint64]
+    borrower: abi.Field[abi.Address]
+    lender: abi.Field[abi.Address]  # zero address until the loan is accepted
+
+
+# Byte offsets of the encoded Loan fields that accept reads and writes
+TOKEN_OFFSET = 8
+AMOUNT_OFFSET = 16
+START_OFFSET = 32
+BORROWER_OFFSET = 48
+LENDER_OFFSET = 80
+
+
+# Minimum balance the app needs for each loan: the NFT opt-in and the box,
+# 2500 + 400 per byte of key and value, which the borrower pays on opt-in
+OPT_IN_MBR = 100_000
+BOX_MBR = 2500 + 400 * (8 + Loan().type_spec().byte_length_static())
+LOAN_MBR = OPT_IN_MBR + BOX_MBR
+
+
+class State:
+    loans: Final[BoxMapping] = BoxMapping(abi.Uint64, Loan)
+
+
+app = Application("NFTasCollateralBook", state=State)
+
+
+def loan_box(nft: abi.Asset) -> BoxMapping.Element:
+    # One box per loan, keyed by the ID of the NFT used as collateral
+    return app.state.loans[Itob(nft.asset_id())]
+
+
+def release(nft: abi.Asset, receiver: Expr, borrower: Expr, amount: Expr) -> Expr:
+    # Sends `amount` of the NFT to `receiver` closing the app out of it, and
+    # pays the borrower back what the opt-in and the box took, in one group
+    return Seq(
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields(
+            {
+                TxnField.type_enum: TxnType.AssetTransfer,
+                TxnField.xfer_asset: nft.asset_id(),
+                TxnField.asset_amount: amount,
+                TxnField.asset_receiver: receiver,
+                TxnField.fee: Int(0),
+                TxnField.asset_close_to: receiver,
+            }
+        ),
+        InnerTxnBuilder.Next(),
+        InnerTxnBuilder.SetFields(
+            {
+                TxnField.type_enum: TxnType.Payment,
+                TxnField.amount: Int(LOAN_MBR),
+                TxnField.receiver: borrower,
+                TxnField.fee: Int(0),
+            }
+        ),
+        InnerTxnBuilder.Submit(),
+    )
+
+
+@app.create(bare=True)
+def create() -> Expr:
+    return Approve()
+
+
+# ---------------------------- Borrower ----------------------------
+@app.external()
+def opt_app_in_nft(nft: abi.Asset, pay: abi.PaymentTransaction) -> Expr:
+    holding = AssetHolding.balance(Txn.sender(), nft.asset_id())
+    nft_id = abi.Uint64()
+    zero = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    loan = Loan()
+    return Seq(
+        # Checks
+        Assert(Not(loan_box(nft).exists())),
+        holding,
+        Assert(holding.value() >= Int(1)),
+        Assert(pay.get().receiver() == Global.current_application_address()),
+        Assert(pay.get().amount() >= Int(LOAN_MBR)),
+        # Transaction
+        InnerTxnBuilder.Execute(
+            {
+                TxnField.type_enum: TxnType.AssetTransfer,
+                TxnField.xfer_asset: nft.asset_id(),
+                TxnField.asset_amount: Int(0),
+                TxnField.asset_receiver: Global.current_application_address(),
+                TxnField.fee: Int(0),
+            }
+        ),
+        # State
+        nft_id.set(nft.asset_id()),
+        zero.set(Int(0)),
+        borrower.set(Txn.sender()),
+        lender.set(Global.zero_address()),
+        loan.set(nft_id, zero, zero, zero, zero, zero, borrower, lender),
+        loan_box(nft).set(loan),
+    )
+
+
+@app.external()
+def request_loan(
+    nft: abi.Asset,
+    token: abi.Uint64,
+    amount: abi.Uint64,
+    duration: abi.Uint64,
+    interest: abi.Uint64,
+    axfer: abi.AssetTransferTransaction,
+) -> Expr:
+    loan = Loan()
+    nft_id = abi.Uint64()
+    current_token = abi.Uint64()
+    start = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    return Seq(
+        loan_box(nft).store_into(loan),
+        loan.nft.store_into(nft_id),
+        loan.token.store_into(current_token),
+        loan.start.store_into(start),
+        loan.borrower.store_into(borrower),
+        loan.lender.store_into(lender),
+        # Checks
+        Assert(Txn.sender() == borrower.get()),
+        Assert(current_token.get() == Int(0)),
+        Assert(axfer.get().asset_receiver() == Global.current_application_address()),
+        Assert(axfer.get().xfer_asset() == nft.asset_id()),
+        Assert(axfer.get().asset_amount() == Int(1)),
+        # State
+        loan.set(nft_id, token, amount, interest, start, duration, borrower, lender),
+        loan_box(nft).set(loan),
+    )
+
+
+@app.external()
+def delete_request(nft: abi.Asset) -> Expr:
+    # Also right after opt_app_in_nft, before the NFT was transferred
+    loan = Loan()
+    token = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    return Seq(
+        loan_box(nft).store_into(loan),
+        loan.token.store_into(token),
+        loan.borrower.store_into(borrower),
+        loan.lender.store_into(lender),
+        # Checks
+        Assert(Txn.sender() == borrower.get()),
+        Assert(lender.get() == Global.zero_address()),
+        # Transaction
+        release(
+            nft,
+            borrower.get(),
+            borrower.get(),
+            If(token.get() == Int(0), Int(0), Int(1)),
+        ),
+        # State
+        Pop(loan_box(nft).delete()),
+    )
+
+
+@app.external
+def repay_loan(nft: abi.Asset, loan: abi.AssetTransferTransaction) -> Expr:
+    record = Loan()
+    token = abi.Uint64()
+    amount = abi.Uint64()
+    interest = abi.Uint64()
+    start = abi.Uint64()
+    duration = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    return Seq(
+        loan_box(nft).store_into(record),
+        record.token.store_into(token),
+        record.amount.store_into(amount),
+        record.interest.store_into(interest),
+        record.start.store_into(start),
+        record.duration.store_into(duration),
+        record.borrower.store_into(borrower),
+        record.lender.store_into(lender),
+        # Checks
+        Assert(Txn.sender() == borrower.get()),
+        Assert(lender.get() != Global.zero_address()),
+        Assert(Global.latest_timestamp() <= start.get() + duration.get()),
+        Assert(loan.get().xfer_asset() == token.get()),
+        Assert(
+            loan.get().asset_amount() >= owed(amount.get(), interest.get(), start.get())
+        ),
+        Assert(loan.get().asset_receiver() == lender.get()),
+        # Transaction
+        release(nft, borrower.get(), borrower.get(), Int(1)),
+        # State
+        Pop(loan_box(nft).delete()),
+    )
+
+
+# ---------------------------- Lender ----------------------------
+def accept(box: BoxMapping.Element, loan: TxnObject) -> Expr:
+    # Reads the fields it checks straight from the box and writes the two it
+    # changes in place, which keeps accept_loans within one call's budget
+    record = ScratchVar(TealType.bytes)
+    token = ExtractUint64(record.load(), Int(TOKEN_OFFSET))
+    amount = ExtractUint64(record.load(), Int(AMOUNT_OFFSET))
+    borrower = Extract(record.load(), Int(BORROWER_OFFSET), Int(32))
+    lender = Extract(record.load(), Int(LENDER_OFFSET), Int(32))
+    return Seq(
+        record.store(box.get()),
+        # Checks
+        Assert(lender == Global.zero_address()),
+        Assert(token != Int(0)),
+        Assert(loan.xfer_asset() == token),
+        Assert(loan.asset_amount() == amount),
+        Assert(loan.asset_receiver() == borrower),
+        # State
+        BoxReplace(box.key, Int(START_OFFSET), Itob(Global.latest_timestamp())),
+        BoxReplace(box.key, Int(LENDER_OFFSET), loan.sender()),
+    )
+
+
+@app.external
+def accept_loan(nft: abi.Asset, loan: abi.AssetTransferTransaction) -> Expr:
+    return accept(loan_box(nft), loan.get())
+
+
+@app.external
+def accept_loans(nfts: abi.DynamicArray[abi.Uint64]) -> Expr:
+    # accept_loan for every NFT in `nfts`, all or none. The token transfer of
+    # the i-th loan is the i-th of the len(nfts) transactions before this call,
+    # and the call must reference the box of each loan
+    count = ScratchVar(TealType.uint64)
+    first = ScratchVar(TealType.uint64)
+    txn = ScratchVar(TealType.uint64)
+    key = ScratchVar(TealType.bytes)
+    nft_id = abi.Uint64()
+    return Seq(
+        count.store(nfts.length()),
+        # Checks
+        Assert(count.load() <= Txn.group_index()),
+        first.store(Txn.group_index() - count.load()),
+        # State
+        For(
+            txn.store(first.load()),
+            txn.load() < Txn.group_index(),
+            txn.store(txn.load() + Int(1)),
+        ).Do(
+            nfts[txn.load() - first.load()].store_into(nft_id),
+            key.store(Itob(nft_id.get())),
+            Assert(Gtxn[txn.load()].type_enum() == TxnType.AssetTransfer),
+            accept(app.state.loans[key.load()], Gtxn[txn.load()]),
+        ),
+    )
+
+
+@app.external
+def liquidate_loan(nft: abi.Asset) -> Expr:
+    # The call must reference the borrower, who gets the minimum balance back
+    loan = Loan()
+    start = abi.Uint64()
+    duration = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    return Seq(
+        loan_box(nft).store_into(loan),
+        loan.start.store_into(start),
+        loan.duration.store_into(duration),
+        loan.borrower.store_into(borrower),
+        loan.lender.store_into(lender),
+        # Checks
+        Assert(Txn.sender() == lender.get()),
+        expiry_check(start.get() + duration.get()),
+        # Transaction
+        release(nft, lender.get(), borrower.get(), Int(1)),
+        # State
+        Pop(loan_box(nft).delete()),
+    )
+
+
+# ---------------------------- Read-only ----------------------------
+@app.external(read_only=True)
+def view_loans(
+    nfts: abi.DynamicArray[abi.Uint64], *, output: abi.DynamicArray[LoanView]
+) -> Expr:
+    # The view of the loan on each NFT, EMPTY where there is none. The call
+    # must reference the box of each NFT
+    i = ScratchVar(TealType.uint64)
+    views = ScratchVar(TealType.bytes)
+    nft_id = abi.Uint64()
+    record = Loan()
+    token = abi.Uint64()
+    amount = abi.Uint64()
+    interest = abi.Uint64()
+    start = abi.Uint64()
+    duration = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    owes = abi.Uint64()
+    state = abi.Uint8()
+    view = LoanView()
+    lent = lender.get() != Global.zero_address()
+    return Seq(
+        views.store(Bytes("")),
+        For(i.store(Int(0)), i.load() < nfts.length(), i.store(i.load() + Int(1))).Do(
+            nfts[i.load()].store_into(nft_id),
+            box := BoxGet(Itob(nft_id.get())),
+            # A missing loan reads as all zeros
+            record.decode(
+                If(
+                    box.hasValue(),
+                    box.value(),
+                    BytesZero(Int(record.type_spec().byte_length_static())),
+                )
+            ),
+            record.token.store_into(token),
+            record.amount.store_into(amount),
+            record.interest.store_into(interest),
+            record.start.store_into(start),
+            record.duration.store_into(duration),
+            record.borrower.store_into(borrower),
+            record.lender.store_into(lender),
+            owes.set(
+                If(lent, owed(amount.get(), interest.get(), start.get()), amount.get())
+            ),
+            state.set(
+                status(
+                    If(box.hasValue(), nft_id.get(), Int(0)),
+                    token.get(),
+                    lent,
+                    start.get() + duration.get(),
+                )
+            ),
+            view.set(
+                nft_id,
+                token,
+                amount,
+                interest,
+                start,
+                duration,
+                borrower,
+                lender,
+                owes,
+                state,
+            ),
+            views.store(Concat(views.load(), view.encode())),
+        ),
+        output.decode(Concat(Suffix(Itob(nfts.length()), Int(6)), views.load())),
+    )
+
+
+if __name__ == "__main__":
+    from build import build
+
+    build("loan_book")
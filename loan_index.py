@@ -0,0 +1,192 @@
+"""Off-chain index of the loans held by a loan book app (see loan_book.py).
+
+`LoanBookReader.load` reads every loan box once; `LoanBookReader.sync` then
+walks the blocks made since, and re-reads only the boxes that the app calls
+in them referenced. The app can't touch a box a call doesn't reference, so
+nothing else can have changed.
+"""
+
+import bisect
+from base64 import b64decode
+from collections import defaultdict
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any
+
+from algosdk import abi
+from algosdk.constants import ZERO_ADDRESS
+from algosdk.error import AlgodHTTPError
+from algosdk.v2client.algod import AlgodClient
+
+from events import unpack_block
+from loan_book import Loan
+
+LOAN_CODEC = abi.ABIType.from_string(str(Loan().type_spec()))
+
+
+@dataclass(frozen=True)
+class LoanRecord:
+    nft: int
+    token: int
+    amount: int
+    interest: int
+    start: int
+    duration: int
+    borrower: str
+    lender: str | None
+
+    @classmethod
+    def decode(cls: type["LoanRecord"], value: bytes) -> "LoanRecord":
+        fields = dict(zip(Loan.__annotations__, LOAN_CODEC.decode(value), strict=True))
+        if fields["lender"] == ZERO_ADDRESS:
+            fields["lender"] = None
+        return cls(**fields)
+
+    @property
+    def expiry(self) -> int | None:
+        """When the lender may liquidate, once the loan has been accepted."""
+        return self.start + self.duration if self.lender else None
+
+
+class LoanIndex:
+    """Loans by NFT, with secondary indexes by party, token and expiry."""
+
+    def __init__(self) -> None:
+        self._loans: dict[int, LoanRecord] = {}
+        self._by_borrower: dict[str, set[int]] = defaultdict(set)
+        self._by_lender: dict[str, set[int]] = defaultdict(set)
+        self._by_token: dict[int, set[int]] = defaultdict(set)
+        self._expiries: list[tuple[int, int]] = []  # sorted (expiry, nft)
+
+    def __len__(self) -> int:
+        return len(self._loans)
+
+    def __iter__(self) -> Iterator[LoanRecord]:
+        return iter(self._loans.values())
+
+    def put(self, loan: LoanRecord) -> None:
+        self.remove(loan.nft)
+        self._loans[loan.nft] = loan
+        self._by_borrower[loan.borrower].add(loan.nft)
+        if loan.lender:
+            self._by_lender[loan.lender].add(loan.nft)
+        if loan.token:
+            self._by_token[loan.token].add(loan.nft)
+        if loan.expiry is not None:
+            bisect.insort(self._expiries, (loan.expiry, loan.nft))
+
+    def remove(self, nft: int) -> None:
+        loan = self._loans.pop(nft, None)
+        if loan is None:
+            return
+        self._discard(self._by_borrower, loan.borrower, nft)
+        if loan.lender:
+            self._discard(self._by_lender, loan.lender, nft)
+        if loan.token:
+            self._discard(self._by_token, loan.token, nft)
+        if loan.expiry is not None:
+            at = bisect.bisect_left(self._expiries, (loan.expiry, nft))
+            del self._expiries[at]
+
+    @staticmethod
+    def _discard(index: dict[Any, set[int]], key: object, nft: int) -> None:
+        index[key].discard(nft)
+        if not index[key]:
+            del index[key]
+
+    def by_nft(self, nft: int) -> LoanRecord | None:
+        return self._loans.get(nft)
+
+    def by_borrower(self, address: str) -> list[LoanRecord]:
+        return self._lookup(self._by_borrower.get(address, set()))
+
+    def by_lender(self, address: str) -> list[LoanRecord]:
+        return self._lookup(self._by_lender.get(address, set()))
+
+    def by_token(self, token: int) -> list[LoanRecord]:
+        return self._lookup(self._by_token.get(token, set()))
+
+    def expiring(self, after: int = 0, before: int | None = None) -> list[LoanRecord]:
+        """Accepted loans with `after <= expiry < before`, soonest first."""
+        lo = bisect.bisect_left(self._expiries, (after, 0))
+        hi = (
+            len(self._expiries)
+            if before is None
+            else bisect.bisect_left(self._expiries, (before, 0))
+        )
+        return [self._loans[nft] for _, nft in self._expiries[lo:hi]]
+
+    def _lookup(self, nfts: set[int]) -> list[LoanRecord]:
+        return [self._loans[nft] for nft in sorted(nfts)]
+
+
+class LoanBookReader:
+    """Keeps a `LoanIndex` in step with a loan book app on chain."""
+
+    def __init__(
+        self, algod: AlgodClient, app_id: int, index: LoanIndex | None = None
+    ) -> None:
+        self.algod = algod
+        self.app_id = app_id
+        self.index = index or LoanIndex()
+        self.round = 0
+
+    def load(self) -> None:
+        """Bulk load every loan box; later changes come from `sync`."""
+        self.round = self._last_round()
+        response = self.algod.application_boxes(self.app_id)
+        assert isinstance(response, dict)
+        for box in response["boxes"]:
+            self._refresh(b64decode(box["name"]))
+
+    def sync(self) -> set[int]:
+        """Apply the rounds made since the last load or sync.
+
+        Returns the NFT IDs of the loans that were touched."""
+        last = self._last_round()
+        names: set[bytes] = set()
+        for number in range(self.round + 1, last + 1):
+            block = self.algod.block_info(round_num=number, response_format="msgpack")
+            assert isinstance(block, bytes)
+            decoded = unpack_block(block)
+            for stxn in decoded["block"].get("txns", []):
+                names |= self._box_refs(stxn)
+        self.round = last
+        for name in names:
+            self._refresh(name)
+        return {int.from_bytes(name, "big") for name in names}
+
+    def _box_refs(self, stxn: dict[str, Any]) -> set[bytes]:
+        """The app's boxes a block transaction references, itself or through
+        the inner transactions in its apply data."""
+        names: set[bytes] = set()
+        for inner in stxn.get("dt", {}).get("itx", []):
+            names |= self._box_refs(inner)
+        txn = stxn["txn"]
+        if txn.get("type") != b"appl":
+            return names
+        called = txn.get("apid", 0)
+        foreign = [called, *txn.get("apfa", [])]
+        # An empty name names no box, it only adds to the call's box quota
+        return names | {
+            ref["n"]
+            for ref in txn.get("apbx", [])
+            if ref.get("n") and foreign[ref.get("i", 0)] == self.app_id
+        }
+
+    def _refresh(self, name: bytes) -> None:
+        nft = int.from_bytes(name, "big")
+        try:
+            response = self.algod.application_box_by_name(self.app_id, name)
+        except AlgodHTTPError as err:
+            if err.code != 404:
+                raise
+            self.index.remove(nft)
+            return
+        assert isinstance(response, dict)
+        self.index.put(LoanRecord.decode(b64decode(response["value"])))
+
+    def _last_round(self) -> int:
+        status = self.algod.status()
+        assert isinstance(status, dict)
+        return status["last-round"]
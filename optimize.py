@@ -0,0 +1,223 @@
+"""A peephole pass over the compiled approval program: reads that a subroutine
+repeats are made once, on entry, and kept in scratch. It runs on builds with
+`--option optimize=1`.
+
+    poetry run python benchmark.py --compare-optimized
+
+Two kinds of read are cached:
+
+- a global key, `bytec_1 // "borrower"` followed by `app_global_get`, read
+  before the subroutine first writes any global or calls a subroutine that
+  does. Reads after that point are left as they are.
+- a field of a transaction argument, `frame_dig -1` followed by
+  `gtxns AssetAmount`, i.e. `loan.get().asset_amount()`, which never changes.
+
+Each opcode costs 1, so a `load` saves 1 on a read (2 opcodes) and the
+prefetch costs 3. A read is only cached when the subroutine makes it at least
+3 times before its first branch, so on every call, and no call costs more:
+then it is cached when it is made more often than that, or again in a loop,
+like the release of each NFT of a bundle. Every cached read gets its own slot,
+above the slots the program already uses, so that callers and callees never
+share one.
+"""
+
+import base64
+import json
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+# Opcodes of a prefetch, and so the reads it must replace not to cost more
+PREFETCH = 3
+SLOTS = 256
+WRITES = {"app_global_put", "app_global_del"}
+BRANCHES = {"b", "bz", "bnz"}
+EXITS = BRANCHES | {"switch", "match", "retsub", "return", "err"}
+
+
+def _op(line: str) -> list[str]:
+    return line.split("//", 1)[0].split()
+
+
+def _label(line: str) -> str | None:
+    op = _op(line)
+    if len(op) == 1 and op[0].endswith(":"):
+        return op[0][:-1]
+    return None
+
+
+@dataclass
+class Subroutine:
+    label: str
+    # Line numbers in the program: the `proto` line and the end, exclusive
+    proto: int
+    end: int
+
+
+def subroutines(lines: list[str]) -> list[Subroutine]:
+    """The subroutines of the program, each running up to the next one."""
+    starts = []
+    for number, line in enumerate(lines):
+        label = _label(line)
+        if label is None:
+            continue
+        following = next(
+            (at for at in range(number + 1, len(lines)) if _op(lines[at])), None
+        )
+        if following is not None and _op(lines[following])[0] == "proto":
+            starts.append((label, following))
+    ends = [proto - 1 for _, proto in starts[1:]] + [len(lines)]
+    return [
+        Subroutine(label, proto, end)
+        for (label, proto), end in zip(starts, ends, strict=True)
+    ]
+
+
+def _reads(lines: list[str], sub: Subroutine) -> Iterator[tuple[int, tuple[str, ...]]]:
+    # (line number of the first opcode, both opcodes) of each cacheable read
+    for number in range(sub.proto + 1, sub.end - 1):
+        first, second = _op(lines[number]), _op(lines[number + 1])
+        if not first or not second:
+            continue
+        if (
+            first[0] in ("byte", "bytec", "pushbytes") or first[0].startswith("bytec_")
+        ) and second == ["app_global_get"]:
+            yield number, (*first, *second)
+        elif first[0] == "frame_dig" and int(first[1]) < 0 and second[0] == "gtxns":
+            yield number, (*first, *second)
+
+
+def _writers(lines: list[str], subs: list[Subroutine]) -> set[str]:
+    # Subroutines that write a global, themselves or through a callee
+    calls = {
+        sub.label: {
+            op[1]
+            for op in map(_op, lines[sub.proto : sub.end])
+            if op and op[0] == "callsub"
+        }
+        for sub in subs
+    }
+    writers = {
+        sub.label
+        for sub in subs
+        if any(op and op[0] in WRITES for op in map(_op, lines[sub.proto : sub.end]))
+    }
+    while grown := {label for label, callees in calls.items() if callees & writers}:
+        if grown <= writers:
+            break
+        writers |= grown
+    return writers
+
+
+def _cache(
+    lines: list[str], sub: Subroutine, writers: set[str], slots: Iterator[int]
+) -> tuple[list[str], dict[int, int]]:
+    """The prefetch of `sub`, and the slot standing for each read it replaces."""
+    ops = [_op(line) for line in lines]
+    labels = {
+        label: number
+        for number in range(sub.proto, sub.end)
+        if (label := _label(lines[number])) is not None
+    }
+    first_write = next(
+        (
+            number
+            for number in range(sub.proto, sub.end)
+            if ops[number]
+            and (
+                ops[number][0] in WRITES
+                or (ops[number][0] == "callsub" and ops[number][1] in writers)
+            )
+        ),
+        sub.end,
+    )
+    loops = [
+        (labels[ops[number][1]], number)
+        for number in range(sub.proto, sub.end)
+        if ops[number]
+        and ops[number][0] in BRANCHES
+        and labels.get(ops[number][1], sub.end) <= number
+    ]
+    buried = {op[1] for op in ops[sub.proto : sub.end] if op and op[0] == "frame_bury"}
+
+    def valid(number: int, read: tuple[str, ...]) -> bool:
+        # A global read must come before the first write, also through a loop
+        # that runs into it again; an argument must never be overwritten
+        if read[-1] != "app_global_get":
+            return read[1] not in buried
+        return number < first_write and not any(
+            start <= number and end >= first_write for start, end in loops
+        )
+
+    # Reads before the first label or branch are made on every call
+    straight = next(
+        (
+            number
+            for number in range(sub.proto + 1, sub.end)
+            if _label(lines[number]) is not None
+            or (ops[number] and ops[number][0] in EXITS)
+        ),
+        sub.end,
+    )
+    found: dict[tuple[str, ...], list[int]] = {}
+    for number, read in _reads(lines, sub):
+        if valid(number, read):
+            found.setdefault(read, []).append(number)
+
+    prefetch: list[str] = []
+    replaced: dict[int, int] = {}
+    for numbers in found.values():
+        always = sum(number < straight for number in numbers)
+        looped = any(
+            start <= number <= end for start, end in loops for number in numbers
+        )
+        if always < PREFETCH or (always == PREFETCH and not looped):
+            continue
+        slot = next(slots, None)
+        if slot is None:
+            break
+        prefetch += [lines[numbers[0]], lines[numbers[0] + 1], f"store {slot}"]
+        replaced |= {number: slot for number in numbers}
+    return prefetch, replaced
+
+
+def cache_reads(teal: str) -> str:
+    """`teal` with the repeated reads of each subroutine kept in scratch."""
+    lines = teal.splitlines()
+    ops = [_op(line) for line in lines]
+    if any(op and op[0] in ("loads", "stores") for op in ops):
+        # Slots picked at run time could be any of them
+        return teal
+    used = [int(op[1]) for op in ops if op and op[0] in ("load", "store")]
+    slots = iter(range(max(used, default=-1) + 1, SLOTS))
+    subs = subroutines(lines)
+    writers = _writers(lines, subs)
+
+    prefetches: dict[int, list[str]] = {}
+    replaced: dict[int, int] = {}
+    for sub in subs:
+        prefetch, found = _cache(lines, sub, writers, slots)
+        prefetches[sub.proto] = prefetch
+        replaced |= found
+
+    out = []
+    number = 0
+    while number < len(lines):
+        if number in replaced:
+            out.append(f"load {replaced[number]}")
+            number += 2
+            continue
+        out.append(lines[number])
+        out += prefetches.get(number, [])
+        number += 1
+    return "\n".join(out) + ("\n" if teal.endswith("\n") else "")
+
+
+def optimize_artifacts(out_dir: Path) -> None:
+    """Rewrite the approval program of an exported app in place."""
+    teal = cache_reads((out_dir / "approval.teal").read_text())
+    (out_dir / "approval.teal").write_text(teal)
+    spec_path = out_dir / "application.json"
+    spec = json.loads(spec_path.read_text())
+    spec["source"]["approval"] = base64.b64encode(teal.encode()).decode()
+    spec_path.write_text(json.dumps(spec, indent=4))
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+from typing import Final
+
+from beaker import *
+from pyteal import *
+
+from build_options import expiry_check
+from loan_book import Loan
+from terms import owed
+
+
+class State:
+    loan: Final[GlobalStateValue] = GlobalStateValue(
+        stack_type=TealType.bytes,
+        default=Bytes(""),
+        descr="ABI encoded Loan record, empty when there is no loan",
+    )
+
+
+app = Application("NFTasCollateralPacked", state=State)
+
+
+@app.create(bare=True)
+def create() -> Expr:
+    # State
+    return app.initialize_global_state()
+
+
+# ---------------------------- Borrower ----------------------------
+@app.external()
+def opt_app_in_nft(nft: abi.Asset) -> Expr:
+    nft_id = abi.Uint64()
+    zero = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    loan = Loan()
+    return Seq(
+        # Checks
+        Assert(app.state.loan == Bytes("")),
+        # Transaction
+        InnerTxnBuilder.Execute(
+            {
+                TxnField.type_enum: TxnType.AssetTransfer,
+                TxnField.xfer_asset: nft.asset_id(),
+                TxnField.asset_amount: Int(0),
+                TxnField.asset_receiver: Global.current_application_address(),
+                TxnField.fee: Int(0),
+            }
+        ),
+        # State
+        nft_id.set(nft.asset_id()),
+        zero.set(Int(0)),
+        borrower.set(Txn.sender()),
+        lender.set(Global.zero_address()),
+        loan.set(nft_id, zero, zero, zero, zero, zero, borrower, lender),
+        app.state.loan.set(loan.encode()),
+    )
+
+
+@app.external()
+def request_loan(
+    token: abi.Uint64,
+    amount: abi.Uint64,
+    duration: abi.Uint64,
+    interest: abi.Uint64,
+    axfer: abi.AssetTransferTransaction,
+) -> Expr:
+    loan = Loan()
+    nft = abi.Uint64()
+    current_token = abi.Uint64()
+    start = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    return Seq(
+        loan.decode(app.state.loan),
+        loan.nft.store_into(nft),
+        loan.token.store_into(current_token),
+        loan.start.store_into(start),
+        loan.borrower.store_into(borrower),
+        loan.lender.store_into(lender),
+        # Checks
+        Assert(Txn.sender() == borrower.get()),
+        Assert(current_token.get() == Int(0)),
+        Assert(axfer.get().asset_receiver() == Global.current_application_address()),
+        Assert(axfer.get().xfer_asset() == nft.get()),
+        Assert(axfer.get().asset_amount() == Int(1)),
+        # State
+        loan.set(nft, token, amount, interest, start, duration, borrower, lender),
+        app.state.loan.set(loan.encode()),
+    )
+
+
+@app.external()
+def delete_request() -> Expr:
+    loan = Loan()
+    nft = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    return Seq(
+        loan.decode(app.state.loan),
+        loan.nft.store_into(nft),
+        loan.borrower.store_into(borrower),
+        loan.lender.store_into(lender),
+        # Checks
+        Assert(Txn.sender() == borrower.get()),
+        Assert(lender.get() == Global.zero_address()),
+        # Transaction
+        InnerTxnBuilder.Execute(
+            {
+                TxnField.type_enum: TxnType.AssetTransfer,
+                TxnField.xfer_asset: nft.get(),
+                TxnField.asset_amount: Int(1),
+                TxnField.asset_receiver: borrower.get(),
+                TxnField.fee: Int(0),
+                TxnField.asset_close_to: borrower.get(),
+            }
+        ),
+        # State
+        app.initialize_global_state(),
+    )
+
+
+@app.external
+def repay_loan(loan: abi.AssetTransferTransaction) -> Expr:
+    record = Loan()
+    nft = abi.Uint64()
+    token = abi.Uint64()
+    amount = abi.Uint64()
+    interest = abi.Uint64()
+    start = abi.Uint64()
+    duration = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    return Seq(
+        record.decode(app.state.loan),
+        record.nft.store_into(nft),
+        record.token.store_into(token),
+        record.amount.store_into(amount),
+        record.interest.store_into(interest),
+        record.start.store_into(start),
+        record.duration.store_into(duration),
+        record.borrower.store_into(borrower),
+        record.lender.store_into(lender),
+        # Checks
+        Assert(Txn.sender() == borrower.get()),
+        Assert(lender.get() != Global.zero_address()),
+        Assert(Global.latest_timestamp() <= start.get() + duration.get()),
+        Assert(loan.get().xfer_asset() == token.get()),
+        Assert(
+            loan.get().asset_amount() >= owed(amount.get(), interest.get(), start.get())
+        ),
+        Assert(loan.get().asset_receiver() == lender.get()),
+        # Transaction
+        InnerTxnBuilder.Execute(
+            {
+                TxnField.type_enum: TxnType.AssetTransfer,
+                TxnField.xfer_asset: nft.get(),
+                TxnField.asset_amount: Int(1),
+                TxnField.asset_receiver: borrower.get(),
+                TxnField.fee: Int(0),
+                TxnField.asset_close_to: borrower.get(),
+            }
+        ),
+        # State
+        app.initialize_global_state(),
+    )
+
+
+# ---------------------------- Lender ----------------------------
+@app.external
+def accept_loan(loan: abi.AssetTransferTransaction) -> Expr:
+    record = Loan()
+    nft = abi.Uint64()
+    token = abi.Uint64()
+    amount = abi.Uint64()
+    interest = abi.Uint64()
+    start = abi.Uint64()
+    duration = abi.Uint64()
+    borrower = abi.Address()
+    lender = abi.Address()
+    return Seq(
+        record.decode(app.state.loan),
+        record.nft.store_into(nft),
+        record.token.store_into(token),
+        record.amount.store_into(amount),
+        record.interest.store_into(interest),
+        record.duration.store_into(duration),
+        record.borrower.store_into(borrower),
+        record.lender.store_into(lender),
+        # Checks
+        Assert(lender.get() == Global.zero_address()),
+        Assert(token.get() != Int(0)),
+        Assert(loan.get().xfer_asset() == token.get()),
+        Assert(loan.get().asset_amount() == amount.get()),
+        Assert(loan.get().asset_receiver() == borrower.get()),
+        # State
+        lender.set(loan.get().sender()),
+        start.set(Global.latest_timestamp()),
+        record.set(nft, token, amount, interest, start, duration, borrower, lender),
+        app.state.loan.set(record.encode()),
+    )
+
+
+@app.external
+def liquidate_loan() -> Expr:
+    loan = Loan()
+    nft = abi.Uint64()
+    start = abi.Uint64()
+    duration = abi.Uint64()
+    lender = abi.Address()
+    return Seq(
+        loan.decode(app.state.loan),
+        loan.nft.store_into(nft),
+        loan.start.store_into(start),
+        loan.duration.store_into(duration),
+        loan.lender.store_into(lender),
+        # Checks
+        Assert(Txn.sender() == lender.get()),
+        expiry_check(start.get() + duration.get()),
+        # Transaction
+        InnerTxnBuilder.Execute(
+            {
+                TxnField.type_enum: TxnType.AssetTransfer,
+                TxnField.xfer_asset: nft.get(),
+                TxnField.asset_amount: Int(1),
+                TxnField.asset_receiver: lender.get(),
+                TxnField.fee: Int(0),
+                TxnField.asset_close_to: lender.get(),
+            }
+        ),
+        # State
+        app.initialize_global_state(),
+    )
+
+
+if __name__ == "__main__":
+    from build import build
+
+    build("packed_app")
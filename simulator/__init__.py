@@ -0,0 +1,45 @@
+"""Offline execution backend: a TEAL interpreter over an in-memory ledger.
+
+`SimAlgodClient` stands in for `beaker.sandbox.get_algod_client()` and
+`get_accounts` for `beaker.sandbox.get_accounts()`, so code written against
+localnet runs unchanged in-process.
+"""
+
+import base64
+import hashlib
+
+from algosdk import account
+from beaker.localnet import LocalAccount
+from nacl.signing import SigningKey
+
+from simulator.algod import SimAlgodClient
+from simulator.interpreter import Program, TealError
+from simulator.ledger import Ledger, State, TxnError
+
+DEFAULT_BALANCE = 100_000_000_000_000
+
+
+def get_accounts(
+    client: SimAlgodClient, count: int = 3, balance: int = DEFAULT_BALANCE
+) -> list[LocalAccount]:
+    """Create `count` deterministic accounts funded on the client's ledger."""
+    accounts: list[LocalAccount] = []
+    for i in range(count):
+        seed = hashlib.sha256(f"simulator-account-{i}".encode()).digest()
+        key = SigningKey(seed)
+        private_key = base64.b64encode(seed + bytes(key.verify_key)).decode()
+        address = account.address_from_private_key(private_key)
+        client.ledger.fund(address, balance - i)
+        accounts.append(LocalAccount(address=address, private_key=private_key))
+    return accounts
+
+
+__all__ = [
+    "Ledger",
+    "Program",
+    "SimAlgodClient",
+    "State",
+    "TealError",
+    "TxnError",
+    "get_accounts",
+]
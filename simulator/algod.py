@@ -0,0 +1,503 @@
+"""An `AlgodClient` whose REST calls are answered by an in-memory `Ledger`.
+
+Beaker's `ApplicationClient`, `AtomicTransactionComposer` and the fixtures in
+test_app.py only ever talk to algod through `AlgodClient.algod_request`, so
+overriding that single method is enough to run them without a network.
+"""
+
+import base64
+import itertools
+import re
+from typing import Any
+from urllib.parse import parse_qs
+
+import msgpack
+from algosdk import encoding
+from algosdk.error import AlgodHTTPError
+from algosdk.v2client.algod import AlgodClient
+
+from simulator.interpreter import TealValue
+from simulator.ledger import (
+    GENESIS_HASH,
+    GENESIS_ID,
+    MIN_TXN_FEE,
+    ApplyResult,
+    Ledger,
+    TxnError,
+    decode_signed_txns,
+)
+
+# msgpack keys holding addresses, rendered as base32 strings in JSON
+ADDRESS_KEYS = {"snd", "rcv", "close", "asnd", "arcv", "aclose", "rekey", "fadd"}
+ADDRESS_PARAM_KEYS = {"m", "r", "f", "c"}
+
+# Every client gets its own address, so caches keyed on it tell ledgers apart
+_instances = itertools.count()
+
+
+def _b64(value: bytes) -> str:
+    return base64.b64encode(value).decode()
+
+
+def _json_value(key: str, value: Any) -> Any:  # noqa: ANN401
+    if isinstance(value, dict):
+        return {
+            k: (
+                encoding.encode_address(v)
+                if key == "apar" and k in ADDRESS_PARAM_KEYS
+                else _json_value(k, v)
+            )
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        if key == "apat":
+            return [encoding.encode_address(v) for v in value]
+        return [_json_value(key, v) for v in value]
+    if isinstance(value, bytes):
+        if key in ADDRESS_KEYS:
+            return encoding.encode_address(value)
+        return _b64(value)
+    return value
+
+
+def txn_json(txn: dict[str, Any]) -> dict[str, Any]:
+    """Render a msgpack-shaped transaction the way algod's JSON API does."""
+    return {key: _json_value(key, value) for key, value in txn.items()}
+
+
+def _state_value(value: TealValue) -> dict[str, Any]:
+    if isinstance(value, int):
+        return {"type": 2, "uint": value, "bytes": ""}
+    return {"type": 1, "uint": 0, "bytes": _b64(value)}
+
+
+def _delta_value(value: TealValue | None) -> dict[str, Any]:
+    if value is None:
+        return {"action": 3}
+    if isinstance(value, int):
+        return {"action": 2, "uint": value}
+    return {"action": 1, "bytes": _b64(value)}
+
+
+def result_json(result: ApplyResult, confirmed_round: int) -> dict[str, Any]:
+    info: dict[str, Any] = {
+        "confirmed-round": confirmed_round,
+        "pool-error": "",
+        "txn": {"txn": txn_json(result.txn)},
+    }
+    if result.logs:
+        info["logs"] = [_b64(entry) for entry in result.logs]
+    if result.inner:
+        info["inner-txns"] = [
+            result_json(inner, confirmed_round) for inner in result.inner
+        ]
+    if result.asset_index:
+        info["asset-index"] = result.asset_index
+    if result.application_index:
+        info["application-index"] = result.application_index
+    if result.global_delta:
+        info["global-state-delta"] = [
+            {"key": _b64(key), "value": _delta_value(value)}
+            for key, value in result.global_delta.items()
+        ]
+    return info
+
+
+def _str(value: bytes) -> str:
+    # algod packs Go strings, e.g. logs and state deltas, as msgpack str
+    # whatever their bytes; `algod_request` packs these back to the same bytes
+    return value.decode("utf-8", "surrogateescape")
+
+
+def _block_delta(result: ApplyResult) -> dict[str, Any]:
+    delta: dict[str, Any] = {}
+    if result.global_delta:
+        delta["gd"] = {
+            _str(key): (
+                {"at": 3}
+                if value is None
+                else (
+                    {"at": 2, "ui": value}
+                    if isinstance(value, int)
+                    else {"at": 1, "bs": _str(value)}
+                )
+            )
+            for key, value in result.global_delta.items()
+        }
+    if result.logs:
+        delta["lg"] = [_str(entry) for entry in result.logs]
+    if result.inner:
+        delta["itx"] = [
+            {"txn": inner.txn, **({"dt": d} if (d := _block_delta(inner)) else {})}
+            for inner in result.inner
+        ]
+    return delta
+
+
+def _jsonable(value: Any) -> Any:  # noqa: ANN401
+    if isinstance(value, dict):
+        return {
+            _b64(k) if isinstance(k, bytes) else k: _jsonable(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, bytes):
+        return _b64(value)
+    return value
+
+
+def _not_found(message: str) -> AlgodHTTPError:
+    return AlgodHTTPError(message, 404)
+
+
+class SimAlgodClient(AlgodClient):
+    """Drop-in `AlgodClient` backed by a `Ledger` instead of a node."""
+
+    def __init__(self, ledger: Ledger | None = None):
+        super().__init__("", f"http://simulator/{next(_instances)}")
+        self.ledger = ledger or Ledger()
+
+    def algod_request(
+        self,
+        method: str,
+        requrl: str,
+        params: Any = None,  # noqa: ANN401
+        data: bytes | None = None,
+        headers: dict[str, str] | None = None,
+        response_format: str | None = "json",
+        timeout: int | None = 30,
+    ) -> Any:  # noqa: ANN401
+        path, _, query = requrl.partition("?")
+        merged: dict[str, Any] = {k: v[0] for k, v in parse_qs(query).items()}
+        merged.update(params or {})
+        for pattern, verb, handler in self._routes():
+            match = re.fullmatch(pattern, path)
+            if match and verb == method:
+                response = handler(*match.groups(), params=merged, data=data)
+                if response_format == "msgpack":
+                    return msgpack.packb(
+                        response, use_bin_type=True, unicode_errors="surrogateescape"
+                    )
+                return _jsonable(response)
+        raise AlgodHTTPError(f"simulator does not implement {method} {path}", 404)
+
+    def _routes(self) -> list[tuple[str, str, Any]]:
+        return [
+            (r"/status", "GET", self._status),
+            (r"/status/wait-for-block-after/(\d+)", "GET", self._status_after),
+            (r"/transactions/params", "GET", self._params),
+            (r"/transactions", "POST", self._send),
+            (r"/transactions/simulate", "POST", self._simulate),
+            (r"/transactions/pending/(\w+)", "GET", self._pending),
+            (r"/accounts/(\w+)", "GET", self._account),
+            (r"/accounts/(\w+)/assets/(\d+)", "GET", self._account_asset),
+            (r"/accounts/(\w+)/applications/(\d+)", "GET", self._account_app),
+            (r"/assets/(\d+)", "GET", self._asset),
+            (r"/applications/(\d+)", "GET", self._application),
+            (r"/applications/(\d+)/boxes", "GET", self._boxes),
+            (r"/applications/(\d+)/box", "GET", self._box),
+            (r"/blocks/(\d+)", "GET", self._block),
+            (r"/teal/compile", "POST", self._compile),
+            (r"/teal/disassemble", "POST", self._disassemble),
+            (r"/devmode/blocks/offset", "GET", self._get_offset),
+            (r"/devmode/blocks/offset/(\d+)", "POST", self._set_offset),
+            (r"/health", "GET", lambda **_: {}),
+            (r"/versions", "GET", self._versions),
+            (r"/genesis", "GET", lambda **_: {"id": GENESIS_ID}),
+        ]
+
+    # -- node status -------------------------------------------------------
+    def _status(self, **_: Any) -> dict[str, Any]:
+        return {
+            "last-round": self.ledger.round,
+            "last-version": "future",
+            "next-version": "future",
+            "next-version-round": self.ledger.round + 1,
+            "next-version-supported": True,
+            "time-since-last-round": 0,
+            "catchup-time": 0,
+            "stopped-at-unsupported-round": False,
+        }
+
+    def _status_after(self, _round: str, **_: Any) -> dict[str, Any]:
+        return self._status()
+
+    def _versions(self, **_: Any) -> dict[str, Any]:
+        return {
+            "genesis_id": GENESIS_ID,
+            "genesis_hash_b64": _b64(GENESIS_HASH),
+            "versions": ["v2"],
+            "build": {"major": 0, "minor": 0, "build_number": 0, "channel": "sim"},
+        }
+
+    def _params(self, **_: Any) -> dict[str, Any]:
+        return {
+            "consensus-version": "future",
+            "fee": 0,
+            "genesis-hash": _b64(GENESIS_HASH),
+            "genesis-id": GENESIS_ID,
+            "last-round": self.ledger.round,
+            "min-fee": MIN_TXN_FEE,
+        }
+
+    def _get_offset(self, **_: Any) -> dict[str, Any]:
+        return {"offset": self.ledger.timestamp_offset}
+
+    def _set_offset(self, offset: str, **_: Any) -> dict[str, Any]:
+        self.ledger.timestamp_offset = int(offset)
+        return {}
+
+    # -- transactions ------------------------------------------------------
+    def _send(self, *, data: bytes, **_: Any) -> dict[str, Any]:
+        signed = decode_signed_txns(data)
+        try:
+            txids = self.ledger.submit(signed)
+        except TxnError as err:
+            raise AlgodHTTPError(
+                f"TransactionPool.Remember: transaction {err.txid}: {err.message}", 400
+            ) from err
+        return {"txId": txids[0]}
+
+    def _pending(self, txid: str, **_: Any) -> dict[str, Any]:
+        if txid not in self.ledger.confirmed:
+            raise _not_found("txn does not exist")
+        entry = self.ledger.confirmed[txid]
+        info = result_json(entry.result, entry.round)
+        if "sig" in entry.signed:
+            info["txn"]["sig"] = _b64(entry.signed["sig"])
+        return info
+
+    def _simulate(self, *, data: bytes, **_: Any) -> dict[str, Any]:
+        request = msgpack.unpackb(data, raw=False, strict_map_key=False)
+        extra_budget = request.get("extra-opcode-budget", 0)
+        groups = []
+        for group in request.get("txn-groups", []):
+            signed = list(group["txns"])
+            entry: dict[str, Any] = {}
+            try:
+                results, ctx = self.ledger.simulate(signed, extra_budget=extra_budget)
+            except TxnError as err:
+                index = next(
+                    (
+                        i
+                        for i, stxn in enumerate(signed)
+                        if encoding.msgpack_decode(stxn).get_txid() == err.txid
+                    ),
+                    0,
+                )
+                entry["failure-message"] = f"transaction {err.txid}: {err.message}"
+                entry["failed-at"] = [index]
+                entry["txn-results"] = [
+                    {"txn-result": {"txn": {"txn": txn_json(stxn["txn"])}}}
+                    for stxn in signed
+                ]
+                groups.append(entry)
+                continue
+            entry["txn-results"] = [
+                {
+                    "txn-result": result_json(result, 0),
+                    "app-budget-consumed": result.cost,
+                }
+                for result in results
+            ]
+            entry["app-budget-added"] = ctx.budget_added
+            entry["app-budget-consumed"] = ctx.budget_consumed
+            groups.append(entry)
+        return {
+            "version": 2,
+            "last-round": self.ledger.round,
+            "txn-groups": groups,
+            "eval-overrides": {
+                "allow-empty-signatures": True,
+                **({"extra-opcode-budget": extra_budget} if extra_budget else {}),
+            },
+        }
+
+    # -- accounts, assets and applications ---------------------------------
+    def _account(self, address: str, **_: Any) -> dict[str, Any]:
+        state = self.ledger.state
+        raw = encoding.decode_address(address)
+        data = state.account(raw)
+        created_assets = [a for a in state.assets.values() if a.creator == raw]
+        created_apps = [a for a in state.apps.values() if a.creator == raw]
+        return {
+            "address": address,
+            "amount": data.balance,
+            "amount-without-pending-rewards": data.balance,
+            "min-balance": state.min_balance(raw) if not data.is_empty() else 0,
+            "assets": [
+                {"asset-id": asset_id, "amount": amount, "is-frozen": False}
+                for asset_id, amount in sorted(data.holdings.items())
+            ],
+            "created-assets": [self._asset(str(a.index)) for a in created_assets],
+            "created-apps": [self._application(str(a.index)) for a in created_apps],
+            "apps-local-state": [
+                {
+                    "id": app_id,
+                    "key-value": [
+                        {"key": _b64(k), "value": _state_value(v)}
+                        for k, v in local.items()
+                    ],
+                }
+                for app_id, local in sorted(data.local_states.items())
+            ],
+            "total-assets-opted-in": len(data.holdings),
+            "total-apps-opted-in": len(data.local_states),
+            "total-created-assets": len(created_assets),
+            "total-created-apps": len(created_apps),
+            "pending-rewards": 0,
+            "rewards": 0,
+            "reward-base": 0,
+            "round": state.round,
+            "status": "Offline",
+        }
+
+    def _account_asset(self, address: str, asset_id: str, **_: Any) -> dict[str, Any]:
+        holdings = self.ledger.state.account(encoding.decode_address(address)).holdings
+        if int(asset_id) not in holdings:
+            raise _not_found("account asset info not found")
+        return {
+            "round": self.ledger.round,
+            "asset-holding": {
+                "asset-id": int(asset_id),
+                "amount": holdings[int(asset_id)],
+                "is-frozen": False,
+            },
+        }
+
+    def _account_app(self, address: str, app_id: str, **_: Any) -> dict[str, Any]:
+        local = self.ledger.state.account(encoding.decode_address(address)).local_states
+        if int(app_id) not in local:
+            raise _not_found("account application info not found")
+        return {
+            "round": self.ledger.round,
+            "app-local-state": {
+                "id": int(app_id),
+                "key-value": [
+                    {"key": _b64(k), "value": _state_value(v)}
+                    for k, v in local[int(app_id)].items()
+                ],
+            },
+        }
+
+    def _asset(self, asset_id: str, **_: Any) -> dict[str, Any]:
+        assets = self.ledger.state.assets
+        if int(asset_id) not in assets:
+            raise _not_found("asset does not exist")
+        asset = assets[int(asset_id)]
+        return {
+            "index": asset.index,
+            "params": {
+                "creator": encoding.encode_address(asset.creator),
+                "total": asset.total,
+                "decimals": asset.decimals,
+                "default-frozen": asset.default_frozen,
+                "unit-name": asset.unit_name.decode(errors="replace"),
+                "name": asset.name.decode(errors="replace"),
+                "url": asset.url.decode(errors="replace"),
+                "manager": encoding.encode_address(asset.manager),
+                "reserve": encoding.encode_address(asset.reserve),
+                "freeze": encoding.encode_address(asset.freeze),
+                "clawback": encoding.encode_address(asset.clawback),
+            },
+        }
+
+    def _application(self, app_id: str, **_: Any) -> dict[str, Any]:
+        apps = self.ledger.state.apps
+        if int(app_id) not in apps:
+            raise _not_found("application does not exist")
+        app = apps[int(app_id)]
+        return {
+            "id": app.index,
+            "params": {
+                "creator": encoding.encode_address(app.creator),
+                "approval-program": _b64(app.approval),
+                "clear-state-program": _b64(app.clear),
+                "extra-program-pages": app.extra_pages,
+                "global-state": [
+                    {"key": _b64(key), "value": _state_value(value)}
+                    for key, value in app.global_state.items()
+                ],
+                "global-state-schema": {
+                    "num-uint": app.global_schema[0],
+                    "num-byte-slice": app.global_schema[1],
+                },
+                "local-state-schema": {
+                    "num-uint": app.local_schema[0],
+                    "num-byte-slice": app.local_schema[1],
+                },
+            },
+        }
+
+    def _boxes(self, app_id: str, **_: Any) -> dict[str, Any]:
+        app = self._application(app_id)
+        boxes = self.ledger.state.apps[app["id"]].boxes
+        return {"boxes": [{"name": _b64(name)} for name in sorted(boxes)]}
+
+    def _box(self, app_id: str, *, params: dict[str, Any], **_: Any) -> dict[str, Any]:
+        self._application(app_id)
+        encoded = str(params.get("name", ""))
+        name = base64.b64decode(encoded.removeprefix("b64:"))
+        boxes = self.ledger.state.apps[int(app_id)].boxes
+        if name not in boxes:
+            raise _not_found("box not found")
+        return {
+            "name": _b64(name),
+            "value": _b64(boxes[name]),
+            "round": self.ledger.round,
+        }
+
+    def _block(self, block_round: str, **_: Any) -> dict[str, Any]:
+        number = int(block_round)
+        if number > self.ledger.round:
+            raise _not_found(f"ledger does not have entry {number}")
+        txns = []
+        for entry in self.ledger.blocks.get(number, []):
+            stib: dict[str, Any] = {"txn": entry.signed["txn"], "hgi": True}
+            if "sig" in entry.signed:
+                stib["sig"] = entry.signed["sig"]
+            if entry.result.asset_index:
+                stib["caid"] = entry.result.asset_index
+            if entry.result.application_index:
+                stib["apid"] = entry.result.application_index
+            if delta := _block_delta(entry.result):
+                stib["dt"] = delta
+            txns.append(stib)
+        return {
+            "block": {
+                "rnd": number,
+                "ts": self.ledger.timestamps.get(number, 0),
+                "gen": GENESIS_ID,
+                "gh": GENESIS_HASH,
+                "txns": txns,
+            }
+        }
+
+    # -- TEAL ----------------------------------------------------------------
+    def _compile(
+        self, *, data: bytes, params: dict[str, Any], **_: Any
+    ) -> dict[str, Any]:
+        source = data.decode("utf-8")
+        try:
+            binary = self.ledger.compile(source)
+        except Exception as err:
+            raise AlgodHTTPError(str(err), 400) from err
+        response: dict[str, Any] = {
+            "hash": encoding.encode_address(encoding.checksum(b"Program" + binary)),
+            "result": _b64(binary),
+        }
+        if str(params.get("sourcemap", "")).lower() == "true":
+            lines = source.count("\n") + 1
+            response["sourcemap"] = {
+                "version": 3,
+                "sources": [],
+                "names": [],
+                "mappings": ";".join(["AAAA"] + ["AACA"] * (lines - 1)),
+            }
+        return response
+
+    def _disassemble(self, *, data: bytes, **_: Any) -> dict[str, Any]:
+        if data not in self.ledger.programs:
+            raise AlgodHTTPError("program was not compiled by this simulator", 400)
+        return {"result": self.ledger.programs[data].source}
@@ -0,0 +1,1457 @@
+"""A TEAL interpreter that evaluates the text programs emitted by `app.build()`.
+
+Only the opcodes that PyTeal/Beaker generate for contracts of this size are
+implemented; anything else fails loudly with `unsupported opcode`, so a
+contract change that needs a new opcode shows up as a test failure rather
+than a silent divergence from the AVM.
+"""
+
+import base64
+import hashlib
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from algosdk import encoding
+from Cryptodome.Hash import SHA512, keccak
+
+if TYPE_CHECKING:
+    from simulator.ledger import ApplyResult, GroupContext
+
+TealValue = int | bytes
+
+MAX_UINT64 = 2**64 - 1
+MAX_STACK = 1000
+MAX_BYTES = 4096
+MAX_LOG_SIZE = 1024
+MAX_LOGS = 32
+MAX_INNER_TXNS = 256
+
+NAMED_INTS = {
+    "NoOp": 0,
+    "OptIn": 1,
+    "CloseOut": 2,
+    "ClearState": 3,
+    "UpdateApplication": 4,
+    "DeleteApplication": 5,
+    "unknown": 0,
+    "pay": 1,
+    "keyreg": 2,
+    "acfg": 3,
+    "axfer": 4,
+    "afrz": 5,
+    "appl": 6,
+}
+
+OP_COSTS = {
+    "sha256": 35,
+    "keccak256": 130,
+    "sha512_256": 45,
+    "ed25519verify": 1900,
+    "ed25519verify_bare": 1900,
+    "divmodw": 20,
+    "sqrt": 4,
+    "expw": 10,
+    "b+": 10,
+    "b-": 10,
+    "b/": 20,
+    "b*": 20,
+    "b%": 20,
+    "b|": 6,
+    "b&": 6,
+    "b^": 6,
+    "b~": 4,
+    "bsqrt": 40,
+}
+
+BRANCH_OPS = {"b", "bz", "bnz", "callsub"}
+
+
+class TealError(Exception):
+    """Raised when program evaluation fails; `pc` is the failing source line."""
+
+    def __init__(self, message: str, pc: int = 0):
+        super().__init__(message)
+        self.message = message
+        self.pc = pc
+
+
+def _tokenize(line: str) -> list[str]:
+    tokens: list[str] = []
+    i = 0
+    while i < len(line):
+        ch = line[i]
+        if ch.isspace():
+            i += 1
+        elif line.startswith("//", i):
+            break
+        elif ch == '"':
+            j = i + 1
+            while j < len(line) and line[j] != '"':
+                j += 2 if line[j] == "\\" else 1
+            tokens.append(line[i : j + 1])
+            i = j + 1
+        else:
+            j = i
+            while j < len(line) and not line[j].isspace():
+                j += 1
+            tokens.append(line[i:j])
+            i = j
+    return tokens
+
+
+def _parse_string(token: str) -> bytes:
+    body = token[1:-1]
+    return body.encode("utf-8").decode("unicode_escape").encode("latin-1")
+
+
+def parse_bytes(tokens: list[str]) -> bytes:
+    """Decode a TEAL byte constant (`0x..`, `"..."`, `base64 ..`, `addr ..`)."""
+    first = tokens[0]
+    if first.startswith("0x"):
+        return bytes.fromhex(first[2:])
+    if first.startswith('"'):
+        return _parse_string(first)
+    if first in ("base64", "b64"):
+        return base64.b64decode(tokens[1])
+    if first.startswith(("base64(", "b64(")):
+        return base64.b64decode(first[first.index("(") + 1 : -1])
+    if first in ("base32", "b32"):
+        return base64.b32decode(tokens[1] + "=" * (-len(tokens[1]) % 8))
+    if first == "addr":
+        return encoding.decode_address(tokens[1])
+    raise TealError(f"unable to parse byte constant {' '.join(tokens)}")
+
+
+def parse_int(token: str) -> int:
+    if token in NAMED_INTS:
+        return NAMED_INTS[token]
+    return int(token, 0)
+
+
+def method_selector(signature: str) -> bytes:
+    return hashlib.new("sha512_256", signature.encode()).digest()[:4]
+
+
+@dataclass
+class Op:
+    name: str
+    args: list[str]
+    line: int
+
+
+@dataclass
+class Program:
+    """A parsed TEAL program: a flat op list plus label -> op index."""
+
+    source: str
+    version: int
+    ops: list[Op]
+    labels: dict[str, int]
+
+    @classmethod
+    def parse(cls: type["Program"], source: str) -> "Program":
+        version = 1
+        ops: list[Op] = []
+        labels: dict[str, int] = {}
+        for line_no, raw in enumerate(source.splitlines()):
+            tokens = _tokenize(raw)
+            if not tokens:
+                continue
+            if tokens[0] == "#pragma":
+                if tokens[1] == "version":
+                    version = int(tokens[2])
+                continue
+            while tokens and tokens[0].endswith(":"):
+                labels[tokens.pop(0)[:-1]] = len(ops)
+            if tokens:
+                ops.append(Op(tokens[0], tokens[1:], line_no))
+        for op in ops:
+            targets = op.args if op.name in ("switch", "match") else op.args[:1]
+            if op.name in BRANCH_OPS | {"switch", "match"}:
+                for target in targets:
+                    if target not in labels:
+                        raise TealError(f"unknown label {target}", op.line)
+        return cls(source=source, version=version, ops=ops, labels=labels)
+
+    def size(self) -> int:
+        """Estimate the assembled size in bytes, as `goal clerk compile` would."""
+        return 1 + sum(_op_size(op) for op in self.ops)
+
+
+def _varuint_size(value: int) -> int:
+    size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+
+def _op_size(op: Op) -> int:
+    name, args = op.name, op.args
+    if name == "intcblock":
+        return (
+            1
+            + _varuint_size(len(args))
+            + sum(_varuint_size(parse_int(a)) for a in args)
+        )
+    if name == "bytecblock":
+        values = [parse_bytes([a]) for a in args]
+        return (
+            1
+            + _varuint_size(len(values))
+            + sum(_varuint_size(len(v)) + len(v) for v in values)
+        )
+    if name in ("pushint", "int"):
+        return 1 + _varuint_size(parse_int(args[0]))
+    if name in ("pushbytes", "byte", "method", "addr"):
+        length = (
+            4 if name == "method" else 32 if name == "addr" else len(parse_bytes(args))
+        )
+        return 1 + _varuint_size(length) + length
+    if name in BRANCH_OPS:
+        return 3
+    if name in ("switch", "match"):
+        return 2 + 2 * len(args)
+    return 1 + len(args)
+
+
+@dataclass
+class Frame:
+    return_pc: int
+    height: int = 0
+    args: int = 0
+    returns: int = 0
+    has_proto: bool = False
+
+
+@dataclass
+class EvalResult:
+    approved: bool
+    logs: list[bytes]
+    cost: int
+    inner_txns: list["ApplyResult"] = field(default_factory=list)
+
+
+def _itob(value: int) -> bytes:
+    return value.to_bytes(8, "big")
+
+
+class Evaluator:
+    """Runs one program for one transaction inside a group."""
+
+    def __init__(
+        self,
+        program: Program,
+        ctx: "GroupContext",
+        group_index: int,
+        app_id: int,
+    ):
+        self.program = program
+        self.ctx = ctx
+        self.group_index = group_index
+        self.app_id = app_id
+        self.txn = ctx.txns[group_index]
+        self.stack: list[TealValue] = []
+        self.scratch: list[TealValue] = [0] * 256
+        self.frames: list[Frame] = []
+        self.intc: list[int] = []
+        self.bytec: list[bytes] = []
+        self.logs: list[bytes] = []
+        self.pc = 0
+        self.cost = 0
+        self.pending_inner: list[dict[str, Any]] = []
+        self.inner_groups: list[list["ApplyResult"]] = []
+        self.inner_results: list["ApplyResult"] = []
+
+    # -- stack helpers ---------------------------------------------------
+    def push(self, value: TealValue) -> None:
+        if isinstance(value, bytes | bytearray):
+            if len(value) > MAX_BYTES:
+                raise TealError("byte value exceeds 4096 bytes")
+            value = bytes(value)
+        elif value < 0 or value > MAX_UINT64:
+            raise TealError("integer overflow")
+        if len(self.stack) >= MAX_STACK:
+            raise TealError("stack overflow")
+        self.stack.append(value)
+
+    def pop(self) -> TealValue:
+        if not self.stack:
+            raise TealError("stack underflow")
+        if self.frames and self.frames[-1].has_proto:
+            if len(self.stack) <= self.frames[-1].height:
+                raise TealError("stack underflow into caller frame")
+        return self.stack.pop()
+
+    def pop_int(self) -> int:
+        value = self.pop()
+        if not isinstance(value, int):
+            raise TealError("expected uint64, got bytes")
+        return value
+
+    def pop_bytes(self) -> bytes:
+        value = self.pop()
+        if not isinstance(value, bytes):
+            raise TealError("expected bytes, got uint64")
+        return value
+
+    # -- main loop -------------------------------------------------------
+    def run(self) -> EvalResult:
+        ops = self.program.ops
+        op = ops[0] if ops else None
+        try:
+            while self.pc < len(ops):
+                op = ops[self.pc]
+                self.ctx.consume_budget(OP_COSTS.get(op.name, 1))
+                self.cost += OP_COSTS.get(op.name, 1)
+                handler = _HANDLERS.get(op.name)
+                if handler is None:
+                    raise TealError(f"unsupported opcode {op.name}")
+                self.pc += 1
+                if handler(self, op.args) is _STOP:
+                    break
+            else:
+                if len(self.stack) != 1:
+                    raise TealError(
+                        f"stack len is {len(self.stack)} instead of 1 at end of program"
+                    )
+        except TealError as err:
+            err.pc = op.line if op else 0
+            raise
+        if len(self.stack) != 1:
+            raise TealError(f"stack len is {len(self.stack)} instead of 1 at return")
+        result = self.stack[-1]
+        if not isinstance(result, int):
+            raise TealError("program returned bytes")
+        return EvalResult(
+            approved=result != 0,
+            logs=self.logs,
+            cost=self.cost,
+            inner_txns=self.inner_results,
+        )
+
+    def jump(self, label: str) -> None:
+        self.pc = self.program.labels[label]
+
+    # -- resource lookups -------------------------------------------------
+    def resolve_account(self, value: TealValue) -> bytes:
+        if isinstance(value, int):
+            accounts = [self.txn.get("snd", b""), *list(self.txn.get("apat", []))]
+            if value >= len(accounts):
+                raise TealError(f"invalid Account reference {value}")
+            return accounts[value]
+        if len(value) != 32:
+            raise TealError("invalid Account reference")
+        self.ctx.require_account(self, value)
+        return value
+
+    def resolve_asset(self, value: int, *, by_index: bool) -> int:
+        assets = list(self.txn.get("apas", []))
+        if by_index and value < len(assets):
+            return assets[value]
+        self.ctx.require_asset(self, value)
+        return value
+
+    def resolve_app(self, value: int) -> int:
+        apps = [self.app_id, *list(self.txn.get("apfa", []))]
+        if value < len(apps) and self.program.version >= 4:
+            return apps[value]
+        self.ctx.require_app(self, value)
+        return value
+
+    def resolve_box(self, name: bytes) -> bytes:
+        if not name:
+            raise TealError("box names may not be zero length")
+        if len(name) > 64:
+            raise TealError("name too long")
+        self.ctx.require_box(self, name)
+        return name
+
+
+_STOP = object()
+_HANDLERS: dict[str, Callable[[Evaluator, list[str]], object]] = {}
+
+
+def opcode(*names: str) -> Callable:
+    def register(fn: Callable[[Evaluator, list[str]], object]) -> Callable:
+        for name in names:
+            _HANDLERS[name] = fn
+        return fn
+
+    return register
+
+
+def _binary_int(name: str, fn: Callable[[int, int], int]) -> None:
+    def handler(ev: Evaluator, _args: list[str]) -> None:
+        b = ev.pop_int()
+        a = ev.pop_int()
+        ev.push(fn(a, b))
+
+    _HANDLERS[name] = handler
+
+
+def _div(a: int, b: int) -> int:
+    if b == 0:
+        raise TealError("/ 0")
+    return a // b
+
+
+def _mod(a: int, b: int) -> int:
+    if b == 0:
+        raise TealError("% 0")
+    return a % b
+
+
+def _sub(a: int, b: int) -> int:
+    if b > a:
+        raise TealError("- would result negative")
+    return a - b
+
+
+def _add(a: int, b: int) -> int:
+    if a + b > MAX_UINT64:
+        raise TealError("+ overflowed")
+    return a + b
+
+
+def _mul(a: int, b: int) -> int:
+    if a * b > MAX_UINT64:
+        raise TealError("* overflowed")
+    return a * b
+
+
+def _exp(a: int, b: int) -> int:
+    if a == 0 and b == 0:
+        raise TealError("0^0 is undefined")
+    result = a**b
+    if result > MAX_UINT64:
+        raise TealError("^ overflowed")
+    return result
+
+
+def _shl(a: int, b: int) -> int:
+    if b > 63:
+        raise TealError("shl arg too big")
+    return (a << b) & MAX_UINT64
+
+
+def _shr(a: int, b: int) -> int:
+    if b > 63:
+        raise TealError("shr arg too big")
+    return a >> b
+
+
+for _name, _fn in {
+    "+": _add,
+    "-": _sub,
+    "*": _mul,
+    "/": _div,
+    "%": _mod,
+    "<": lambda a, b: int(a < b),
+    ">": lambda a, b: int(a > b),
+    "<=": lambda a, b: int(a <= b),
+    ">=": lambda a, b: int(a >= b),
+    "&&": lambda a, b: int(bool(a) and bool(b)),
+    "||": lambda a, b: int(bool(a) or bool(b)),
+    "|": lambda a, b: a | b,
+    "&": lambda a, b: a & b,
+    "^": lambda a, b: a ^ b,
+    "exp": _exp,
+    "shl": _shl,
+    "shr": _shr,
+}.items():
+    _binary_int(_name, _fn)
+
+
+def _pop_comparable(ev: Evaluator) -> tuple[TealValue, TealValue]:
+    b = ev.pop()
+    a = ev.pop()
+    if type(a) is not type(b):
+        raise TealError("cannot compare uint64 to bytes")
+    return a, b
+
+
+@opcode("==")
+def _eq(ev: Evaluator, _args: list[str]) -> None:
+    a, b = _pop_comparable(ev)
+    ev.push(int(a == b))
+
+
+@opcode("!=")
+def _ne(ev: Evaluator, _args: list[str]) -> None:
+    a, b = _pop_comparable(ev)
+    ev.push(int(a != b))
+
+
+@opcode("!")
+def _not(ev: Evaluator, _args: list[str]) -> None:
+    ev.push(int(ev.pop_int() == 0))
+
+
+@opcode("~")
+def _bitnot(ev: Evaluator, _args: list[str]) -> None:
+    ev.push(ev.pop_int() ^ MAX_UINT64)
+
+
+@opcode("sqrt")
+def _sqrt(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.pop_int()
+    root = int(value**0.5)
+    while root * root > value:
+        root -= 1
+    while (root + 1) * (root + 1) <= value:
+        root += 1
+    ev.push(root)
+
+
+@opcode("bitlen")
+def _bitlen(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.pop()
+    ev.push(
+        value.bit_length()
+        if isinstance(value, int)
+        else int.from_bytes(value, "big").bit_length()
+    )
+
+
+@opcode("mulw")
+def _mulw(ev: Evaluator, _args: list[str]) -> None:
+    b = ev.pop_int()
+    a = ev.pop_int()
+    product = a * b
+    ev.push(product >> 64)
+    ev.push(product & MAX_UINT64)
+
+
+@opcode("addw")
+def _addw(ev: Evaluator, _args: list[str]) -> None:
+    b = ev.pop_int()
+    a = ev.pop_int()
+    total = a + b
+    ev.push(total >> 64)
+    ev.push(total & MAX_UINT64)
+
+
+@opcode("divw")
+def _divw(ev: Evaluator, _args: list[str]) -> None:
+    c = ev.pop_int()
+    lo = ev.pop_int()
+    hi = ev.pop_int()
+    if c == 0:
+        raise TealError("divw 0")
+    quotient = ((hi << 64) | lo) // c
+    if quotient > MAX_UINT64:
+        raise TealError("divw overflow")
+    ev.push(quotient)
+
+
+@opcode("divmodw")
+def _divmodw(ev: Evaluator, _args: list[str]) -> None:
+    d_lo = ev.pop_int()
+    d_hi = ev.pop_int()
+    n_lo = ev.pop_int()
+    n_hi = ev.pop_int()
+    divisor = (d_hi << 64) | d_lo
+    if divisor == 0:
+        raise TealError("/ 0")
+    quotient, remainder = divmod((n_hi << 64) | n_lo, divisor)
+    ev.push(quotient >> 64)
+    ev.push(quotient & MAX_UINT64)
+    ev.push(remainder >> 64)
+    ev.push(remainder & MAX_UINT64)
+
+
+@opcode("expw")
+def _expw(ev: Evaluator, _args: list[str]) -> None:
+    b = ev.pop_int()
+    a = ev.pop_int()
+    result = _exp(a, b) if a**b <= MAX_UINT64 else a**b
+    if result >= 2**128:
+        raise TealError("expw overflowed")
+    ev.push(result >> 64)
+    ev.push(result & MAX_UINT64)
+
+
+# -- byte math ----------------------------------------------------------
+def _bigint(value: bytes) -> int:
+    if len(value) > 64:
+        raise TealError("math attempted on large byte-array")
+    return int.from_bytes(value, "big")
+
+
+def _bigbytes(value: int) -> bytes:
+    if value < 0:
+        raise TealError("byte math would have negative result")
+    return value.to_bytes((value.bit_length() + 7) // 8, "big") if value else b""
+
+
+def _binary_bytes_math(name: str, fn: Callable[[int, int], int]) -> None:
+    def handler(ev: Evaluator, _args: list[str]) -> None:
+        b = _bigint(ev.pop_bytes())
+        a = _bigint(ev.pop_bytes())
+        ev.push(_bigbytes(fn(a, b)))
+
+    _HANDLERS[name] = handler
+
+
+def _binary_bytes_compare(name: str, fn: Callable[[int, int], bool]) -> None:
+    def handler(ev: Evaluator, _args: list[str]) -> None:
+        b = _bigint(ev.pop_bytes())
+        a = _bigint(ev.pop_bytes())
+        ev.push(int(fn(a, b)))
+
+    _HANDLERS[name] = handler
+
+
+_binary_bytes_math("b+", lambda a, b: a + b)
+_binary_bytes_math("b-", lambda a, b: a - b)
+_binary_bytes_math("b*", lambda a, b: a * b)
+_binary_bytes_math("b/", _div)
+_binary_bytes_math("b%", _mod)
+_binary_bytes_compare("b<", lambda a, b: a < b)
+_binary_bytes_compare("b>", lambda a, b: a > b)
+_binary_bytes_compare("b<=", lambda a, b: a <= b)
+_binary_bytes_compare("b>=", lambda a, b: a >= b)
+_binary_bytes_compare("b==", lambda a, b: a == b)
+_binary_bytes_compare("b!=", lambda a, b: a != b)
+
+
+def _binary_bytes_bitwise(name: str, fn: Callable[[int, int], int]) -> None:
+    def handler(ev: Evaluator, _args: list[str]) -> None:
+        b = ev.pop_bytes()
+        a = ev.pop_bytes()
+        width = max(len(a), len(b))
+        a, b = a.rjust(width, b"\0"), b.rjust(width, b"\0")
+        ev.push(bytes(fn(x, y) for x, y in zip(a, b, strict=True)))
+
+    _HANDLERS[name] = handler
+
+
+_binary_bytes_bitwise("b|", lambda x, y: x | y)
+_binary_bytes_bitwise("b&", lambda x, y: x & y)
+_binary_bytes_bitwise("b^", lambda x, y: x ^ y)
+
+
+@opcode("b~")
+def _bbitnot(ev: Evaluator, _args: list[str]) -> None:
+    ev.push(bytes(x ^ 0xFF for x in ev.pop_bytes()))
+
+
+@opcode("bzero")
+def _bzero(ev: Evaluator, _args: list[str]) -> None:
+    ev.push(bytes(ev.pop_int()))
+
+
+# -- crypto -------------------------------------------------------------
+@opcode("sha256")
+def _sha256(ev: Evaluator, _args: list[str]) -> None:
+    ev.push(hashlib.sha256(ev.pop_bytes()).digest())
+
+
+@opcode("sha512_256")
+def _sha512_256(ev: Evaluator, _args: list[str]) -> None:
+    ev.push(SHA512.new(ev.pop_bytes(), truncate="256").digest())
+
+
+@opcode("keccak256")
+def _keccak256(ev: Evaluator, _args: list[str]) -> None:
+    ev.push(keccak.new(data=ev.pop_bytes(), digest_bits=256).digest())
+
+
+# -- constants ----------------------------------------------------------
+@opcode("intcblock")
+def _intcblock(ev: Evaluator, args: list[str]) -> None:
+    ev.intc = [parse_int(a) for a in args]
+
+
+@opcode("bytecblock")
+def _bytecblock(ev: Evaluator, args: list[str]) -> None:
+    ev.bytec = [parse_bytes([a]) for a in args]
+
+
+def _intc(ev: Evaluator, index: int) -> None:
+    if index >= len(ev.intc):
+        raise TealError(f"intc {index} beyond {len(ev.intc)} constants")
+    ev.push(ev.intc[index])
+
+
+def _bytec(ev: Evaluator, index: int) -> None:
+    if index >= len(ev.bytec):
+        raise TealError(f"bytec {index} beyond {len(ev.bytec)} constants")
+    ev.push(ev.bytec[index])
+
+
+def _constant(
+    load: Callable[[Evaluator, int], None], index: int | None
+) -> Callable[[Evaluator, list[str]], None]:
+    def handler(ev: Evaluator, args: list[str]) -> None:
+        load(ev, int(args[0]) if index is None else index)
+
+    return handler
+
+
+for _i in range(4):
+    _HANDLERS[f"intc_{_i}"] = _constant(_intc, _i)
+    _HANDLERS[f"bytec_{_i}"] = _constant(_bytec, _i)
+_HANDLERS["intc"] = _constant(_intc, None)
+_HANDLERS["bytec"] = _constant(_bytec, None)
+
+
+@opcode("pushint", "int")
+def _pushint(ev: Evaluator, args: list[str]) -> None:
+    ev.push(parse_int(args[0]))
+
+
+@opcode("pushints")
+def _pushints(ev: Evaluator, args: list[str]) -> None:
+    for arg in args:
+        ev.push(parse_int(arg))
+
+
+@opcode("pushbytes", "byte")
+def _pushbytes(ev: Evaluator, args: list[str]) -> None:
+    ev.push(parse_bytes(args))
+
+
+@opcode("pushbytess")
+def _pushbytess(ev: Evaluator, args: list[str]) -> None:
+    for arg in args:
+        ev.push(parse_bytes([arg]))
+
+
+@opcode("addr")
+def _addr(ev: Evaluator, args: list[str]) -> None:
+    ev.push(encoding.decode_address(args[0]))
+
+
+@opcode("method")
+def _method(ev: Evaluator, args: list[str]) -> None:
+    ev.push(method_selector(_parse_string(args[0]).decode()))
+
+
+# -- flow control -------------------------------------------------------
+@opcode("err")
+def _err(_ev: Evaluator, _args: list[str]) -> None:
+    raise TealError("err opcode executed")
+
+
+@opcode("assert")
+def _assert(ev: Evaluator, _args: list[str]) -> None:
+    if ev.pop_int() == 0:
+        raise TealError("assert failed")
+
+
+@opcode("return")
+def _return(ev: Evaluator, _args: list[str]) -> object:
+    value = ev.pop()
+    ev.stack = [value]
+    return _STOP
+
+
+@opcode("b")
+def _branch(ev: Evaluator, args: list[str]) -> None:
+    ev.jump(args[0])
+
+
+@opcode("bz")
+def _bz(ev: Evaluator, args: list[str]) -> None:
+    if ev.pop_int() == 0:
+        ev.jump(args[0])
+
+
+@opcode("bnz")
+def _bnz(ev: Evaluator, args: list[str]) -> None:
+    if ev.pop_int() != 0:
+        ev.jump(args[0])
+
+
+@opcode("switch")
+def _switch(ev: Evaluator, args: list[str]) -> None:
+    index = ev.pop_int()
+    if index < len(args):
+        ev.jump(args[index])
+
+
+@opcode("match")
+def _match(ev: Evaluator, args: list[str]) -> None:
+    candidates = [ev.pop() for _ in args][::-1]
+    target = ev.pop()
+    for label, candidate in zip(args, candidates, strict=True):
+        if candidate == target:
+            ev.jump(label)
+            return
+
+
+@opcode("callsub")
+def _callsub(ev: Evaluator, args: list[str]) -> None:
+    if len(ev.frames) >= 8 * 1024:
+        raise TealError("callsub stack overflow")
+    ev.frames.append(Frame(return_pc=ev.pc, height=len(ev.stack)))
+    ev.jump(args[0])
+
+
+@opcode("proto")
+def _proto(ev: Evaluator, args: list[str]) -> None:
+    if not ev.frames:
+        raise TealError("proto was executed without a callsub")
+    frame = ev.frames[-1]
+    frame.args, frame.returns = int(args[0]), int(args[1])
+    if len(ev.stack) < frame.args:
+        raise TealError("callsub to proto that requires more args than available")
+    frame.height = len(ev.stack)
+    frame.has_proto = True
+
+
+@opcode("retsub")
+def _retsub(ev: Evaluator, _args: list[str]) -> None:
+    if not ev.frames:
+        raise TealError("retsub with empty callstack")
+    frame = ev.frames.pop()
+    if frame.has_proto:
+        if len(ev.stack) < frame.height + frame.returns:
+            raise TealError("retsub executed with stack below frame")
+        # The return values are the first R above the frame, locals follow
+        results = ev.stack[frame.height : frame.height + frame.returns]
+        del ev.stack[frame.height - frame.args :]
+        ev.stack.extend(results)
+    ev.pc = frame.return_pc
+
+
+def _frame_index(ev: Evaluator, offset: int) -> int:
+    if not ev.frames or not ev.frames[-1].has_proto:
+        raise TealError("frame_dig with empty callstack")
+    index = ev.frames[-1].height + offset
+    if index < ev.frames[-1].height - ev.frames[-1].args or index >= len(ev.stack):
+        raise TealError(f"frame offset {offset} out of range")
+    return index
+
+
+@opcode("frame_dig")
+def _frame_dig(ev: Evaluator, args: list[str]) -> None:
+    ev.push(ev.stack[_frame_index(ev, int(args[0]))])
+
+
+@opcode("frame_bury")
+def _frame_bury(ev: Evaluator, args: list[str]) -> None:
+    value = ev.pop()
+    ev.stack[_frame_index(ev, int(args[0]))] = value
+
+
+# -- stack manipulation -------------------------------------------------
+@opcode("pop")
+def _pop(ev: Evaluator, _args: list[str]) -> None:
+    ev.pop()
+
+
+@opcode("popn")
+def _popn(ev: Evaluator, args: list[str]) -> None:
+    for _ in range(int(args[0])):
+        ev.pop()
+
+
+@opcode("dup")
+def _dup(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.pop()
+    ev.push(value)
+    ev.push(value)
+
+
+@opcode("dupn")
+def _dupn(ev: Evaluator, args: list[str]) -> None:
+    value = ev.pop()
+    for _ in range(int(args[0]) + 1):
+        ev.push(value)
+
+
+@opcode("dup2")
+def _dup2(ev: Evaluator, _args: list[str]) -> None:
+    b = ev.pop()
+    a = ev.pop()
+    for value in (a, b, a, b):
+        ev.push(value)
+
+
+@opcode("dig")
+def _dig(ev: Evaluator, args: list[str]) -> None:
+    depth = int(args[0])
+    if depth >= len(ev.stack):
+        raise TealError(f"dig {depth} with stack size {len(ev.stack)}")
+    ev.push(ev.stack[-1 - depth])
+
+
+@opcode("bury")
+def _bury(ev: Evaluator, args: list[str]) -> None:
+    depth = int(args[0])
+    value = ev.pop()
+    if depth == 0 or depth > len(ev.stack):
+        raise TealError(f"bury {depth} with stack size {len(ev.stack)}")
+    ev.stack[-depth] = value
+
+
+@opcode("swap")
+def _swap(ev: Evaluator, _args: list[str]) -> None:
+    b = ev.pop()
+    a = ev.pop()
+    ev.push(b)
+    ev.push(a)
+
+
+@opcode("select")
+def _select(ev: Evaluator, _args: list[str]) -> None:
+    condition = ev.pop_int()
+    b = ev.pop()
+    a = ev.pop()
+    ev.push(b if condition else a)
+
+
+@opcode("cover")
+def _cover(ev: Evaluator, args: list[str]) -> None:
+    depth = int(args[0])
+    if depth >= len(ev.stack):
+        raise TealError(f"cover {depth} with stack size {len(ev.stack)}")
+    value = ev.stack.pop()
+    ev.stack.insert(len(ev.stack) - depth, value)
+
+
+@opcode("uncover")
+def _uncover(ev: Evaluator, args: list[str]) -> None:
+    depth = int(args[0])
+    if depth >= len(ev.stack):
+        raise TealError(f"uncover {depth} with stack size {len(ev.stack)}")
+    ev.stack.append(ev.stack.pop(-1 - depth))
+
+
+@opcode("load")
+def _load(ev: Evaluator, args: list[str]) -> None:
+    ev.push(ev.scratch[int(args[0])])
+
+
+@opcode("store")
+def _store(ev: Evaluator, args: list[str]) -> None:
+    ev.scratch[int(args[0])] = ev.pop()
+
+
+@opcode("loads")
+def _loads(ev: Evaluator, _args: list[str]) -> None:
+    ev.push(ev.scratch[ev.pop_int()])
+
+
+@opcode("stores")
+def _stores(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.pop()
+    ev.scratch[ev.pop_int()] = value
+
+
+# -- byte manipulation --------------------------------------------------
+@opcode("len")
+def _len(ev: Evaluator, _args: list[str]) -> None:
+    ev.push(len(ev.pop_bytes()))
+
+
+@opcode("itob")
+def _itob_op(ev: Evaluator, _args: list[str]) -> None:
+    ev.push(_itob(ev.pop_int()))
+
+
+@opcode("btoi")
+def _btoi(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.pop_bytes()
+    if len(value) > 8:
+        raise TealError(f"btoi arg too long, got [{len(value)}]bytes")
+    ev.push(int.from_bytes(value, "big"))
+
+
+@opcode("concat")
+def _concat(ev: Evaluator, _args: list[str]) -> None:
+    b = ev.pop_bytes()
+    a = ev.pop_bytes()
+    ev.push(a + b)
+
+
+def _substring(ev: Evaluator, value: bytes, start: int, end: int) -> None:
+    if end < start:
+        raise TealError("substring end before start")
+    if end > len(value):
+        raise TealError("substring range beyond length of string")
+    ev.push(value[start:end])
+
+
+@opcode("substring")
+def _substring_op(ev: Evaluator, args: list[str]) -> None:
+    _substring(ev, ev.pop_bytes(), int(args[0]), int(args[1]))
+
+
+@opcode("substring3")
+def _substring3(ev: Evaluator, _args: list[str]) -> None:
+    end = ev.pop_int()
+    start = ev.pop_int()
+    _substring(ev, ev.pop_bytes(), start, end)
+
+
+def _extract(ev: Evaluator, value: bytes, start: int, length: int) -> None:
+    if start + length > len(value):
+        raise TealError("extraction end exceeds target length")
+    ev.push(value[start : start + length])
+
+
+@opcode("extract")
+def _extract_op(ev: Evaluator, args: list[str]) -> None:
+    value = ev.pop_bytes()
+    start, length = int(args[0]), int(args[1])
+    if length == 0:
+        if start > len(value):
+            raise TealError("extraction start exceeds target length")
+        length = len(value) - start
+    _extract(ev, value, start, length)
+
+
+@opcode("extract3")
+def _extract3(ev: Evaluator, _args: list[str]) -> None:
+    length = ev.pop_int()
+    start = ev.pop_int()
+    _extract(ev, ev.pop_bytes(), start, length)
+
+
+def _extract_uint(width: int) -> Callable[[Evaluator, list[str]], None]:
+    def handler(ev: Evaluator, _args: list[str]) -> None:
+        start = ev.pop_int()
+        value = ev.pop_bytes()
+        if start + width > len(value):
+            raise TealError("extraction end exceeds target length")
+        ev.push(int.from_bytes(value[start : start + width], "big"))
+
+    return handler
+
+
+_HANDLERS["extract_uint16"] = _extract_uint(2)
+_HANDLERS["extract_uint32"] = _extract_uint(4)
+_HANDLERS["extract_uint64"] = _extract_uint(8)
+
+
+def _replace(ev: Evaluator, value: bytes, start: int, patch: bytes) -> None:
+    if start + len(patch) > len(value):
+        raise TealError("replacement end exceeds original length")
+    ev.push(value[:start] + patch + value[start + len(patch) :])
+
+
+@opcode("replace2")
+def _replace2(ev: Evaluator, args: list[str]) -> None:
+    patch = ev.pop_bytes()
+    _replace(ev, ev.pop_bytes(), int(args[0]), patch)
+
+
+@opcode("replace3")
+def _replace3(ev: Evaluator, _args: list[str]) -> None:
+    patch = ev.pop_bytes()
+    start = ev.pop_int()
+    _replace(ev, ev.pop_bytes(), start, patch)
+
+
+@opcode("getbit")
+def _getbit(ev: Evaluator, _args: list[str]) -> None:
+    index = ev.pop_int()
+    target = ev.pop()
+    if isinstance(target, int):
+        if index > 63:
+            raise TealError("getbit index > 63 with uint64")
+        ev.push((target >> index) & 1)
+        return
+    if index >= len(target) * 8:
+        raise TealError("getbit index beyond byteslice")
+    ev.push((target[index // 8] >> (7 - index % 8)) & 1)
+
+
+@opcode("setbit")
+def _setbit(ev: Evaluator, _args: list[str]) -> None:
+    bit = ev.pop_int()
+    index = ev.pop_int()
+    target = ev.pop()
+    if bit > 1:
+        raise TealError("setbit value > 1")
+    if isinstance(target, int):
+        if index > 63:
+            raise TealError("setbit index > 63 with uint64")
+        ev.push(target | (1 << index) if bit else target & ~(1 << index))
+        return
+    if index >= len(target) * 8:
+        raise TealError("setbit index beyond byteslice")
+    data = bytearray(target)
+    mask = 1 << (7 - index % 8)
+    data[index // 8] = data[index // 8] | mask if bit else data[index // 8] & ~mask
+    ev.push(bytes(data))
+
+
+@opcode("getbyte")
+def _getbyte(ev: Evaluator, _args: list[str]) -> None:
+    index = ev.pop_int()
+    target = ev.pop_bytes()
+    if index >= len(target):
+        raise TealError("getbyte index beyond array length")
+    ev.push(target[index])
+
+
+@opcode("setbyte")
+def _setbyte(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.pop_int()
+    index = ev.pop_int()
+    target = bytearray(ev.pop_bytes())
+    if index >= len(target):
+        raise TealError("setbyte index beyond array length")
+    if value > 255:
+        raise TealError("setbyte value > 255")
+    target[index] = value
+    ev.push(bytes(target))
+
+
+@opcode("log")
+def _log(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.pop_bytes()
+    if len(ev.logs) >= MAX_LOGS:
+        raise TealError("too many log calls in program. up to 32 is allowed.")
+    if sum(len(entry) for entry in ev.logs) + len(value) > MAX_LOG_SIZE:
+        raise TealError("program logs too large. 1024 bytes is allowed")
+    ev.logs.append(value)
+
+
+# -- transaction fields -------------------------------------------------
+def _txn_field(
+    ev: Evaluator,
+    txn: dict[str, Any],
+    name: str,
+    index: int,
+    result: "ApplyResult | None" = None,
+) -> None:
+    ev.push(ev.ctx.txn_field(txn, name, index, result))
+
+
+def _array_index(args: list[str], position: int) -> int:
+    return int(args[position]) if len(args) > position else -1
+
+
+@opcode("txn")
+def _txn(ev: Evaluator, args: list[str]) -> None:
+    _txn_field(ev, ev.txn, args[0], _array_index(args, 1))
+
+
+@opcode("txna")
+def _txna(ev: Evaluator, args: list[str]) -> None:
+    _txn_field(ev, ev.txn, args[0], int(args[1]))
+
+
+@opcode("txnas")
+def _txnas(ev: Evaluator, args: list[str]) -> None:
+    _txn_field(ev, ev.txn, args[0], ev.pop_int())
+
+
+def _group_txn(ev: Evaluator, position: int, name: str, index: int) -> None:
+    if position >= len(ev.ctx.txns):
+        raise TealError(
+            f"gtxn lookup TxnGroup[{position}] but it only has {len(ev.ctx.txns)}"
+        )
+    _txn_field(ev, ev.ctx.txns[position], name, index, ev.ctx.results[position])
+
+
+@opcode("gtxn")
+def _gtxn(ev: Evaluator, args: list[str]) -> None:
+    _group_txn(ev, int(args[0]), args[1], _array_index(args, 2))
+
+
+@opcode("gtxna")
+def _gtxna(ev: Evaluator, args: list[str]) -> None:
+    _group_txn(ev, int(args[0]), args[1], int(args[2]))
+
+
+@opcode("gtxnas")
+def _gtxnas(ev: Evaluator, args: list[str]) -> None:
+    index = ev.pop_int()
+    _group_txn(ev, int(args[0]), args[1], index)
+
+
+@opcode("gtxns")
+def _gtxns(ev: Evaluator, args: list[str]) -> None:
+    _group_txn(ev, ev.pop_int(), args[0], _array_index(args, 1))
+
+
+@opcode("gtxnsa")
+def _gtxnsa(ev: Evaluator, args: list[str]) -> None:
+    _group_txn(ev, ev.pop_int(), args[0], int(args[1]))
+
+
+@opcode("gtxnsas")
+def _gtxnsas(ev: Evaluator, args: list[str]) -> None:
+    index = ev.pop_int()
+    _group_txn(ev, ev.pop_int(), args[0], index)
+
+
+@opcode("global")
+def _global(ev: Evaluator, args: list[str]) -> None:
+    ev.push(ev.ctx.global_field(args[0], ev.app_id, ev.group_index))
+
+
+@opcode("args", "arg", "arg_0", "arg_1", "arg_2", "arg_3")
+def _args(_ev: Evaluator, _args: list[str]) -> None:
+    raise TealError("logic signature arguments are not available in applications")
+
+
+# -- state access -------------------------------------------------------
+@opcode("app_global_get")
+def _app_global_get(ev: Evaluator, _args: list[str]) -> None:
+    key = ev.pop_bytes()
+    value = ev.ctx.state.global_get(ev.app_id, key)
+    ev.push(0 if value is None else value)
+
+
+@opcode("app_global_get_ex")
+def _app_global_get_ex(ev: Evaluator, _args: list[str]) -> None:
+    key = ev.pop_bytes()
+    app_id = ev.resolve_app(ev.pop_int())
+    value = ev.ctx.state.global_get(app_id, key)
+    ev.push(0 if value is None else value)
+    ev.push(int(value is not None))
+
+
+@opcode("app_global_put")
+def _app_global_put(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.pop()
+    key = ev.pop_bytes()
+    if len(key) > 64:
+        raise TealError("key too long")
+    if isinstance(value, bytes) and len(key) + len(value) > 128:
+        raise TealError("key/value total too long")
+    ev.ctx.state.global_put(ev.app_id, key, value)
+
+
+@opcode("app_global_del")
+def _app_global_del(ev: Evaluator, _args: list[str]) -> None:
+    ev.ctx.state.global_del(ev.app_id, ev.pop_bytes())
+
+
+@opcode("app_local_get")
+def _app_local_get(ev: Evaluator, _args: list[str]) -> None:
+    key = ev.pop_bytes()
+    account = ev.resolve_account(ev.pop())
+    value = ev.ctx.state.local_get(account, ev.app_id, key)
+    ev.push(0 if value is None else value)
+
+
+@opcode("app_local_get_ex")
+def _app_local_get_ex(ev: Evaluator, _args: list[str]) -> None:
+    key = ev.pop_bytes()
+    app_id = ev.resolve_app(ev.pop_int())
+    account = ev.resolve_account(ev.pop())
+    value = ev.ctx.state.local_get(account, app_id, key)
+    ev.push(0 if value is None else value)
+    ev.push(int(value is not None))
+
+
+@opcode("app_local_put")
+def _app_local_put(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.pop()
+    key = ev.pop_bytes()
+    account = ev.resolve_account(ev.pop())
+    ev.ctx.state.local_put(account, ev.app_id, key, value)
+
+
+@opcode("app_local_del")
+def _app_local_del(ev: Evaluator, _args: list[str]) -> None:
+    key = ev.pop_bytes()
+    account = ev.resolve_account(ev.pop())
+    ev.ctx.state.local_del(account, ev.app_id, key)
+
+
+@opcode("app_opted_in")
+def _app_opted_in(ev: Evaluator, _args: list[str]) -> None:
+    app_id = ev.resolve_app(ev.pop_int())
+    account = ev.resolve_account(ev.pop())
+    ev.push(int(ev.ctx.state.opted_in(account, app_id)))
+
+
+@opcode("balance")
+def _balance(ev: Evaluator, _args: list[str]) -> None:
+    account = ev.resolve_account(ev.pop())
+    ev.push(ev.ctx.state.account(account).balance)
+
+
+@opcode("min_balance")
+def _min_balance(ev: Evaluator, _args: list[str]) -> None:
+    account = ev.resolve_account(ev.pop())
+    ev.push(ev.ctx.state.min_balance(account))
+
+
+@opcode("asset_holding_get")
+def _asset_holding_get(ev: Evaluator, args: list[str]) -> None:
+    asset_id = ev.resolve_asset(ev.pop_int(), by_index=True)
+    account = ev.resolve_account(ev.pop())
+    value = ev.ctx.state.asset_holding_field(account, asset_id, args[0])
+    ev.push(0 if value is None else value)
+    ev.push(int(value is not None))
+
+
+@opcode("asset_params_get")
+def _asset_params_get(ev: Evaluator, args: list[str]) -> None:
+    asset_id = ev.resolve_asset(ev.pop_int(), by_index=True)
+    value = ev.ctx.state.asset_params_field(asset_id, args[0])
+    ev.push(0 if value is None else value)
+    ev.push(int(value is not None))
+
+
+@opcode("app_params_get")
+def _app_params_get(ev: Evaluator, args: list[str]) -> None:
+    app_id = ev.resolve_app(ev.pop_int())
+    value = ev.ctx.state.app_params_field(app_id, args[0])
+    ev.push(0 if value is None else value)
+    ev.push(int(value is not None))
+
+
+@opcode("acct_params_get")
+def _acct_params_get(ev: Evaluator, args: list[str]) -> None:
+    account = ev.resolve_account(ev.pop())
+    value = ev.ctx.state.account_params_field(account, args[0])
+    ev.push(0 if value is None else value)
+    ev.push(int(value is not None))
+
+
+# -- boxes ----------------------------------------------------------------
+@opcode("box_create")
+def _box_create(ev: Evaluator, _args: list[str]) -> None:
+    size = ev.pop_int()
+    name = ev.resolve_box(ev.pop_bytes())
+    if size > 32768:
+        raise TealError(f"box size too large: {size}, max is 32768")
+    existing = ev.ctx.state.box_get(ev.app_id, name)
+    if existing is not None:
+        if len(existing) != size:
+            raise TealError("box size mismatch")
+        ev.push(0)
+        return
+    ev.ctx.state.box_put(ev.app_id, name, bytes(size))
+    ev.push(1)
+
+
+@opcode("box_put")
+def _box_put(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.pop_bytes()
+    name = ev.resolve_box(ev.pop_bytes())
+    existing = ev.ctx.state.box_get(ev.app_id, name)
+    if existing is not None and len(existing) != len(value):
+        raise TealError(
+            f"attempt to box_put wrong size {len(existing)} != {len(value)}"
+        )
+    ev.ctx.state.box_put(ev.app_id, name, value)
+
+
+@opcode("box_get")
+def _box_get(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.ctx.state.box_get(ev.app_id, ev.resolve_box(ev.pop_bytes()))
+    ev.push(b"" if value is None else value)
+    ev.push(int(value is not None))
+
+
+@opcode("box_len")
+def _box_len(ev: Evaluator, _args: list[str]) -> None:
+    value = ev.ctx.state.box_get(ev.app_id, ev.resolve_box(ev.pop_bytes()))
+    ev.push(0 if value is None else len(value))
+    ev.push(int(value is not None))
+
+
+@opcode("box_del")
+def _box_del(ev: Evaluator, _args: list[str]) -> None:
+    ev.push(int(ev.ctx.state.box_del(ev.app_id, ev.resolve_box(ev.pop_bytes()))))
+
+
+@opcode("box_extract")
+def _box_extract(ev: Evaluator, _args: list[str]) -> None:
+    length = ev.pop_int()
+    start = ev.pop_int()
+    name = ev.resolve_box(ev.pop_bytes())
+    value = ev.ctx.state.box_get(ev.app_id, name)
+    if value is None:
+        raise TealError(f"no such box {name!r}")
+    _extract(ev, value, start, length)
+
+
+@opcode("box_replace")
+def _box_replace(ev: Evaluator, _args: list[str]) -> None:
+    patch = ev.pop_bytes()
+    start = ev.pop_int()
+    name = ev.resolve_box(ev.pop_bytes())
+    value = ev.ctx.state.box_get(ev.app_id, name)
+    if value is None:
+        raise TealError(f"no such box {name!r}")
+    if start + len(patch) > len(value):
+        raise TealError("replacement end exceeds box size")
+    ev.ctx.state.box_put(
+        ev.app_id, name, value[:start] + patch + value[start + len(patch) :]
+    )
+
+
+# -- inner transactions -------------------------------------------------
+@opcode("itxn_begin")
+def _itxn_begin(ev: Evaluator, _args: list[str]) -> None:
+    if ev.pending_inner:
+        raise TealError("itxn_begin without itxn_submit")
+    ev.pending_inner = [ev.ctx.new_inner_txn(ev.app_id)]
+
+
+@opcode("itxn_next")
+def _itxn_next(ev: Evaluator, _args: list[str]) -> None:
+    if not ev.pending_inner:
+        raise TealError("itxn_next without itxn_begin")
+    ev.pending_inner.append(ev.ctx.new_inner_txn(ev.app_id))
+
+
+@opcode("itxn_field")
+def _itxn_field(ev: Evaluator, args: list[str]) -> None:
+    if not ev.pending_inner:
+        raise TealError("itxn_field without itxn_begin")
+    value = ev.pop()
+    ev.ctx.set_inner_field(ev, ev.pending_inner[-1], args[0], value)
+
+
+@opcode("itxn_submit")
+def _itxn_submit(ev: Evaluator, _args: list[str]) -> None:
+    if not ev.pending_inner:
+        raise TealError("itxn_submit without itxn_begin")
+    if len(ev.inner_results) + len(ev.pending_inner) > MAX_INNER_TXNS:
+        raise TealError("too many inner transactions")
+    group, ev.pending_inner = ev.pending_inner, []
+    results = ev.ctx.submit_inner(ev.app_id, group)
+    ev.inner_groups.append(results)
+    ev.inner_results.extend(results)
+
+
+def _last_inner_group(ev: Evaluator, index: int | None = None) -> "ApplyResult":
+    if not ev.inner_groups:
+        raise TealError("no inner transaction available")
+    group = ev.inner_groups[-1]
+    if index is None:
+        return group[-1]
+    if index >= len(group):
+        raise TealError(f"gitxn {index} beyond inner group of {len(group)}")
+    return group[index]
+
+
+def _inner_field(ev: Evaluator, inner: "ApplyResult", name: str, index: int) -> None:
+    _txn_field(ev, inner.txn, name, index, inner)
+
+
+@opcode("itxn")
+def _itxn(ev: Evaluator, args: list[str]) -> None:
+    _inner_field(ev, _last_inner_group(ev), args[0], _array_index(args, 1))
+
+
+@opcode("itxna")
+def _itxna(ev: Evaluator, args: list[str]) -> None:
+    _inner_field(ev, _last_inner_group(ev), args[0], int(args[1]))
+
+
+@opcode("gitxn")
+def _gitxn(ev: Evaluator, args: list[str]) -> None:
+    inner = _last_inner_group(ev, int(args[0]))
+    _inner_field(ev, inner, args[1], _array_index(args, 2))
+
+
+@opcode("gitxna")
+def _gitxna(ev: Evaluator, args: list[str]) -> None:
+    _inner_field(ev, _last_inner_group(ev, int(args[0])), args[1], int(args[2]))
@@ -0,0 +1,1045 @@
+"""In-memory ledger: accounts, assets, applications and boxes.
+
+Every transaction group is evaluated against a copy-on-write fork of the
+current `State`; the fork replaces the ledger state only if the whole group
+succeeds, so a committed `State` is never mutated again and can be kept as a
+snapshot and restored later.
+"""
+
+import base64
+import hashlib
+from dataclasses import dataclass, field, replace
+from typing import Any
+
+import msgpack
+from algosdk import encoding, logic
+from algosdk.transaction import Transaction
+
+from simulator.interpreter import (
+    EvalResult,
+    Evaluator,
+    Program,
+    TealError,
+    TealValue,
+)
+
+MIN_TXN_FEE = 1000
+MIN_BALANCE = 100_000
+MAX_TXN_LIFE = 1000
+MAX_GROUP_SIZE = 16
+APP_CALL_BUDGET = 700
+ASSET_MIN_BALANCE = 100_000
+APP_PAGE_MIN_BALANCE = 100_000
+SCHEMA_UINT_MIN_BALANCE = 28_500
+SCHEMA_BYTES_MIN_BALANCE = 50_000
+BOX_FLAT_MIN_BALANCE = 2_500
+BOX_BYTE_MIN_BALANCE = 400
+ZERO_ADDRESS = bytes(32)
+GENESIS_ID = "simulator-v1"
+GENESIS_HASH = hashlib.sha256(GENESIS_ID.encode()).digest()
+
+TXN_TYPES = {"pay": 1, "keyreg": 2, "acfg": 3, "axfer": 4, "afrz": 5, "appl": 6}
+TXN_TYPE_NAMES = {value: key for key, value in TXN_TYPES.items()}
+ON_COMPLETE_OPT_IN = 1
+ON_COMPLETE_CLOSE_OUT = 2
+ON_COMPLETE_CLEAR_STATE = 3
+ON_COMPLETE_UPDATE = 4
+ON_COMPLETE_DELETE = 5
+
+
+class TxnError(Exception):
+    """A transaction (group) was rejected; the ledger state is left untouched."""
+
+    def __init__(self, message: str, txid: str = ""):
+        super().__init__(message)
+        self.message = message
+        self.txid = txid
+
+
+@dataclass
+class AccountData:
+    balance: int = 0
+    holdings: dict[int, int] = field(default_factory=dict)
+    local_states: dict[int, dict[bytes, TealValue]] = field(default_factory=dict)
+
+    def clone(self) -> "AccountData":
+        return AccountData(
+            balance=self.balance,
+            holdings=dict(self.holdings),
+            local_states={k: dict(v) for k, v in self.local_states.items()},
+        )
+
+    def is_empty(self) -> bool:
+        return not (self.balance or self.holdings or self.local_states)
+
+
+@dataclass(frozen=True)
+class AssetData:
+    index: int
+    creator: bytes
+    total: int
+    decimals: int = 0
+    default_frozen: bool = False
+    unit_name: bytes = b""
+    name: bytes = b""
+    url: bytes = b""
+    metadata_hash: bytes = b""
+    manager: bytes = ZERO_ADDRESS
+    reserve: bytes = ZERO_ADDRESS
+    freeze: bytes = ZERO_ADDRESS
+    clawback: bytes = ZERO_ADDRESS
+
+
+@dataclass
+class AppData:
+    index: int
+    creator: bytes
+    approval: bytes
+    clear: bytes
+    global_schema: tuple[int, int] = (0, 0)
+    local_schema: tuple[int, int] = (0, 0)
+    extra_pages: int = 0
+    global_state: dict[bytes, TealValue] = field(default_factory=dict)
+    boxes: dict[bytes, bytes] = field(default_factory=dict)
+
+    @property
+    def address(self) -> bytes:
+        return encoding.decode_address(logic.get_application_address(self.index))
+
+    def clone(self) -> "AppData":
+        return replace(
+            self, global_state=dict(self.global_state), boxes=dict(self.boxes)
+        )
+
+
+class State:
+    """One version of the world. Writes go through the `*_mut` accessors,
+    which copy an object the first time this version touches it."""
+
+    def __init__(self) -> None:
+        self.accounts: dict[bytes, AccountData] = {}
+        self.assets: dict[int, AssetData] = {}
+        self.apps: dict[int, AppData] = {}
+        self.app_addresses: dict[bytes, int] = {}
+        self.round = 0
+        self.timestamp = 0
+        self.next_index = 1000
+        self._owned: set[tuple[str, object]] = set()
+
+    def fork(self) -> "State":
+        child = State()
+        child.accounts = dict(self.accounts)
+        child.assets = dict(self.assets)
+        child.apps = dict(self.apps)
+        child.app_addresses = dict(self.app_addresses)
+        child.round = self.round
+        child.timestamp = self.timestamp
+        child.next_index = self.next_index
+        return child
+
+    def allocate_index(self) -> int:
+        self.next_index += 1
+        return self.next_index
+
+    # -- accounts --------------------------------------------------------
+    def account(self, address: bytes) -> AccountData:
+        return self.accounts.get(address) or AccountData()
+
+    def account_mut(self, address: bytes) -> AccountData:
+        key = ("account", address)
+        if key not in self._owned:
+            existing = self.accounts.get(address)
+            self.accounts[address] = existing.clone() if existing else AccountData()
+            self._owned.add(key)
+        return self.accounts[address]
+
+    def app(self, app_id: int) -> AppData:
+        if app_id not in self.apps:
+            raise TealError(f"application {app_id} does not exist")
+        return self.apps[app_id]
+
+    def app_mut(self, app_id: int) -> AppData:
+        key = ("app", app_id)
+        if key not in self._owned:
+            self.apps[app_id] = self.app(app_id).clone()
+            self._owned.add(key)
+        return self.apps[app_id]
+
+    def asset(self, asset_id: int) -> AssetData:
+        if asset_id not in self.assets:
+            raise TxnError(f"asset {asset_id} does not exist or has been deleted")
+        return self.assets[asset_id]
+
+    def min_balance(self, address: bytes) -> int:
+        data = self.account(address)
+        total = MIN_BALANCE + ASSET_MIN_BALANCE * len(data.holdings)
+        for app_id in data.local_states:
+            uints, byte_slices = self.apps[app_id].local_schema
+            total += (
+                MIN_BALANCE
+                + SCHEMA_UINT_MIN_BALANCE * uints
+                + SCHEMA_BYTES_MIN_BALANCE * byte_slices
+            )
+        for app in self.apps.values():
+            if app.creator == address:
+                uints, byte_slices = app.global_schema
+                total += (
+                    APP_PAGE_MIN_BALANCE * (1 + app.extra_pages)
+                    + SCHEMA_UINT_MIN_BALANCE * uints
+                    + SCHEMA_BYTES_MIN_BALANCE * byte_slices
+                )
+        if address in self.app_addresses:
+            for name, value in self.apps[self.app_addresses[address]].boxes.items():
+                total += BOX_FLAT_MIN_BALANCE + BOX_BYTE_MIN_BALANCE * (
+                    len(name) + len(value)
+                )
+        return total
+
+    # -- application state used by the interpreter ------------------------
+    def global_get(self, app_id: int, key: bytes) -> TealValue | None:
+        return self.app(app_id).global_state.get(key)
+
+    def global_put(self, app_id: int, key: bytes, value: TealValue) -> None:
+        self.app_mut(app_id).global_state[key] = value
+
+    def global_del(self, app_id: int, key: bytes) -> None:
+        self.app_mut(app_id).global_state.pop(key, None)
+
+    def opted_in(self, address: bytes, app_id: int) -> bool:
+        return app_id in self.account(address).local_states
+
+    def local_get(self, address: bytes, app_id: int, key: bytes) -> TealValue | None:
+        return self.account(address).local_states.get(app_id, {}).get(key)
+
+    def local_put(
+        self, address: bytes, app_id: int, key: bytes, value: TealValue
+    ) -> None:
+        if not self.opted_in(address, app_id):
+            raise TealError(
+                f"account {encoding.encode_address(address)} is not opted in"
+            )
+        self.account_mut(address).local_states[app_id][key] = value
+
+    def local_del(self, address: bytes, app_id: int, key: bytes) -> None:
+        if self.opted_in(address, app_id):
+            self.account_mut(address).local_states[app_id].pop(key, None)
+
+    def box_get(self, app_id: int, name: bytes) -> bytes | None:
+        return self.app(app_id).boxes.get(name)
+
+    def box_put(self, app_id: int, name: bytes, value: bytes) -> None:
+        self.app_mut(app_id).boxes[name] = value
+
+    def box_del(self, app_id: int, name: bytes) -> bool:
+        if name not in self.app(app_id).boxes:
+            return False
+        del self.app_mut(app_id).boxes[name]
+        return True
+
+    def asset_holding_field(
+        self, address: bytes, asset_id: int, name: str
+    ) -> TealValue | None:
+        holdings = self.account(address).holdings
+        if asset_id not in holdings:
+            return None
+        if name == "AssetBalance":
+            return holdings[asset_id]
+        if name == "AssetFrozen":
+            return 0
+        raise TealError(f"invalid asset_holding_get field {name}")
+
+    def asset_params_field(self, asset_id: int, name: str) -> TealValue | None:
+        if asset_id not in self.assets:
+            return None
+        asset = self.assets[asset_id]
+        fields: dict[str, TealValue] = {
+            "AssetTotal": asset.total,
+            "AssetDecimals": asset.decimals,
+            "AssetDefaultFrozen": int(asset.default_frozen),
+            "AssetUnitName": asset.unit_name,
+            "AssetName": asset.name,
+            "AssetURL": asset.url,
+            "AssetMetadataHash": asset.metadata_hash,
+            "AssetManager": asset.manager,
+            "AssetReserve": asset.reserve,
+            "AssetFreeze": asset.freeze,
+            "AssetClawback": asset.clawback,
+            "AssetCreator": asset.creator,
+        }
+        if name not in fields:
+            raise TealError(f"invalid asset_params_get field {name}")
+        return fields[name]
+
+    def app_params_field(self, app_id: int, name: str) -> TealValue | None:
+        if app_id not in self.apps:
+            return None
+        app = self.apps[app_id]
+        fields: dict[str, TealValue] = {
+            "AppApprovalProgram": app.approval,
+            "AppClearStateProgram": app.clear,
+            "AppGlobalNumUint": app.global_schema[0],
+            "AppGlobalNumByteSlice": app.global_schema[1],
+            "AppLocalNumUint": app.local_schema[0],
+            "AppLocalNumByteSlice": app.local_schema[1],
+            "AppExtraProgramPages": app.extra_pages,
+            "AppCreator": app.creator,
+            "AppAddress": app.address,
+        }
+        if name not in fields:
+            raise TealError(f"invalid app_params_get field {name}")
+        return fields[name]
+
+    def account_params_field(self, address: bytes, name: str) -> TealValue | None:
+        data = self.account(address)
+        if data.is_empty():
+            return None
+        fields: dict[str, TealValue] = {
+            "AcctBalance": data.balance,
+            "AcctMinBalance": self.min_balance(address),
+            "AcctAuthAddr": ZERO_ADDRESS,
+            "AcctTotalAssets": len(data.holdings),
+            "AcctTotalAppsOptedIn": len(data.local_states),
+        }
+        if name not in fields:
+            raise TealError(f"invalid acct_params_get field {name}")
+        return fields[name]
+
+
+def txn_id(txn: dict[str, Any]) -> str:
+    """The transaction id of a msgpack-shaped transaction dict."""
+    return Transaction.undictify(dict(txn)).get_txid()
+
+
+def _address(value: TealValue, field_name: str) -> bytes:
+    if not isinstance(value, bytes) or len(value) != 32:
+        raise TealError(f"{field_name} must be a 32 byte address")
+    return value
+
+
+# itxn_field name -> (msgpack key, kind)
+INNER_FIELDS: dict[str, tuple[str, str]] = {
+    "Sender": ("snd", "addr"),
+    "Fee": ("fee", "uint"),
+    "Note": ("note", "bytes"),
+    "Receiver": ("rcv", "addr"),
+    "Amount": ("amt", "uint"),
+    "CloseRemainderTo": ("close", "addr"),
+    "XferAsset": ("xaid", "asset"),
+    "AssetAmount": ("aamt", "uint"),
+    "AssetSender": ("asnd", "addr"),
+    "AssetReceiver": ("arcv", "addr"),
+    "AssetCloseTo": ("aclose", "addr"),
+    "ConfigAsset": ("caid", "asset"),
+    "ConfigAssetTotal": ("apar.t", "uint"),
+    "ConfigAssetDecimals": ("apar.dc", "uint"),
+    "ConfigAssetDefaultFrozen": ("apar.df", "uint"),
+    "ConfigAssetUnitName": ("apar.un", "bytes"),
+    "ConfigAssetName": ("apar.an", "bytes"),
+    "ConfigAssetURL": ("apar.au", "bytes"),
+    "ConfigAssetMetadataHash": ("apar.am", "bytes"),
+    "ConfigAssetManager": ("apar.m", "addr"),
+    "ConfigAssetReserve": ("apar.r", "addr"),
+    "ConfigAssetFreeze": ("apar.f", "addr"),
+    "ConfigAssetClawback": ("apar.c", "addr"),
+}
+
+# txn field name -> msgpack key for the simple scalar fields
+TXN_FIELDS: dict[str, tuple[str, TealValue]] = {
+    "Sender": ("snd", ZERO_ADDRESS),
+    "Fee": ("fee", 0),
+    "FirstValid": ("fv", 0),
+    "LastValid": ("lv", 0),
+    "Note": ("note", b""),
+    "Lease": ("lx", ZERO_ADDRESS),
+    "Receiver": ("rcv", ZERO_ADDRESS),
+    "Amount": ("amt", 0),
+    "CloseRemainderTo": ("close", ZERO_ADDRESS),
+    "XferAsset": ("xaid", 0),
+    "AssetAmount": ("aamt", 0),
+    "AssetSender": ("asnd", ZERO_ADDRESS),
+    "AssetReceiver": ("arcv", ZERO_ADDRESS),
+    "AssetCloseTo": ("aclose", ZERO_ADDRESS),
+    "ApplicationID": ("apid", 0),
+    "OnCompletion": ("apan", 0),
+    "ApprovalProgram": ("apap", b""),
+    "ClearStateProgram": ("apsu", b""),
+    "RekeyTo": ("rekey", ZERO_ADDRESS),
+    "ConfigAsset": ("caid", 0),
+    "FreezeAsset": ("faid", 0),
+    "FreezeAssetAccount": ("fadd", ZERO_ADDRESS),
+    "FreezeAssetFrozen": ("afrz", 0),
+    "ExtraProgramPages": ("apep", 0),
+    "ConfigAssetTotal": ("apar.t", 0),
+    "ConfigAssetDecimals": ("apar.dc", 0),
+    "ConfigAssetDefaultFrozen": ("apar.df", 0),
+    "ConfigAssetUnitName": ("apar.un", b""),
+    "ConfigAssetName": ("apar.an", b""),
+    "ConfigAssetURL": ("apar.au", b""),
+    "ConfigAssetMetadataHash": ("apar.am", b""),
+    "ConfigAssetManager": ("apar.m", ZERO_ADDRESS),
+    "ConfigAssetReserve": ("apar.r", ZERO_ADDRESS),
+    "ConfigAssetFreeze": ("apar.f", ZERO_ADDRESS),
+    "ConfigAssetClawback": ("apar.c", ZERO_ADDRESS),
+    "GlobalNumUint": ("apgs.nui", 0),
+    "GlobalNumByteSlice": ("apgs.nbs", 0),
+    "LocalNumUint": ("apls.nui", 0),
+    "LocalNumByteSlice": ("apls.nbs", 0),
+}
+
+
+def _get(txn: dict[str, Any], key: str, default: Any = None) -> Any:  # noqa: ANN401
+    if "." in key:
+        outer, inner = key.split(".")
+        return txn.get(outer, {}).get(inner, default)
+    return txn.get(key, default)
+
+
+def _set(txn: dict[str, Any], key: str, value: Any) -> None:  # noqa: ANN401
+    if "." in key:
+        outer, inner = key.split(".")
+        txn.setdefault(outer, {})[inner] = value
+    else:
+        txn[key] = value
+
+
+@dataclass
+class ApplyResult:
+    """What algod reports back for one (possibly inner) transaction."""
+
+    txn: dict[str, Any]
+    txid: str
+    asset_index: int = 0
+    application_index: int = 0
+    logs: list[bytes] = field(default_factory=list)
+    inner: list["ApplyResult"] = field(default_factory=list)
+    global_delta: dict[bytes, TealValue | None] = field(default_factory=dict)
+    cost: int = 0
+
+
+class GroupContext:
+    """Evaluation state shared by all transactions of one top-level group."""
+
+    def __init__(
+        self,
+        state: State,
+        programs: dict[bytes, Program],
+        txns: list[dict[str, Any]],
+        *,
+        extra_budget: int = 0,
+    ):
+        self.state = state
+        self.programs = programs
+        self.txns = txns
+        self.results: list[ApplyResult | None] = [None] * len(txns)
+        app_calls = sum(1 for txn in txns if txn.get("type") == "appl")
+        self.budget = APP_CALL_BUDGET * app_calls + extra_budget
+        self.budget_added = self.budget
+        self.budget_consumed = 0
+        self.fee_credit = sum(txn.get("fee", 0) for txn in txns) - MIN_TXN_FEE * len(
+            txns
+        )
+        self.touched: set[bytes] = set()
+        self._boxes = self._box_references()
+
+    # -- budget and fees -------------------------------------------------
+    def consume_budget(self, cost: int) -> None:
+        self.budget_consumed += cost
+        if self.budget_consumed > self.budget:
+            raise TealError(
+                f"dynamic cost budget exceeded, executing op: "
+                f"budget is {self.budget}"
+            )
+
+    # -- resources -------------------------------------------------------
+    def _box_references(self) -> set[tuple[int, bytes]]:
+        refs: set[tuple[int, bytes]] = set()
+        for txn in self.txns:
+            if txn.get("type") != "appl":
+                continue
+            apps = [txn.get("apid", 0), *list(txn.get("apfa", []))]
+            for ref in txn.get("apbx", []):
+                refs.add((apps[ref.get("i", 0)], ref.get("n", b"")))
+        return refs
+
+    def _shared(self, ev: Evaluator) -> list[dict[str, Any]]:
+        return self.txns if ev.program.version >= 9 else [ev.txn]
+
+    def require_account(self, ev: Evaluator, address: bytes) -> None:
+        if address in (ZERO_ADDRESS, self.state.app(ev.app_id).address):
+            return
+        for txn in self._shared(ev):
+            apps = [ev.app_id, *list(txn.get("apfa", []))]
+            app_addresses = {
+                encoding.decode_address(logic.get_application_address(a)) for a in apps
+            }
+            if (
+                address == txn.get("snd")
+                or address in txn.get("apat", [])
+                or address in app_addresses
+            ):
+                return
+        raise TealError(f"unavailable Account {encoding.encode_address(address)}")
+
+    def require_asset(self, ev: Evaluator, asset_id: int) -> None:
+        for txn in self._shared(ev):
+            if asset_id in txn.get("apas", []):
+                return
+        for result in self.results:
+            if result and result.asset_index == asset_id:
+                return
+        raise TealError(f"unavailable Asset {asset_id}")
+
+    def require_app(self, ev: Evaluator, app_id: int) -> None:
+        for txn in self._shared(ev):
+            if app_id == ev.app_id or app_id in txn.get("apfa", []):
+                return
+        raise TealError(f"unavailable App {app_id}")
+
+    def require_box(self, ev: Evaluator, name: bytes) -> None:
+        if (ev.app_id, name) in self._boxes or (0, name) in self._boxes:
+            return
+        raise TealError(f"invalid Box reference {name!r}")
+
+    # -- field access ----------------------------------------------------
+    def txn_field(
+        self,
+        txn: dict[str, Any],
+        name: str,
+        index: int,
+        result: ApplyResult | None = None,
+    ) -> TealValue:
+        if name in TXN_FIELDS and index < 0:
+            key, default = TXN_FIELDS[name]
+            value = _get(txn, key, default)
+            return int(value) if isinstance(value, bool) else value
+        array_fields: dict[str, list[Any]] = {
+            "ApplicationArgs": list(txn.get("apaa", [])),
+            "Accounts": [txn.get("snd", ZERO_ADDRESS), *list(txn.get("apat", []))],
+            "Assets": list(txn.get("apas", [])),
+            "Applications": [txn.get("apid", 0), *list(txn.get("apfa", []))],
+            "Logs": result.logs if result else [],
+        }
+        if name in array_fields:
+            values = array_fields[name]
+            if index < 0 or index >= len(values):
+                raise TealError(f"invalid {name} index {index}")
+            return values[index]
+        counts = {
+            "NumAppArgs": "ApplicationArgs",
+            "NumAccounts": "Accounts",
+            "NumAssets": "Assets",
+            "NumApplications": "Applications",
+            "NumLogs": "Logs",
+        }
+        if name in counts:
+            count = len(array_fields[counts[name]])
+            return count - 1 if name in ("NumAccounts", "NumApplications") else count
+        if name == "Type":
+            return str(txn.get("type", "")).encode()
+        if name == "TypeEnum":
+            return TXN_TYPES.get(txn.get("type", ""), 0)
+        if name == "GroupIndex":
+            return self.txns.index(txn) if txn in self.txns else 0
+        if name == "TxID":
+            return base64.b32decode(txn_id(txn) + "====")
+        if name == "GroupID":
+            return txn.get("grp", ZERO_ADDRESS)
+        if name == "LastLog":
+            return result.logs[-1] if result and result.logs else b""
+        if name == "CreatedAssetID":
+            return result.asset_index if result else 0
+        if name == "CreatedApplicationID":
+            return result.application_index if result else 0
+        raise TealError(f"unsupported txn field {name}")
+
+    def global_field(self, name: str, app_id: int, group_index: int) -> TealValue:
+        fields: dict[str, TealValue] = {
+            "MinTxnFee": MIN_TXN_FEE,
+            "MinBalance": MIN_BALANCE,
+            "MaxTxnLife": MAX_TXN_LIFE,
+            "ZeroAddress": ZERO_ADDRESS,
+            "GroupSize": len(self.txns),
+            "LogicSigVersion": 9,
+            "Round": self.state.round + 1,
+            "LatestTimestamp": self.state.timestamp,
+            "CurrentApplicationID": app_id,
+            "CurrentApplicationAddress": self.state.app(app_id).address,
+            "CreatorAddress": self.state.app(app_id).creator,
+            "GroupID": self.txns[group_index].get("grp", ZERO_ADDRESS),
+            "OpcodeBudget": self.budget - self.budget_consumed,
+            "CallerApplicationID": 0,
+            "CallerApplicationAddress": ZERO_ADDRESS,
+        }
+        if name not in fields:
+            raise TealError(f"unsupported global field {name}")
+        return fields[name]
+
+    # -- inner transactions ----------------------------------------------
+    def new_inner_txn(self, app_id: int) -> dict[str, Any]:
+        return {
+            "snd": self.state.app(app_id).address,
+            "fv": self.state.round + 1,
+            "lv": self.state.round + 1 + MAX_TXN_LIFE,
+        }
+
+    def set_inner_field(
+        self, ev: Evaluator, txn: dict[str, Any], name: str, value: TealValue
+    ) -> None:
+        if name == "TypeEnum":
+            if value not in TXN_TYPE_NAMES:
+                raise TealError(f"invalid TypeEnum {value!r}")
+            txn["type"] = TXN_TYPE_NAMES[int(value)]
+            return
+        if name == "Type":
+            txn["type"] = bytes(value).decode() if isinstance(value, bytes) else value
+            return
+        if name not in INNER_FIELDS:
+            raise TealError(f"unsupported itxn_field {name}")
+        key, kind = INNER_FIELDS[name]
+        if kind == "addr":
+            address = _address(value, name)
+            if name != "Sender" and not key.startswith("apar."):
+                self.require_account(ev, address)
+            _set(txn, key, address)
+        elif kind == "asset":
+            if not isinstance(value, int):
+                raise TealError(f"{name} must be a uint64")
+            if value:
+                self.require_asset(ev, value)
+            _set(txn, key, value)
+        elif kind == "uint":
+            if not isinstance(value, int):
+                raise TealError(f"{name} must be a uint64")
+            _set(txn, key, value)
+        else:
+            if not isinstance(value, bytes):
+                raise TealError(f"{name} must be bytes")
+            _set(txn, key, value)
+
+    def submit_inner(
+        self, app_id: int, group: list[dict[str, Any]]
+    ) -> list[ApplyResult]:
+        if len(group) > MAX_GROUP_SIZE:
+            raise TealError("too many inner transactions in one group")
+        for txn in group:
+            if "type" not in txn:
+                raise TealError("itxn_submit without a TypeEnum")
+            if txn["snd"] != self.state.app(app_id).address:
+                raise TealError("unauthorized inner transaction sender")
+            if "fee" not in txn:
+                txn["fee"] = max(0, MIN_TXN_FEE - max(self.fee_credit, 0))
+            self.fee_credit += txn["fee"] - MIN_TXN_FEE
+            if self.fee_credit < 0:
+                raise TealError("fee too small")
+        results = []
+        for txn in group:
+            try:
+                results.append(apply_txn(self, txn, inner=True))
+            except TxnError as err:
+                raise TealError(err.message) from err
+        return results
+
+
+def apply_txn(
+    ctx: GroupContext, txn: dict[str, Any], *, inner: bool = False
+) -> ApplyResult:
+    """Apply one transaction (and its inner transactions) to `ctx.state`."""
+    state = ctx.state
+    sender = txn.get("snd", ZERO_ADDRESS)
+    result = ApplyResult(txn=txn, txid=txn_id(txn))
+    ctx.touched.add(sender)
+    fee = txn.get("fee", 0)
+    if state.account(sender).balance < fee:
+        raise TxnError(
+            f"overspend (account {encoding.encode_address(sender)}, "
+            f"balance {state.account(sender).balance}, fee {fee})"
+        )
+    state.account_mut(sender).balance -= fee
+    match txn.get("type"):
+        case "pay":
+            _apply_payment(ctx, txn)
+        case "axfer":
+            _apply_asset_transfer(ctx, txn)
+        case "acfg":
+            result.asset_index = _apply_asset_config(ctx, txn)
+        case "appl":
+            if inner:
+                raise TxnError("inner application calls are not supported")
+            _apply_app_call(ctx, txn, result)
+        case "keyreg":
+            pass
+        case other:
+            raise TxnError(f"unsupported transaction type {other}")
+    return result
+
+
+def _transfer_algos(
+    ctx: GroupContext, sender: bytes, receiver: bytes, amount: int
+) -> None:
+    state = ctx.state
+    if state.account(sender).balance < amount:
+        raise TxnError(
+            f"overspend (account {encoding.encode_address(sender)}, "
+            f"tried to spend {amount})"
+        )
+    state.account_mut(sender).balance -= amount
+    state.account_mut(receiver).balance += amount
+    ctx.touched.add(receiver)
+
+
+def _apply_payment(ctx: GroupContext, txn: dict[str, Any]) -> None:
+    sender = txn.get("snd", ZERO_ADDRESS)
+    _transfer_algos(ctx, sender, txn.get("rcv", ZERO_ADDRESS), txn.get("amt", 0))
+    close_to = txn.get("close")
+    if close_to:
+        data = ctx.state.account(sender)
+        if data.holdings or data.local_states:
+            raise TxnError("cannot close account with active assets or apps")
+        _transfer_algos(ctx, sender, close_to, data.balance)
+
+
+def _apply_asset_transfer(ctx: GroupContext, txn: dict[str, Any]) -> None:
+    state = ctx.state
+    sender = txn.get("snd", ZERO_ADDRESS)
+    receiver = txn.get("arcv", ZERO_ADDRESS)
+    asset_id = txn.get("xaid", 0)
+    amount = txn.get("aamt", 0)
+    asset = state.asset(asset_id)
+    source = sender
+    if txn.get("asnd"):
+        if sender != asset.clawback:
+            raise TxnError("clawback called by non-clawback address")
+        source = txn["asnd"]
+    if (
+        source == receiver == sender
+        and amount == 0
+        and asset_id not in state.account(sender).holdings
+    ):
+        state.account_mut(sender).holdings[asset_id] = 0
+        return
+    for address in (source, receiver):
+        if asset_id not in state.account(address).holdings:
+            raise TxnError(
+                f"asset {asset_id} missing from {encoding.encode_address(address)}"
+            )
+    if state.account(source).holdings[asset_id] < amount:
+        raise TxnError(
+            f"underflow on subtracting {amount} from sender amount "
+            f"{state.account(source).holdings[asset_id]}"
+        )
+    state.account_mut(source).holdings[asset_id] -= amount
+    state.account_mut(receiver).holdings[asset_id] += amount
+    ctx.touched.update((source, receiver))
+    close_to = txn.get("aclose")
+    if close_to:
+        if sender == asset.creator:
+            raise TxnError("cannot close asset ID in allocating account")
+        if asset_id not in state.account(close_to).holdings:
+            raise TxnError(
+                f"asset {asset_id} missing from {encoding.encode_address(close_to)}"
+            )
+        remainder = state.account_mut(sender).holdings.pop(asset_id)
+        state.account_mut(close_to).holdings[asset_id] += remainder
+        ctx.touched.add(close_to)
+
+
+def _apply_asset_config(ctx: GroupContext, txn: dict[str, Any]) -> int:
+    state = ctx.state
+    sender = txn.get("snd", ZERO_ADDRESS)
+    params = txn.get("apar", {})
+    asset_id = txn.get("caid", 0)
+    if asset_id == 0:
+        asset_id = state.allocate_index()
+        state.assets[asset_id] = AssetData(
+            index=asset_id,
+            creator=sender,
+            total=params.get("t", 0),
+            decimals=params.get("dc", 0),
+            default_frozen=bool(params.get("df", False)),
+            unit_name=_text(params.get("un", b"")),
+            name=_text(params.get("an", b"")),
+            url=_text(params.get("au", b"")),
+            metadata_hash=params.get("am", b""),
+            manager=params.get("m", ZERO_ADDRESS),
+            reserve=params.get("r", ZERO_ADDRESS),
+            freeze=params.get("f", ZERO_ADDRESS),
+            clawback=params.get("c", ZERO_ADDRESS),
+        )
+        state.account_mut(sender).holdings[asset_id] = params.get("t", 0)
+        return asset_id
+    asset = state.asset(asset_id)
+    if sender != asset.manager:
+        raise TxnError("this transaction should be issued by the manager")
+    if not params:
+        if state.account(asset.creator).holdings.get(asset_id) != asset.total:
+            raise TxnError("cannot destroy asset: creator is holding only part")
+        del state.account_mut(asset.creator).holdings[asset_id]
+        del state.assets[asset_id]
+        return 0
+    state.assets[asset_id] = replace(
+        asset,
+        manager=params.get("m", ZERO_ADDRESS),
+        reserve=params.get("r", ZERO_ADDRESS),
+        freeze=params.get("f", ZERO_ADDRESS),
+        clawback=params.get("c", ZERO_ADDRESS),
+    )
+    return 0
+
+
+def _text(value: bytes | str) -> bytes:
+    return value.encode() if isinstance(value, str) else value
+
+
+def _schema(value: dict[str, int] | None) -> tuple[int, int]:
+    value = value or {}
+    return value.get("nui", 0), value.get("nbs", 0)
+
+
+def _program(ctx: GroupContext, program: bytes) -> Program:
+    if program not in ctx.programs:
+        raise TxnError("program was not compiled by this simulator")
+    return ctx.programs[program]
+
+
+def _apply_app_call(
+    ctx: GroupContext, txn: dict[str, Any], result: ApplyResult
+) -> None:
+    state = ctx.state
+    sender = txn.get("snd", ZERO_ADDRESS)
+    app_id = txn.get("apid", 0)
+    on_complete = txn.get("apan", 0)
+    group_index = ctx.txns.index(txn)
+    if app_id == 0:
+        app_id = state.allocate_index()
+        app = AppData(
+            index=app_id,
+            creator=sender,
+            approval=txn.get("apap", b""),
+            clear=txn.get("apsu", b""),
+            global_schema=_schema(txn.get("apgs")),
+            local_schema=_schema(txn.get("apls")),
+            extra_pages=txn.get("apep", 0),
+        )
+        state.apps[app_id] = app
+        state._owned.add(("app", app_id))
+        state.app_addresses[app.address] = app_id
+        result.application_index = app_id
+        ctx.touched.add(sender)
+    app = state.app(app_id)
+    before = dict(app.global_state)
+
+    if on_complete == ON_COMPLETE_CLEAR_STATE:
+        if app_id not in state.account(sender).local_states:
+            raise TxnError(f"account is not opted in to app {app_id}")
+        try:
+            evaluation = _evaluate(ctx, _program(ctx, app.clear), group_index, app_id)
+            result.logs, result.inner = evaluation.logs, evaluation.inner_txns
+        except TealError:
+            pass
+        del state.account_mut(sender).local_states[app_id]
+        return
+
+    if on_complete == ON_COMPLETE_OPT_IN:
+        if app_id in state.account(sender).local_states:
+            raise TxnError(f"account has already opted in to app {app_id}")
+        state.account_mut(sender).local_states[app_id] = {}
+
+    try:
+        evaluation = _evaluate(ctx, _program(ctx, app.approval), group_index, app_id)
+    except TealError as err:
+        raise TxnError(
+            f"logic eval error: {err.message}. "
+            f"Details: app={app_id}, pc={err.pc}, opcodes={err.message}"
+        ) from err
+    if not evaluation.approved:
+        raise TxnError("transaction rejected by ApprovalProgram")
+    result.logs = evaluation.logs
+    result.inner = evaluation.inner_txns
+    result.cost = evaluation.cost
+
+    app = state.app(app_id)
+    uints = sum(1 for v in app.global_state.values() if isinstance(v, int))
+    byte_slices = len(app.global_state) - uints
+    if uints > app.global_schema[0] or byte_slices > app.global_schema[1]:
+        raise TxnError(
+            f"store integer count {uints} exceeds schema integer count "
+            f"{app.global_schema[0]} or store bytes count {byte_slices} exceeds "
+            f"schema bytes count {app.global_schema[1]}"
+        )
+    result.global_delta = {
+        key: app.global_state.get(key)
+        for key in before.keys() | app.global_state.keys()
+        if before.get(key) != app.global_state.get(key)
+    }
+    if on_complete == ON_COMPLETE_CLOSE_OUT:
+        del state.account_mut(sender).local_states[app_id]
+    elif on_complete == ON_COMPLETE_UPDATE:
+        app = state.app_mut(app_id)
+        app.approval = txn.get("apap", b"")
+        app.clear = txn.get("apsu", b"")
+    elif on_complete == ON_COMPLETE_DELETE:
+        del state.apps[app_id]
+
+
+def _evaluate(
+    ctx: GroupContext, program: Program, group_index: int, app_id: int
+) -> EvalResult:
+    return Evaluator(program, ctx, group_index, app_id).run()
+
+
+def check_min_balances(ctx: GroupContext) -> None:
+    state = ctx.state
+    for address in ctx.touched:
+        data = state.account(address)
+        if data.is_empty():
+            state.accounts.pop(address, None)
+            continue
+        required = state.min_balance(address)
+        if data.balance < required:
+            raise TxnError(
+                f"account {encoding.encode_address(address)} balance "
+                f"{data.balance} below min {required}"
+            )
+    ctx.touched.clear()
+
+
+@dataclass
+class ConfirmedTxn:
+    round: int  # noqa: A003
+    signed: dict[str, Any]
+    result: ApplyResult
+
+
+def decode_signed_txns(data: bytes) -> list[dict[str, Any]]:
+    """Split the body of POST /transactions into signed transaction dicts."""
+    unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+    unpacker.feed(data)
+    return list(unpacker)
+
+
+class Ledger:
+    """The simulated network: current state, compiled programs and history."""
+
+    def __init__(self, *, genesis_timestamp: int = 1_700_000_000, block_time: int = 1):
+        self.state = State()
+        self.state.timestamp = genesis_timestamp
+        self.block_time = block_time
+        self.timestamp_offset = 0
+        self.programs: dict[bytes, Program] = {}
+        self.confirmed: dict[str, ConfirmedTxn] = {}
+        self.blocks: dict[int, list[ConfirmedTxn]] = {}
+        self.timestamps: dict[int, int] = {0: genesis_timestamp}
+
+    # -- programs --------------------------------------------------------
+    def compile(self, source: str) -> bytes:  # noqa: A003
+        """Register `source` and return the program bytes that stand for it.
+
+        The bytes are the version byte followed by a digest of the source,
+        cut or zero padded to the size the real assembler would produce, so
+        page, size and fee maths that depend on program length still work.
+        Tiny programs keep extra digest bytes if their prefix is taken."""
+        program = Program.parse(source)
+        size = program.size()
+        tag = bytes([program.version]) + hashlib.sha256(source.encode()).digest()
+        binary = tag[:size] + bytes(max(0, size - len(tag)))
+        while self.programs.get(binary, program).source != source:
+            size += 1
+            binary = tag[:size] + bytes(max(0, size - len(tag)))
+        self.programs[binary] = program
+        return binary
+
+    # -- accounts --------------------------------------------------------
+    def fund(self, address: str, amount: int) -> None:
+        """Mint `amount` microAlgos into `address` outside of any transaction."""
+        state = self.state.fork()
+        state.account_mut(encoding.decode_address(address)).balance += amount
+        self.state = state
+
+    # -- time ------------------------------------------------------------
+    @property
+    def round(self) -> int:  # noqa: A003
+        return self.state.round
+
+    def advance(self, seconds: int) -> None:
+        """Move the clock forward; the next block is stamped accordingly."""
+        self.timestamp_offset += seconds
+
+    # -- snapshots -------------------------------------------------------
+    def snapshot(self) -> State:
+        """The current state; committed states are never written to again."""
+        return self.state
+
+    def restore(self, snapshot: State) -> None:
+        """Rewind to `snapshot`, forgetting the blocks made after it."""
+        self.state = snapshot
+        self.timestamp_offset = 0
+        for rnd in [r for r in self.blocks if r > snapshot.round]:
+            for entry in self.blocks.pop(rnd):
+                self.confirmed.pop(entry.result.txid, None)
+            del self.timestamps[rnd]
+
+    # -- transaction processing -------------------------------------------
+    def _evaluate_group(
+        self,
+        signed: list[dict[str, Any]],
+        *,
+        extra_budget: int = 0,
+    ) -> tuple[State, GroupContext, list[ApplyResult]]:
+        if not signed:
+            raise TxnError("empty transaction group")
+        if len(signed) > MAX_GROUP_SIZE:
+            raise TxnError(f"group size {len(signed)} exceeds {MAX_GROUP_SIZE}")
+        txns = [stxn["txn"] for stxn in signed]
+        txids = [txn_id(txn) for txn in txns]
+        if len(txns) > 1 and len({txn.get("grp") for txn in txns}) != 1:
+            raise TxnError("transactions are not grouped", txids[0])
+        state = self.state.fork()
+        next_round = state.round + 1
+        for txn, txid in zip(txns, txids, strict=True):
+            if not txn.get("fv", 0) <= next_round <= txn.get("lv", 0):
+                raise TxnError(
+                    f"txn dead: round {next_round} outside of "
+                    f"{txn.get('fv', 0)}--{txn.get('lv', 0)}",
+                    txid,
+                )
+        ctx = GroupContext(state, self.programs, txns, extra_budget=extra_budget)
+        if ctx.fee_credit < 0:
+            raise TxnError(
+                f"txgroup had {ctx.fee_credit + MIN_TXN_FEE * len(txns)} in fees, "
+                f"which is less than the minimum {MIN_TXN_FEE * len(txns)}",
+                txids[0],
+            )
+        results = []
+        for index, (txn, txid) in enumerate(zip(txns, txids, strict=True)):
+            try:
+                result = apply_txn(ctx, txn)
+                ctx.results[index] = result
+                check_min_balances(ctx)
+            except TxnError as err:
+                raise TxnError(err.message, txid) from err
+            results.append(result)
+        return state, ctx, results
+
+    def submit(self, signed: list[dict[str, Any]]) -> list[str]:
+        """Evaluate one group and, if it succeeds, commit it as a new block."""
+        state, _ctx, results = self._evaluate_group(signed)
+        state.round += 1
+        state.timestamp += self.block_time + self.timestamp_offset
+        self.timestamp_offset = 0
+        confirmed = [
+            ConfirmedTxn(round=state.round, signed=stxn, result=result)
+            for stxn, result in zip(signed, results, strict=True)
+        ]
+        self.state = state
+        self.blocks[state.round] = confirmed
+        self.timestamps[state.round] = state.timestamp
+        for entry in confirmed:
+            self.confirmed[entry.result.txid] = entry
+        return [entry.result.txid for entry in confirmed]
+
+    def simulate(
+        self, signed: list[dict[str, Any]], *, extra_budget: int = 0
+    ) -> tuple[list[ApplyResult], GroupContext]:
+        """Evaluate a group without committing it; failures raise `TxnError`."""
+        _state, ctx, results = self._evaluate_group(signed, extra_budget=extra_budget)
+        return results, ctx
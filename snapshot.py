@@ -0,0 +1,127 @@
+"""Balances, asset holdings and app state of a set of accounts, and what a
+call changed in them.
+
+`take` reads each account once and the app once. Holdings are keyed by asset
+ID, not by their position in `account_info`'s asset list, which depends on
+everything the account ever opted in to.
+"""
+
+from base64 import b64decode
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+from algosdk.v2client.algod import AlgodClient
+
+StateValue = int | bytes
+
+
+@dataclass(frozen=True)
+class Diff:
+    # Changes only, as (before, after); None is not opted in, or not set
+    balances: dict[str, tuple[int, int]] = field(default_factory=dict)
+    holdings: dict[tuple[str, int], tuple[int | None, int | None]] = field(
+        default_factory=dict
+    )
+    state: dict[str, tuple[StateValue | None, StateValue | None]] = field(
+        default_factory=dict
+    )
+
+    def holding(self, address: str, asset: int) -> int:
+        """How much of `asset` `address` gained, negative if it lost some."""
+        before, after = self.holdings.get((address, asset), (0, 0))
+        return (after or 0) - (before or 0)
+
+    def __bool__(self) -> bool:
+        return bool(self.balances or self.holdings or self.state)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    last_round: int
+    balances: dict[str, int]
+    holdings: dict[str, dict[int, int]]
+    state: dict[str, StateValue]
+
+    def assets(self, address: str) -> dict[int, int]:
+        """Amount held of every asset `address` is opted in to."""
+        return self.holdings[address]
+
+    def holding(self, address: str, asset: int) -> int | None:
+        """None when `address` is not opted in to `asset`."""
+        return self.holdings[address].get(asset)
+
+    def diff(self, after: "Snapshot") -> Diff:
+        return Diff(
+            balances={
+                address: (amount, after.balances[address])
+                for address, amount in self.balances.items()
+                if after.balances[address] != amount
+            },
+            holdings={
+                (address, asset): (
+                    self.holding(address, asset),
+                    after.holding(address, asset),
+                )
+                for address in self.holdings
+                for asset in self.holdings[address].keys()
+                | after.holdings[address].keys()
+                if self.holding(address, asset) != after.holding(address, asset)
+            },
+            state={
+                key: (self.state.get(key), after.state.get(key))
+                for key in self.state.keys() | after.state.keys()
+                if self.state.get(key) != after.state.get(key)
+            },
+        )
+
+
+def decode_state(entries: list[dict[str, Any]]) -> dict[str, StateValue]:
+    state: dict[str, StateValue] = {}
+    for entry in entries:
+        value = entry["value"]
+        key = b64decode(entry["key"]).decode("utf-8", errors="replace")
+        state[key] = value["uint"] if value["type"] == 2 else b64decode(value["bytes"])
+    return state
+
+
+def take(
+    algod: AlgodClient, addresses: Iterable[str], app_id: int | None = None
+) -> Snapshot:
+    """One read of every address and of the global state of `app_id`."""
+    balances = {}
+    holdings = {}
+    last_round = 0
+    for address in addresses:
+        info = algod.account_info(address)
+        assert isinstance(info, dict)
+        balances[address] = info["amount"]
+        holdings[address] = {
+            holding["asset-id"]: holding["amount"] for holding in info.get("assets", [])
+        }
+        last_round = max(last_round, info.get("round", 0))
+    state: dict[str, StateValue] = {}
+    if app_id is not None:
+        app = algod.application_info(app_id)
+        assert isinstance(app, dict)
+        state = decode_state(app["params"].get("global-state", []))
+    return Snapshot(last_round, balances, holdings, state)
+
+
+class Tracker:
+    """Snapshots the same accounts call after call; `step` returns the changes
+    since the previous one."""
+
+    def __init__(
+        self, algod: AlgodClient, addresses: Iterable[str], app_id: int | None = None
+    ) -> None:
+        self.algod = algod
+        self.addresses = list(addresses)
+        self.app_id = app_id
+        self.last = take(algod, self.addresses, app_id)
+
+    def step(self) -> Diff:
+        now = take(self.algod, self.addresses, self.app_id)
+        changes = self.last.diff(now)
+        self.last = now
+        return changes
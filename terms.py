@@ -0,0 +1,53 @@
+"""Loan terms shared by the contracts: the repayment owed and the status of a loan.
+
+`interest` is a yearly rate with 2 decimal points, i.e. in basis points, and
+accrues by the second from the loan's start.
+"""
+
+from pyteal import *
+
+RATE_SCALE = 10_000
+YEAR = 31_556_926  # seconds
+
+# Loan status, as returned by the read-only methods
+EMPTY = 0  # no loan
+OPTED_IN = 1  # the app holds an opt-in to the NFT, but no request yet
+REQUESTED = 2  # waiting for a lender
+ACTIVE = 3  # lent, may be repaid
+EXPIRED = 4  # lent and past its duration, may be liquidated
+
+
+class LoanView(abi.NamedTuple):
+    nft: abi.Field[abi.Uint64]
+    token: abi.Field[abi.Uint64]
+    amount: abi.Field[abi.Uint64]
+    interest: abi.Field[abi.Uint64]
+    start: abi.Field[abi.Uint64]
+    duration: abi.Field[abi.Uint64]
+    borrower: abi.Field[abi.Address]
+    lender: abi.Field[abi.Address]
+    owed: abi.Field[abi.Uint64]  # to repay as of the latest block
+    status: abi.Field[abi.Uint8]
+
+
+def owed(amount: Expr, interest: Expr, start: Expr, later: Expr | None = None) -> Expr:
+    """The amount plus the interest accrued since `start`, `later` seconds after
+    the latest block. The product is taken in 128 bits, so it cannot overflow."""
+    return amount + WideRatio(
+        [amount, interest, Global.latest_timestamp() + (later or Int(0)) - start],
+        [Int(RATE_SCALE), Int(YEAR)],
+    )
+
+
+def status(nft: Expr, token: Expr, lent: Expr, deadline: Expr) -> Expr:
+    return (
+        If(nft == Int(0))
+        .Then(Int(EMPTY))
+        .ElseIf(token == Int(0))
+        .Then(Int(OPTED_IN))
+        .ElseIf(Not(lent))
+        .Then(Int(REQUESTED))
+        .ElseIf(Global.latest_timestamp() > deadline)
+        .Then(Int(EXPIRED))
+        .Else(Int(ACTIVE))
+    )
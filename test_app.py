@@ -1,12 +1,14 @@
 import pytest
+from algokit_utils import ApplicationSpecification
 from algosdk import transaction
-from algosdk.atomic_transaction_composer import (
-    AtomicTransactionComposer,
-    TransactionWithSigner,
-)
+from algosdk.atomic_transaction_composer import AtomicTransactionComposer, TransactionWithSigner
 from algosdk.dryrun_results import DryrunResponse
-from algosdk.encoding import encode_address
-from beaker import sandbox, client
+from algosdk.encoding import decode_address, encode_address
+
+import terms
+import views
+from app import REFUND_MBR
+from snapshot import Tracker, take
 
 ##########
 # fixtures
@@ -14,100 +16,39 @@ from beaker import sandbox, client
 
 
 @pytest.fixture(scope="function")
-def create_app():
-    global accounts
+def create_app(make_world):
     global creator
     global borrower
     global lender
     global app_client
+    global app_spec
     global sp
-    accounts = sorted(
-        sandbox.get_accounts(),
-        key=lambda a: sandbox.clients.get_algod_client().account_info(a.address)[
-            "amount"
-        ],
-    )
-
-    creator = accounts.pop()
-    borrower = accounts.pop()
-    lender = accounts.pop()
-
-    app_client = client.ApplicationClient(
-        app=open("./artifacts/application.json").read(),
-        client=sandbox.get_algod_client(),
-        signer=creator.signer,
-    )
-    sp=app_client.get_suggested_params()
-
-    # Borrower creates 1 NFT
     global nft
-    atc = AtomicTransactionComposer()
-    sp.fee = sp.min_fee
-    nft_create = TransactionWithSigner(
-        txn=transaction.AssetCreateTxn(
-            sender=borrower.address,
-            total=1,
-            decimals=0,
-            default_frozen=False,
-            unit_name="NFT",
-            asset_name="Beaker NFT",
-            sp=sp,
-        ),
-        signer=borrower.signer,
-    )
-    atc.add_transaction(nft_create)
-    tx_id = atc.execute(sandbox.get_algod_client(), 3).tx_ids[0]
-    nft = sandbox.get_algod_client().pending_transaction_info(tx_id)["asset-index"]
-
-    # Lender creates 10 Tokens
     global token
-    atc = AtomicTransactionComposer()
-    sp.fee = sp.min_fee * 2
-    token_create = TransactionWithSigner(
-        txn=transaction.AssetCreateTxn(
-            sender=lender.address,
-            total=10,
-            decimals=0,
-            default_frozen=False,
-            unit_name="TOKEN",
-            asset_name="Beaker TOKEN",
-            sp=sp,
-        ),
-        signer=lender.signer,
-    )
-    atc.add_transaction(token_create)
-    tx_id = atc.execute(sandbox.get_algod_client(), 3).tx_ids[0]
-    token = sandbox.get_algod_client().pending_transaction_info(tx_id)["asset-index"]
-
-    # opt-in Borrower to Token
-    txn = TransactionWithSigner(
-        txn=transaction.AssetOptInTxn(borrower.address, sp, token),
-        signer=borrower.signer,
-    )
-    atc = AtomicTransactionComposer()
-    atc.add_transaction(txn)
-    atc.execute(sandbox.get_algod_client(), 3).tx_ids[0]
-
-    # opt-in Lender to NFT
-    txn = TransactionWithSigner(
-        txn=transaction.AssetOptInTxn(lender.address, sp, nft),
-        signer=lender.signer,
-    )
-    atc = AtomicTransactionComposer()
-    atc.add_transaction(txn)
-    atc.execute(sandbox.get_algod_client(), 3).tx_ids[0]
-
-    app_client.create()
-    app_client.fund(200_000)
+    # Borrower creates 1 NFT, Lender creates 10 Tokens, both opt in to the
+    # other's asset and the app is created and funded, in two atomic groups
+    app_spec = ApplicationSpecification.from_json(open("./artifacts/application.json").read())
+    world = make_world(app_spec)
+    creator = world.creator
+    borrower = world.borrower
+    lender = world.lender
+    app_client = world.app_client
+    nft = world.nft
+    token = world.token
+    sp=app_client.get_suggested_params()
     
+def snapshot():
+    # The app, Borrower and Lender accounts and the app's state, in one pass
+    return take(app_client.client, [app_client.app_addr, borrower.address, lender.address], app_client.app_id)
+
 @pytest.fixture(scope="function")
-def opt_app_in_nft():
+def opt_app_in_nft(stage):
     sp.fee = sp.min_fee * 2
-    app_client.call("opt_app_in_nft", nft=nft, signer=borrower.signer, suggested_params=sp)
+    stage("opt_app_in_nft", lambda: app_client.call("opt_app_in_nft", nft=nft, signer=borrower.signer, suggested_params=sp))
 
 
 @pytest.fixture(scope="function")
-def request_loan():
+def request_loan(stage):
     global amount
     global duration
     global interest
@@ -127,22 +68,64 @@ def request_loan():
     amount=5
     duration=100
     interest=1
-    app_client.call(
+    stage("request_loan", lambda: app_client.call(
         "request_loan", 
         token=token,
         amount=amount,
         duration=duration,
         interest=1,
         axfer=axfer,
-        signer=borrower.signer)
+        signer=borrower.signer))
+
+def list_loan_group(with_axfer=True):
+    # The NFT transfer follows the app call, which opts the app into the NFT
+    global amount
+    global duration
+    global interest
+    amount=5
+    duration=100
+    interest=1
+    sp.fee = sp.min_fee * 2
+    atc = AtomicTransactionComposer()
+    app_client.add_method_call(
+        atc,
+        "list_loan",
+        nft=nft,
+        token=token,
+        amount=amount,
+        duration=duration,
+        interest=interest,
+        signer=borrower.signer,
+        suggested_params=sp,
+    )
+    if with_axfer:
+        sp.fee = sp.min_fee
+        atc.add_transaction(
+            TransactionWithSigner(
+                txn=transaction.AssetTransferTxn(
+                    sender=borrower.address,
+                    receiver=app_client.app_addr,
+                    index=nft,
+                    amt=1,
+                    sp=sp,
+                ),
+                signer=borrower.signer,
+            )
+        )
+    return atc
 
 @pytest.fixture(scope="function")
-def delete_request():
+def list_loan(stage):
+    atc = list_loan_group()
+    stage("list_loan", lambda: atc.execute(app_client.client, 3))
+
+@pytest.fixture(scope="function")
+def delete_request(stage):
     sp.fee = sp.min_fee * 2
-    app_client.call("delete_request", signer=borrower.signer, foreign_assets=[nft], suggested_params=sp)
+    stage("delete_request", lambda: app_client.call("delete_request", signer=borrower.signer, foreign_assets=[nft], suggested_params=sp))
 
 @pytest.fixture(scope="function")
-def accept_loan():
+def accept_loan(stage):
     # Lender transfers the Tokens
     axfer = TransactionWithSigner(
         txn=transaction.AssetTransferTxn(
@@ -154,27 +137,29 @@ def accept_loan():
         ),
         signer=lender.signer,
     )
-    app_client.call("accept_loan", loan=axfer, signer=lender.signer)
+    stage("accept_loan", lambda: app_client.call("accept_loan", loan=axfer, signer=lender.signer))
 
 @pytest.fixture(scope="function")
-def repay_loan():
-    # Borrower transfers the Tokens back to the Lender
-    axfer = TransactionWithSigner(
-        txn=transaction.AssetTransferTxn(
-            sender=borrower.address,
-            receiver=lender.address,
-            index=token,
-            amt=amount, # TODO: fix interest + interest * (latest_timestamp - start) / 31556926
-            sp=sp,
-        ),
-        signer=borrower.signer,
-    )
-    app_client.call("repay_loan", loan=axfer, signer=borrower.signer, foreign_assets=[nft])
+def repay_loan(stage):
+    def repay():
+        # Borrower transfers the Tokens back to the Lender, with the interest
+        axfer = TransactionWithSigner(
+            txn=transaction.AssetTransferTxn(
+                sender=borrower.address,
+                receiver=lender.address,
+                index=token,
+                amt=views.quote(app_client.client, app_spec, borrower.address, app_client.app_id, later=10),
+                sp=sp,
+            ),
+            signer=borrower.signer,
+        )
+        app_client.call("repay_loan", loan=axfer, signer=borrower.signer, foreign_assets=[nft])
+    stage("repay_loan", repay)
 
 @pytest.fixture(scope="function")
-def liquidate_loan():
+def liquidate_loan(stage):
     sp.fee = sp.min_fee * 2
-    app_client.call("liquidate_loan", signer=lender.signer, foreign_assets=[nft], suggested_params=sp)
+    stage("liquidate_loan", lambda: app_client.call("liquidate_loan", signer=lender.signer, foreign_assets=[nft], suggested_params=sp))
 
 
 ##############
@@ -184,7 +169,8 @@ def liquidate_loan():
 
 @pytest.mark.create
 def test_create_state(create_app):
-    state = app_client.get_global_state()
+    snap = snapshot()
+    state = snap.state
     print(f"create: {state}\n")
     assert state["nft"] == 0
     assert state["token"] == 0
@@ -192,20 +178,16 @@ def test_create_state(create_app):
     assert state["interest"] == 0
     assert state["start"] == 0
     assert state["duration"] == 0
-    assert state["borrower"] == ""
-    assert state["lender"] == ""
+    assert state["borrower"] == b""
+    assert state["lender"] == b""
     # App has [] assets
-    assert app_client.client.account_info(app_client.app_addr)["assets"] == []
+    assert snap.assets(app_client.app_addr) == {}
     # Borrower has 1 NFT and 0 TOKENS
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["amount"] == 1
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["amount"] == 0
+    assert snap.holding(borrower.address, nft) == 1
+    assert snap.holding(borrower.address, token) == 0
     # Lender has 0 NFT and 10 TOKENS
-    assert app_client.client.account_info(lender.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(lender.address)["assets"][-2]["amount"] == 0
-    assert app_client.client.account_info(lender.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(lender.address)["assets"][-1]["amount"] == 10
+    assert snap.holding(lender.address, nft) == 0
+    assert snap.holding(lender.address, token) == 10
 
 #############
 # OptIn tests
@@ -213,22 +195,18 @@ def test_create_state(create_app):
 
 @pytest.mark.opt_app_in_nft
 def test_opt_app_in_nft(create_app, opt_app_in_nft):
-    state = app_client.get_global_state()
+    snap = snapshot()
+    state = snap.state
     print(f"opt_app_in_nft: {state}\n")
     # App has 0 NFT
     assert state["nft"] == nft
-    assert app_client.client.account_info(app_client.app_addr)["assets"][-1]["asset-id"] == nft
-    assert app_client.client.account_info(app_client.app_addr)["assets"][-1]["amount"] == 0
+    assert snap.holding(app_client.app_addr, nft) == 0
     # Borrower has 1 NFT and 0 TOKENS
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["amount"] == 1
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["amount"] == 0
+    assert snap.holding(borrower.address, nft) == 1
+    assert snap.holding(borrower.address, token) == 0
     # Lender has 0 NFT and 10 TOKENS
-    assert app_client.client.account_info(lender.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(lender.address)["assets"][-2]["amount"] == 0
-    assert app_client.client.account_info(lender.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(lender.address)["assets"][-1]["amount"] == 10
+    assert snap.holding(lender.address, nft) == 0
+    assert snap.holding(lender.address, token) == 10
 
 
 #####################
@@ -237,33 +215,67 @@ def test_opt_app_in_nft(create_app, opt_app_in_nft):
 
 @pytest.mark.request_loan
 def test_request_loan(create_app, opt_app_in_nft, request_loan):
-    state = app_client.get_global_state()
+    snap = snapshot()
+    state = snap.state
     print(f"request_loan: {state}\n")
     assert state["token"] == token
     assert state["amount"] == amount
     assert state["duration"] == duration
     assert state["interest"] == interest
     # App has 1 NFT
-    assert app_client.client.account_info(app_client.app_addr)["assets"][-1]["asset-id"] == nft
-    assert app_client.client.account_info(app_client.app_addr)["assets"][-1]["amount"] == 1
+    assert snap.holding(app_client.app_addr, nft) == 1
     # Borrower has 0 NFT and 0 TOKENS
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["amount"] == 0
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["amount"] == 0
+    assert snap.holding(borrower.address, nft) == 0
+    assert snap.holding(borrower.address, token) == 0
     # Lender has 0 NFT and 10 TOKENS
-    assert app_client.client.account_info(lender.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(lender.address)["assets"][-2]["amount"] == 0
-    assert app_client.client.account_info(lender.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(lender.address)["assets"][-1]["amount"] == 10
+    assert snap.holding(lender.address, nft) == 0
+    assert snap.holding(lender.address, token) == 10
     
+##################
+# list_loan tests
+##################
+
+@pytest.mark.list_loan
+def test_list_loan(create_app, list_loan):
+    snap = snapshot()
+    state = snap.state
+    print(f"list_loan: {state}\n")
+    assert state["nft"] == nft
+    assert encode_address(state["borrower"]) == borrower.address
+    assert state["token"] == token
+    assert state["amount"] == amount
+    assert state["duration"] == duration
+    assert state["interest"] == interest
+    # App has 1 NFT
+    assert snap.holding(app_client.app_addr, nft) == 1
+    # Borrower has 0 NFT and 0 TOKENS
+    assert snap.holding(borrower.address, nft) == 0
+    assert snap.holding(borrower.address, token) == 0
+
+@pytest.mark.list_loan
+def test_list_loan_needs_nft_transfer(create_app):
+    with pytest.raises(Exception):
+        list_loan_group(with_axfer=False).execute(app_client.client, 3)
+    assert app_client.get_global_state()["nft"] == 0
+
+@pytest.mark.list_loan
+def test_list_then_accept_and_repay(create_app, list_loan, accept_loan, repay_loan):
+    snap = snapshot()
+    state = snap.state
+    assert state["nft"] == 0
+    assert state["borrower"] == b""
+    # Borrower has 1 NFT back and Lender 10 TOKENS
+    assert snap.holding(borrower.address, nft) == 1
+    assert snap.holding(lender.address, token) == 10
+
 ######################
 # delete_request tests
 ######################
 
 @pytest.mark.delete_request
 def test_delete_request(create_app, opt_app_in_nft, request_loan, delete_request):
-    state = app_client.get_global_state()
+    snap = snapshot()
+    state = snap.state
     print(f"delete_request: {state}\n")
     assert state["nft"] == 0
     assert state["token"] == 0
@@ -271,20 +283,16 @@ def test_delete_request(create_app, opt_app_in_nft, request_loan, delete_request
     assert state["interest"] == 0
     assert state["start"] == 0
     assert state["duration"] == 0
-    assert state["borrower"] == ""
-    assert state["lender"] == ""
+    assert state["borrower"] == b""
+    assert state["lender"] == b""
     # App has [] assets
-    assert app_client.client.account_info(app_client.app_addr)["assets"] == []
+    assert snap.assets(app_client.app_addr) == {}
     # Borrower has 1 NFT and 0 TOKENS
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["amount"] == 1
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["amount"] == 0
+    assert snap.holding(borrower.address, nft) == 1
+    assert snap.holding(borrower.address, token) == 0
     # Lender has 0 NFT and 10 TOKENS
-    assert app_client.client.account_info(lender.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(lender.address)["assets"][-2]["amount"] == 0
-    assert app_client.client.account_info(lender.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(lender.address)["assets"][-1]["amount"] == 10
+    assert snap.holding(lender.address, nft) == 0
+    assert snap.holding(lender.address, token) == 10
 
 ###################
 # accept_loan tests
@@ -292,22 +300,18 @@ def test_delete_request(create_app, opt_app_in_nft, request_loan, delete_request
 
 @pytest.mark.accept_loan
 def test_accept_loan(create_app, opt_app_in_nft, request_loan, accept_loan):
-    state = app_client.get_global_state()
+    snap = snapshot()
+    state = snap.state
     print(f"accept_loan: {state}\n")
-    assert encode_address(bytes.fromhex(state["lender"])) == lender.address
+    assert encode_address(state["lender"]) == lender.address
     # App has 1 NFT
-    assert app_client.client.account_info(app_client.app_addr)["assets"][-1]["asset-id"] == nft
-    assert app_client.client.account_info(app_client.app_addr)["assets"][-1]["amount"] == 1
+    assert snap.holding(app_client.app_addr, nft) == 1
     # Borrower has 0 NFT and 5 TOKENS
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["amount"] == 0
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["amount"] == 5
+    assert snap.holding(borrower.address, nft) == 0
+    assert snap.holding(borrower.address, token) == 5
     # Lender has 0 NFT and 5 TOKENS
-    assert app_client.client.account_info(lender.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(lender.address)["assets"][-2]["amount"] == 0
-    assert app_client.client.account_info(lender.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(lender.address)["assets"][-1]["amount"] == 5
+    assert snap.holding(lender.address, nft) == 0
+    assert snap.holding(lender.address, token) == 5
 
 ##################
 # repay_loan tests
@@ -315,7 +319,8 @@ def test_accept_loan(create_app, opt_app_in_nft, request_loan, accept_loan):
 
 @pytest.mark.repay_loan
 def test_repay_loan(create_app, opt_app_in_nft, request_loan, accept_loan, repay_loan):
-    state = app_client.get_global_state()
+    snap = snapshot()
+    state = snap.state
     print(f"repay_loan: {state}\n")
     assert state["nft"] == 0
     assert state["token"] == 0
@@ -323,20 +328,33 @@ def test_repay_loan(create_app, opt_app_in_nft, request_loan, accept_loan, repay
     assert state["interest"] == 0
     assert state["start"] == 0
     assert state["duration"] == 0
-    assert state["borrower"] == ""
-    assert state["lender"] == ""
+    assert state["borrower"] == b""
+    assert state["lender"] == b""
     # App has [] assets
-    assert app_client.client.account_info(app_client.app_addr)["assets"] == []
+    assert snap.assets(app_client.app_addr) == {}
     # Borrower has 1 NFT and 0 TOKENS
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["amount"] == 1
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["amount"] == 0
+    assert snap.holding(borrower.address, nft) == 1
+    assert snap.holding(borrower.address, token) == 0
     # Lender has 0 NFT and 10 TOKENS
-    assert app_client.client.account_info(lender.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(lender.address)["assets"][-2]["amount"] == 0
-    assert app_client.client.account_info(lender.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(lender.address)["assets"][-1]["amount"] == 10
+    assert snap.holding(lender.address, nft) == 0
+    assert snap.holding(lender.address, token) == 10
+
+@pytest.mark.repay_loan
+def test_repay_loan_changes(create_app, opt_app_in_nft, request_loan, accept_loan):
+    tracker = Tracker(app_client.client, [app_client.app_addr, borrower.address, lender.address], app_client.app_id)
+    repay(amount)
+    changes = tracker.step()
+    assert changes.holding(borrower.address, nft) == 1
+    assert changes.holding(borrower.address, token) == -amount
+    assert changes.holding(lender.address, token) == amount
+    # The app closed out of the NFT
+    assert changes.holdings[(app_client.app_addr, nft)] == (1, None)
+    assert changes.state["lender"] == (decode_address(lender.address), b"")
+    assert changes.state["nft"] == (nft, 0)
+    # Borrower paid the fees
+    before, after = changes.balances[borrower.address]
+    assert after < before
+    assert not tracker.step()
 
 ##################
 # repay_loan tests
@@ -344,7 +362,8 @@ def test_repay_loan(create_app, opt_app_in_nft, request_loan, accept_loan, repay
 
 @pytest.mark.liquidate_loan
 def test_liquidate_loan(create_app, opt_app_in_nft, request_loan, accept_loan, liquidate_loan):
-    state = app_client.get_global_state()
+    snap = snapshot()
+    state = snap.state
     print(f"liquidate_loan: {state}\n")
     assert state["nft"] == 0
     assert state["token"] == 0
@@ -352,18 +371,469 @@ def test_liquidate_loan(create_app, opt_app_in_nft, request_loan, accept_loan, l
     assert state["interest"] == 0
     assert state["start"] == 0
     assert state["duration"] == 0
-    assert state["borrower"] == ""
-    assert state["lender"] == ""
+    assert state["borrower"] == b""
+    assert state["lender"] == b""
     # App has [] assets
-    assert app_client.client.account_info(app_client.app_addr)["assets"] == []
+    assert snap.assets(app_client.app_addr) == {}
     # Borrower has 0 NFT and 5 TOKENS
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(borrower.address)["assets"][-2]["amount"] == 0
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(borrower.address)["assets"][-1]["amount"] == 5
+    assert snap.holding(borrower.address, nft) == 0
+    assert snap.holding(borrower.address, token) == 5
     # Lender has 1 NFT and 5 TOKENS
-    assert app_client.client.account_info(lender.address)["assets"][-2]["asset-id"] == nft
-    assert app_client.client.account_info(lender.address)["assets"][-2]["amount"] == 1
-    assert app_client.client.account_info(lender.address)["assets"][-1]["asset-id"] == token
-    assert app_client.client.account_info(lender.address)["assets"][-1]["amount"] == 5
+    assert snap.holding(lender.address, nft) == 1
+    assert snap.holding(lender.address, token) == 5
+
+
+#################
+# read-only tests
+#################
+
+def view():
+    return views.loan_views(app_client.client, app_spec, borrower.address, [app_client.app_id])[0]
+
+@pytest.mark.view
+def test_view_lifecycle(create_app):
+    assert view()["status"] == terms.EMPTY
+    assert view()["borrower"] == encode_address(bytes(32))
+    sp.fee = sp.min_fee * 2
+    app_client.call("opt_app_in_nft", nft=nft, signer=borrower.signer, suggested_params=sp)
+    assert view()["status"] == terms.OPTED_IN
+    assert view()["borrower"] == borrower.address
+
+@pytest.mark.view
+def test_view_requested(create_app, opt_app_in_nft, request_loan):
+    loan = view()
+    assert loan["status"] == terms.REQUESTED
+    assert loan["nft"] == nft
+    assert loan["token"] == token
+    assert loan["amount"] == amount
+    assert loan["interest"] == interest
+    assert loan["duration"] == duration
+    assert loan["owed"] == amount
+    assert loan["lender"] == encode_address(bytes(32))
+
+@pytest.mark.view
+def test_view_accepted(create_app, opt_app_in_nft, request_loan, accept_loan):
+    loan = view()
+    assert loan["status"] == terms.ACTIVE
+    assert loan["lender"] == lender.address
+    assert loan["start"] == app_client.get_global_state()["start"]
+    assert app_client.call("loan_status").return_value == terms.ACTIVE
+
+def lend_at(rate):
+    # A loan of 5 TOKENS at `rate` basis points a year, accepted
+    sp.fee = sp.min_fee * 2
+    app_client.call("opt_app_in_nft", nft=nft, signer=borrower.signer, suggested_params=sp)
+    sp.fee = sp.min_fee
+    axfer = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=borrower.address, receiver=app_client.app_addr, index=nft, amt=1, sp=sp
+        ),
+        signer=borrower.signer,
+    )
+    app_client.call(
+        "request_loan", token=token, amount=5, duration=100, interest=rate, axfer=axfer,
+        signer=borrower.signer,
+    )
+    loan = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=lender.address, receiver=borrower.address, index=token, amt=5, sp=sp
+        ),
+        signer=lender.signer,
+    )
+    app_client.call("accept_loan", loan=loan, signer=lender.signer)
 
+def repay(amt):
+    sp.fee = sp.min_fee
+    axfer = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=borrower.address, receiver=lender.address, index=token, amt=amt, sp=sp
+        ),
+        signer=borrower.signer,
+    )
+    sp.fee = sp.min_fee * 2
+    app_client.call("repay_loan", loan=axfer, signer=borrower.signer, foreign_assets=[nft], suggested_params=sp)
+
+@pytest.mark.view
+def test_quote_accrues_interest(create_app):
+    # 1 TOKEN of interest for every 10 seconds
+    lend_at(terms.RATE_SCALE * terms.YEAR // 10 // 5)
+    quote = lambda later=0: views.quote(app_client.client, app_spec, borrower.address, app_client.app_id, later)
+    assert quote(10) == quote() + 1
+    # The lender gives the borrower the TOKENS to pay the interest with, in a
+    # block stamped 20 seconds later
+    algod = app_client.client
+    algod.set_timestamp_offset(20)
+    sp.fee = sp.min_fee
+    txn = transaction.AssetTransferTxn(
+        sender=lender.address, receiver=borrower.address, index=token, amt=5, sp=sp
+    )
+    algod.send_transaction(txn.sign(lender.private_key))
+    transaction.wait_for_confirmation(algod, txn.get_txid(), 3)
+    algod.set_timestamp_offset(0)
+    assert quote() >= 7
+    assert view()["owed"] == quote()
+    # The principal alone no longer repays the loan
+    with pytest.raises(Exception):
+        repay(5)
+    owed = quote(10)
+    repay(owed)
+    assert app_client.get_global_state()["nft"] == 0
+    assert token_holding(lender) == owed
+
+###############
+# auction tests
+###############
+
+def auction_call(method, signer, **kwargs):
+    sp.fee = sp.min_fee * 2
+    app_client.call(method, signer=signer.signer, suggested_params=sp, foreign_assets=[token], **kwargs)
+
+def send(sender, receiver, asset, amt):
+    sp.fee = sp.min_fee
+    txn = transaction.AssetTransferTxn(sender=sender.address, receiver=receiver, index=asset, amt=amt, sp=sp)
+    app_client.client.send_transaction(txn.sign(sender.private_key))
+    transaction.wait_for_confirmation(app_client.client, txn.get_txid(), 3)
+
+def refund_box(bidder):
+    return (0, decode_address(bidder.address) + token.to_bytes(8, "big"))
+
+def place_bid(bidder, rate, outbid=None, paid=REFUND_MBR):
+    sp.fee = sp.min_fee
+    loan = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=bidder.address, receiver=app_client.app_addr, index=token, amt=amount, sp=sp
+        ),
+        signer=bidder.signer,
+    )
+    pay = TransactionWithSigner(
+        txn=transaction.PaymentTxn(bidder.address, sp, app_client.app_addr, paid),
+        signer=bidder.signer,
+    )
+    boxes = [refund_box(bidder)] + ([refund_box(outbid)] if outbid else [])
+    auction_call("place_bid", bidder, interest=rate, loan=loan, pay=pay, boxes=boxes)
+
+def claim_refund(bidder):
+    sp.fee = sp.min_fee * 3
+    app_client.call("claim_refund", token=token, signer=bidder.signer, suggested_params=sp, boxes=[refund_box(bidder)])
+
+def close_bidding(window):
+    # The next block is stamped past the end of bidding
+    app_client.client.set_timestamp_offset(window)
+    send(lender, lender.address, token, 0)
+    app_client.client.set_timestamp_offset(0)
+
+def token_holding(account):
+    return app_client.client.account_asset_info(account.address, token)["asset-holding"]["amount"]
+
+def lend():
+    sp.fee = sp.min_fee
+    loan = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=lender.address, receiver=borrower.address, index=token, amt=amount, sp=sp
+        ),
+        signer=lender.signer,
+    )
+    app_client.call("accept_loan", loan=loan, signer=lender.signer)
+
+@pytest.fixture(scope="function")
+def auction(create_app, opt_app_in_nft, request_loan):
+    # The app holds the tokens of the best bid, one more asset to hold;
+    # the creator gets tokens to bid against the lender
+    sp.fee = sp.min_fee
+    txn = transaction.PaymentTxn(creator.address, sp, app_client.app_addr, 100_000)
+    app_client.client.send_transaction(txn.sign(creator.private_key))
+    send(creator, creator.address, token, 0)
+    send(lender, creator.address, token, amount)
+    auction_call("start_auction", borrower, window=100)
+
+@pytest.mark.auction
+def test_lowest_bid_wins(auction):
+    # The first bid pays for the box of its refund
+    with pytest.raises(Exception):
+        place_bid(lender, interest, paid=REFUND_MBR - 1)
+    place_bid(lender, interest)
+    assert token_holding(lender) == 0
+    # A lower bid leaves the one it beats to be claimed back
+    place_bid(creator, interest - 1, outbid=lender)
+    assert token_holding(creator) == 0
+    assert token_holding(lender) == 0
+    balance = app_client.client.account_info(app_client.app_addr)["amount"]
+    claim_refund(lender)
+    assert token_holding(lender) == amount
+    # Along with the minimum balance of the box
+    assert app_client.client.account_info(app_client.app_addr)["amount"] == balance - REFUND_MBR
+    # Claimed once only, and the best bid cannot be
+    with pytest.raises(Exception):
+        claim_refund(lender)
+    with pytest.raises(Exception):
+        claim_refund(creator)
+    state = app_client.get_global_state()
+    assert state["best_bid"] == interest - 1
+    assert encode_address(bytes.fromhex(state["best_bidder"])) == creator.address
+    # Bids must be strictly lower
+    with pytest.raises(Exception):
+        place_bid(lender, interest - 1, outbid=creator)
+    with pytest.raises(Exception):
+        auction_call("settle_auction", lender, accounts=[borrower.address])
+    close_bidding(100)
+    with pytest.raises(Exception):
+        place_bid(lender, 0, outbid=creator)
+    auction_call("settle_auction", lender, accounts=[borrower.address])
+    state = app_client.get_global_state()
+    assert encode_address(bytes.fromhex(state["lender"])) == creator.address
+    assert state["interest"] == interest - 1
+    assert state["start"] > 0
+    assert state["bid_end"] == 0
+    assert state["best_bidder"] == ""
+    assert token_holding(borrower) == amount
+    # The app no longer holds the token, and the winner takes back the box
+    assert app_assets() == [nft]
+    claim_refund(creator)
+    assert app_client.get_box_names() == []
+
+@pytest.mark.auction
+def test_opted_out_bidder_does_not_block_the_auction(auction):
+    place_bid(creator, interest)
+    sp.fee = sp.min_fee
+    opt_out = transaction.AssetCloseOutTxn(creator.address, sp, lender.address, token)
+    app_client.client.send_transaction(opt_out.sign(creator.private_key))
+    transaction.wait_for_confirmation(app_client.client, opt_out.get_txid(), 3)
+    # The creator can no longer receive the token, but can be outbid
+    place_bid(lender, interest - 1, outbid=creator)
+    close_bidding(100)
+    auction_call("settle_auction", lender, accounts=[borrower.address])
+    assert token_holding(borrower) == amount
+    # The app keeps what it owes the creator until they opt in again
+    assert app_assets() == sorted([nft, token])
+    with pytest.raises(Exception):
+        claim_refund(creator)
+    send(creator, creator.address, token, 0)
+    claim_refund(creator)
+    assert token_holding(creator) == amount
+    # The last refund closes the app out of the token
+    assert app_assets() == [nft]
+
+@pytest.mark.auction
+def test_refunds_claimed_after_settling(auction):
+    # The usual order: the auction is settled first, then the losers claim
+    place_bid(lender, interest)
+    place_bid(creator, interest - 1, outbid=lender)
+    close_bidding(100)
+    auction_call("settle_auction", lender, accounts=[borrower.address])
+    assert app_assets() == sorted([nft, token])
+    claim_refund(lender)
+    assert token_holding(lender) == amount
+    assert app_assets() == [nft]
+
+@pytest.mark.auction
+def test_bids_above_the_asked_interest_fail(auction):
+    with pytest.raises(Exception):
+        place_bid(lender, interest + 1)
+    # Neither accepting nor deleting the request while bidding is open
+    with pytest.raises(Exception):
+        lend()
+    with pytest.raises(Exception):
+        sp.fee = sp.min_fee * 2
+        app_client.call("delete_request", signer=borrower.signer, foreign_assets=[nft], suggested_params=sp)
+
+@pytest.mark.auction
+def test_auction_without_bids(auction):
+    # Closing without a bid leaves the request open to accept_loan
+    close_bidding(100)
+    auction_call("settle_auction", lender, accounts=[borrower.address])
+    state = app_client.get_global_state()
+    assert state["lender"] == ""
+    assert state["bid_end"] == 0
+    assert state["token"] == token
+    lend()
+    assert encode_address(bytes.fromhex(app_client.get_global_state()["lender"])) == lender.address
+
+##############################
+# extend/refinance loan tests
+##############################
+
+def app_assets():
+    return sorted(snapshot().assets(app_client.app_addr))
+
+def extend(signer, paid):
+    sp.fee = sp.min_fee
+    payment = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=borrower.address, receiver=lender.address, index=token, amt=paid, sp=sp
+        ),
+        signer=borrower.signer,
+    )
+    app_client.call("extend_loan", duration=200, payment=payment, signer=signer.signer)
+
+def refinance(paid):
+    sp.fee = sp.min_fee
+    payoff = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=creator.address, receiver=lender.address, index=token, amt=paid, sp=sp
+        ),
+        signer=creator.signer,
+    )
+    app_client.call("refinance_loan", duration=300, interest=0, payoff=payoff, signer=borrower.signer)
+
+@pytest.mark.extend_loan
+def test_extend_loan(create_app, opt_app_in_nft, request_loan, accept_loan):
+    start = app_client.get_global_state()["start"]
+    # Only the lender may extend
+    with pytest.raises(Exception):
+        extend(borrower, 0)
+    extend(lender, 0)
+    state = app_client.get_global_state()
+    assert state["duration"] == 200
+    assert state["start"] >= start
+    assert encode_address(bytes.fromhex(state["lender"])) == lender.address
+    assert app_assets() == [nft]
+
+@pytest.mark.extend_loan
+def test_extend_loan_pays_the_interest(create_app):
+    lend_at(terms.RATE_SCALE * terms.YEAR // 10 // 5)
+    close_bidding(20)
+    # At least 2 TOKENS of interest are due after 20 seconds
+    with pytest.raises(Exception):
+        extend(lender, 1)
+    extend(lender, 5)
+    assert app_client.get_global_state()["duration"] == 200
+    assert view()["owed"] == 5
+
+@pytest.mark.refinance_loan
+def test_refinance_loan(create_app, opt_app_in_nft, request_loan, accept_loan):
+    send(creator, creator.address, token, 0)
+    send(lender, creator.address, token, 5)
+    # The payoff must cover what is owed
+    with pytest.raises(Exception):
+        refinance(4)
+    refinance(5)
+    state = app_client.get_global_state()
+    assert encode_address(bytes.fromhex(state["lender"])) == creator.address
+    assert state["amount"] == 5
+    assert state["interest"] == 0
+    assert state["duration"] == 300
+    assert app_assets() == [nft]
+    # The old lender got its 5 TOKENS back
+    assert token_holding(lender) == 5
+    # The loan is now repaid to the new lender
+    sp.fee = sp.min_fee * 2
+    loan = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=borrower.address, receiver=creator.address, index=token, amt=5, sp=sp
+        ),
+        signer=borrower.signer,
+    )
+    app_client.call("repay_loan", loan=loan, signer=borrower.signer, foreign_assets=[nft], suggested_params=sp)
+    assert token_holding(creator) == 5
+    assert app_assets() == []
+
+##############
+# bundle tests
+##############
+
+@pytest.fixture(scope="function")
+def bundle(make_world):
+    global borrower
+    global lender
+    global app_client
+    global app_spec
+    global sp
+    global nfts
+    global token
+    # Borrower creates 3 NFTs, and the app is funded to hold all of them
+    app_spec = ApplicationSpecification.from_json(open("./artifacts/application.json").read())
+    world = make_world(app_spec, nfts=3, fund=400_000)
+    borrower = world.borrower
+    lender = world.lender
+    app_client = world.app_client
+    nfts = world.nfts
+    token = world.token
+    sp = app_client.get_suggested_params()
+    sp.fee = sp.min_fee * 4
+    app_client.call("opt_app_in_bundle", nfts=nfts, signer=borrower.signer, suggested_params=sp, foreign_assets=nfts)
+
+def request_bundle(order):
+    sp.fee = sp.min_fee
+    atc = AtomicTransactionComposer()
+    axfers = [
+        TransactionWithSigner(
+            txn=transaction.AssetTransferTxn(
+                sender=borrower.address, receiver=app_client.app_addr, index=item, amt=1, sp=sp
+            ),
+            signer=borrower.signer,
+        )
+        for item in order
+    ]
+    for axfer in axfers[1:]:
+        atc.add_transaction(axfer)
+    app_client.add_method_call(
+        atc, "request_loan", token=token, amount=5, duration=100, interest=1, axfer=axfers[0],
+        signer=borrower.signer, suggested_params=sp,
+    )
+    atc.execute(app_client.client, 3)
+
+def close_bundle(method, signer):
+    sp.fee = sp.min_fee * 5
+    app_client.call(method, signer=signer.signer, foreign_assets=nfts, suggested_params=sp)
+
+def holds(account, item):
+    return app_client.client.account_asset_info(account, item)["asset-holding"]["amount"]
+
+@pytest.mark.bundle
+def test_bundle_nfts_are_unique(make_world):
+    world = make_world(ApplicationSpecification.from_json(open("./artifacts/application.json").read()), nfts=3, fund=400_000)
+    sp = world.app_client.get_suggested_params()
+    sp.fee = sp.min_fee * 4
+    first, second, third = world.nfts
+    # Pledging an NFT twice, or out of order, fails
+    for order in ([first, second, first], [first, first], [second, first, third]):
+        with pytest.raises(Exception):
+            world.app_client.call("opt_app_in_bundle", nfts=order, signer=world.borrower.signer, suggested_params=sp, foreign_assets=world.nfts)
+    world.app_client.call("opt_app_in_bundle", nfts=world.nfts, signer=world.borrower.signer, suggested_params=sp, foreign_assets=world.nfts)
+
+@pytest.mark.bundle
+def test_request_bundle(bundle):
+    state = app_client.get_global_state()
+    assert state["nft"] == nfts[0]
+    assert bytes.fromhex(state["bundle"]) == b"".join(item.to_bytes(8, "big") for item in nfts[1:])
+    assert app_assets() == nfts
+    # The rest of the bundle must come in order, before the NFT
+    with pytest.raises(Exception):
+        request_bundle([nfts[0], nfts[2], nfts[1]])
+    request_bundle(nfts)
+    assert [holds(app_client.app_addr, item) for item in nfts] == [1, 1, 1]
+    assert app_client.get_global_state()["token"] == token
+
+@pytest.mark.bundle
+def test_repay_bundle(bundle):
+    request_bundle(nfts)
+    lend()
+    sp.fee = sp.min_fee
+    loan = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=borrower.address, receiver=lender.address, index=token, amt=5, sp=sp
+        ),
+        signer=borrower.signer,
+    )
+    sp.fee = sp.min_fee * 5
+    app_client.call("repay_loan", loan=loan, signer=borrower.signer, foreign_assets=nfts, suggested_params=sp)
+    assert [holds(borrower.address, item) for item in nfts] == [1, 1, 1]
+    assert app_assets() == []
+    assert app_client.get_global_state()["bundle"] == ""
+
+@pytest.mark.bundle
+def test_liquidate_bundle(bundle):
+    request_bundle(nfts)
+    lend()
+    for item in nfts:
+        send(lender, lender.address, item, 0)
+    close_bundle("liquidate_loan", lender)
+    assert [holds(lender.address, item) for item in nfts] == [1, 1, 1]
+    assert app_assets() == []
+
+@pytest.mark.bundle
+def test_delete_bundle(bundle):
+    request_bundle(nfts)
+    close_bundle("delete_request", borrower)
+    assert [holds(borrower.address, item) for item in nfts] == [1, 1, 1]
+    assert app_assets() == []
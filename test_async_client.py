@@ -0,0 +1,208 @@
+import asyncio
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from algokit_utils import ApplicationSpecification
+from algosdk import transaction
+from algosdk.v2client.algod import AlgodClient
+from beaker.localnet import LocalAccount
+
+import terms
+from async_client import AsyncAlgod, HttpAlgod, LoanClient, LocalAlgod
+from world import World, build_world
+
+AMOUNT = 5
+DURATION = 1_000_000
+INTEREST = 1
+
+##########
+# fixtures
+##########
+
+
+class CountingAlgod(LocalAlgod):
+    def __init__(self, algod: AlgodClient) -> None:
+        super().__init__(algod)
+        self.paths: list[str] = []
+
+    async def request(
+        self, method: str, path: str, data: bytes | None = None
+    ) -> dict[str, Any]:
+        self.paths.append(path)
+        return await super().request(method, path, data)
+
+
+@pytest.fixture(scope="function")
+def aio(algod: AlgodClient, backend: str) -> AsyncAlgod:
+    if backend == "sim":
+        return CountingAlgod(algod)
+    return HttpAlgod.from_client(algod)
+
+
+def clients(
+    aio: AsyncAlgod, app_spec: ApplicationSpecification, world: World
+) -> tuple[LoanClient, LoanClient]:
+    app_id = world.app_client.app_id
+    return (
+        LoanClient(aio, app_spec, app_id, world.borrower),
+        LoanClient(aio, app_spec, app_id, world.lender),
+    )
+
+
+async def lifecycle(
+    aio: AsyncAlgod, app_spec: ApplicationSpecification, world: World, close: str
+) -> None:
+    borrower, lender = clients(aio, app_spec, world)
+    await borrower.opt_app_in_nft(world.nft)
+    await borrower.request_loan(world.nft, world.token, AMOUNT, DURATION, INTEREST)
+    await lender.accept_loan(world.token, AMOUNT, world.borrower.address)
+    if close == "repay":
+        await borrower.repay_loan(world.nft, world.token, world.lender.address)
+    else:
+        await lender.liquidate_loan(world.nft)
+
+
+def holding(world: World, address: str, asset: int) -> int:
+    info = world.app_client.client.account_asset_info(address, asset)
+    assert isinstance(info, dict)
+    return info["asset-holding"]["amount"]
+
+
+#######
+# tests
+#######
+
+
+@pytest.mark.async_client
+def test_full_lifecycle(
+    make_world: Callable[..., World],
+    aio: AsyncAlgod,
+    app_spec: ApplicationSpecification,
+) -> None:
+    world = make_world(app_spec)
+
+    async def run() -> None:
+        borrower, lender = clients(aio, app_spec, world)
+        await borrower.opt_app_in_nft(world.nft)
+        await borrower.request_loan(world.nft, world.token, AMOUNT, DURATION, INTEREST)
+        state = world.app_client.get_global_state()
+        assert state["token"] == world.token
+        assert state["duration"] == DURATION
+        await lender.accept_loan(world.token, AMOUNT, world.borrower.address)
+        assert world.app_client.get_global_state()["lender"] != ""
+        await borrower.repay_loan(world.nft, world.token, world.lender.address)
+        await aio.close()
+
+    asyncio.run(run())
+    state = world.app_client.get_global_state()
+    assert state["nft"] == 0
+    assert holding(world, world.borrower.address, world.nft) == 1
+    assert holding(world, world.lender.address, world.token) == 10
+
+
+@pytest.mark.async_client
+def test_failed_call_raises(
+    make_world: Callable[..., World],
+    aio: AsyncAlgod,
+    app_spec: ApplicationSpecification,
+) -> None:
+    world = make_world(app_spec)
+
+    async def run() -> None:
+        _, lender = clients(aio, app_spec, world)
+        with pytest.raises(Exception):
+            await lender.liquidate_loan(world.nft)
+        await aio.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.async_client
+def test_concurrent_lifecycles(
+    algod: AlgodClient,
+    accounts: list[LocalAccount],
+    aio: AsyncAlgod,
+    app_spec: ApplicationSpecification,
+) -> None:
+    # One app per borrower/lender pair, all driven from one event loop
+    worlds = [build_world(algod, accounts, app_spec) for _ in range(6)]
+
+    async def run() -> None:
+        await asyncio.gather(
+            *(
+                lifecycle(aio, app_spec, world, "repay" if i % 2 else "liquidate")
+                for i, world in enumerate(worlds)
+            )
+        )
+        await aio.close()
+
+    asyncio.run(run())
+    for i, world in enumerate(worlds):
+        owner = world.borrower if i % 2 else world.lender
+        assert holding(world, owner.address, world.nft) == 1
+        assert world.app_client.get_global_state()["nft"] == 0
+    if isinstance(aio, CountingAlgod):
+        # The pairs move in step, so each step's calls share one fetch of the
+        # suggested params
+        assert aio.paths.count("/transactions") == 6 * 4
+        assert aio.paths.count("/transactions/params") <= 4
+
+
+@pytest.mark.async_client
+def test_list_loan(
+    make_world: Callable[..., World],
+    aio: AsyncAlgod,
+    app_spec: ApplicationSpecification,
+) -> None:
+    world = make_world(app_spec)
+
+    async def run() -> None:
+        borrower, lender = clients(aio, app_spec, world)
+        await borrower.list_loan(world.nft, world.token, AMOUNT, DURATION, INTEREST)
+        await lender.accept_loan(world.token, AMOUNT, world.borrower.address)
+        await aio.close()
+
+    asyncio.run(run())
+    state = world.app_client.get_global_state()
+    assert state["nft"] == world.nft
+    assert state["token"] == world.token
+    assert holding(world, world.app_addr, world.nft) == 1
+    assert holding(world, world.borrower.address, world.token) == AMOUNT
+
+
+@pytest.mark.async_client
+def test_repay_loan_pays_the_quote(
+    make_world: Callable[..., World],
+    aio: AsyncAlgod,
+    app_spec: ApplicationSpecification,
+) -> None:
+    world = make_world(app_spec)
+    # 200% a year, repaid a tenth of a year ahead: 1 token of interest, which
+    # the lender gives the borrower
+    interest = 2 * terms.RATE_SCALE
+    later = terms.YEAR // 10
+    algod = world.app_client.client
+    sp = algod.suggested_params()
+    gift = transaction.AssetTransferTxn(
+        world.lender.address, sp, world.borrower.address, 1, world.token
+    )
+    transaction.wait_for_confirmation(
+        algod, algod.send_transaction(gift.sign(world.lender.private_key)), 3
+    )
+    owed: list[int] = []
+
+    async def run() -> None:
+        borrower, lender = clients(aio, app_spec, world)
+        await borrower.opt_app_in_nft(world.nft)
+        await borrower.request_loan(world.nft, world.token, AMOUNT, DURATION, interest)
+        await lender.accept_loan(world.token, AMOUNT, world.borrower.address)
+        owed.extend([await borrower.quote(), await borrower.quote(later)])
+        await borrower.repay_loan(world.nft, world.token, world.lender.address, later)
+        await aio.close()
+
+    asyncio.run(run())
+    assert owed == [AMOUNT, AMOUNT + 1]
+    assert world.app_client.get_global_state()["nft"] == 0
+    assert holding(world, world.borrower.address, world.token) == 0
+    assert holding(world, world.lender.address, world.token) == 10
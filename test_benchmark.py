@@ -0,0 +1,29 @@
+import pytest
+from algosdk.v2client.algod import AlgodClient
+from beaker.localnet import LocalAccount
+
+import benchmark
+
+
+@pytest.mark.benchmark
+def test_no_cost_regression(algod: AlgodClient, accounts: list[LocalAccount]) -> None:
+    result = benchmark.profile(algod, accounts)
+    print(benchmark.report(result))
+    for method in result.methods.values():
+        assert method.headroom >= 0
+    assert benchmark.regressions(result, benchmark.load_baseline()) == []
+
+
+@pytest.mark.benchmark
+def test_unprofiled_methods_fail() -> None:
+    baseline = benchmark.load_baseline()
+    current = benchmark.Profile(
+        approval_size=baseline.approval_size,
+        clear_size=baseline.clear_size,
+        methods={
+            name: method
+            for name, method in baseline.methods.items()
+            if not name.startswith("view")
+        },
+    )
+    assert benchmark.regressions(current, baseline) == ["view: not profiled"]
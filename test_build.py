@@ -0,0 +1,95 @@
+from pathlib import Path
+
+import pytest
+
+import build
+
+CONTRACT = """from beaker import Application
+from pyteal import Approve, Expr
+
+from tiny_helper import NAME
+
+app = Application(NAME)
+
+
+@app.external
+def ping() -> Expr:
+    return Approve()
+
+
+if __name__ == "__main__":
+    import build
+"""
+
+
+@pytest.fixture(scope="function")
+def root(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    (tmp_path / "tiny_contract.py").write_text(CONTRACT)
+    (tmp_path / "tiny_helper.py").write_text('NAME = "Tiny"\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.build
+def test_local_sources_follow_imports(root: Path) -> None:
+    # Imports under `if __name__ == "__main__":` are not part of the build
+    assert list(build.local_sources("tiny_contract", root)) == [
+        "tiny_contract",
+        "tiny_helper",
+    ]
+
+
+@pytest.mark.build
+def test_build_is_skipped_while_fresh(root: Path) -> None:
+    out = root / "artifacts"
+    assert build.is_stale("tiny_contract", out, root=root)
+    assert build.build("tiny_contract", out, root=root)
+    assert (out / "application.json").exists()
+    assert not build.is_stale("tiny_contract", out, root=root)
+    assert not build.build("tiny_contract", out, root=root)
+    assert build.build("tiny_contract", out, root=root, force=True)
+
+
+@pytest.mark.build
+def test_stale_on_dependency_or_options_change(root: Path) -> None:
+    out = root / "artifacts"
+    build.build("tiny_contract", out, root=root)
+    assert build.is_stale("tiny_contract", out, {"expiry": "1"}, root=root)
+    (root / "tiny_helper.py").write_text('NAME = "Tinier"\n')
+    assert build.is_stale("tiny_contract", out, root=root)
+    (out / build.STAMP).write_text("not json")
+    assert build.is_stale("tiny_contract", out, root=root)
+
+
+@pytest.mark.build
+def test_options_reach_the_contract(root: Path) -> None:
+    (root / "tiny_helper.py").write_text(
+        'import os\n\nNAME = "Tiny" + os.environ.get("BUILD_SUFFIX", "")\n'
+    )
+    plain = root / "plain"
+    suffixed = root / "suffixed"
+    build.build("tiny_contract", plain, root=root)
+    build.build("tiny_contract", suffixed, {"suffix": "Ier"}, root=root)
+    assert '"name": "Tiny"' in (plain / "application.json").read_text()
+    assert '"name": "TinyIer"' in (suffixed / "application.json").read_text()
+    assert not build.is_stale("tiny_contract", suffixed, {"suffix": "Ier"}, root=root)
+
+
+@pytest.mark.build
+def test_matrix_builds_each_variant_once(
+    root: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (root / "tiny_helper.py").write_text(
+        'import os\n\nNAME = "Tiny" + os.environ.get("BUILD_SUFFIX", "")\n'
+    )
+    monkeypatch.setitem(build.TARGETS, "tiny_contract", root / "artifacts")
+    axes = {"suffix": ["A", "B"], "optimize": ["0"]}
+    # One worker exports both, importing tiny_helper again for the second
+    built = build.build_matrix(["tiny_contract"], axes, workers=1, root=root)
+    assert list(built.values()) == [True, True]
+    for suffix in "AB":
+        out = root / "artifacts" / f"optimize=0,suffix={suffix}"
+        assert f'"name": "Tiny{suffix}"' in (out / "application.json").read_text()
+    assert build.build_matrix(["tiny_contract"], axes, root=root) == dict.fromkeys(
+        built, False
+    )
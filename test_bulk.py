@@ -0,0 +1,180 @@
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from algokit_utils import ApplicationSpecification
+from algosdk import transaction
+from algosdk.atomic_transaction_composer import TransactionWithSigner
+from algosdk.constants import ZERO_ADDRESS
+from algosdk.v2client.algod import AlgodClient
+from beaker.localnet import LocalAccount
+
+import bulk
+from loan_book import LOAN_MBR
+from loan_index import LoanRecord
+from world import World, build_world
+
+AMOUNT = 1
+
+
+def holding(algod: AlgodClient, address: str, asset: int) -> int:
+    info = algod.account_asset_info(address, asset)
+    assert isinstance(info, dict)
+    return info["asset-holding"]["amount"]
+
+
+def last_round(algod: AlgodClient) -> int:
+    status = algod.status()
+    assert isinstance(status, dict)
+    return status["last-round"]
+
+
+def list_loan(world: World, nft: int, *, boxes: bool = False) -> bulk.Listing:
+    app_client = world.app_client
+    sp = app_client.get_suggested_params()
+    sp.flat_fee = True
+    sp.fee = sp.min_fee * 2
+    box = [(0, nft.to_bytes(8, "big"))] if boxes else []
+    # The loan book's borrower pays for the opt-in and the box
+    pay: dict[str, Any] = {"pay": world.pay(world.borrower, LOAN_MBR)} if boxes else {}
+    app_client.call(
+        "opt_app_in_nft",
+        nft=nft,
+        **pay,
+        signer=world.borrower.signer,
+        suggested_params=sp,
+        boxes=box,
+    )
+    book: dict[str, Any] = {"nft": nft} if boxes else {}
+    app_client.call(
+        "request_loan",
+        **book,
+        token=world.token,
+        amount=AMOUNT,
+        duration=100,
+        interest=1,
+        axfer=TransactionWithSigner(
+            txn=transaction.AssetTransferTxn(
+                sender=world.borrower.address,
+                sp=app_client.get_suggested_params(),
+                receiver=world.app_addr,
+                amt=1,
+                index=nft,
+            ),
+            signer=world.borrower.signer,
+        ),
+        signer=world.borrower.signer,
+        boxes=box,
+    )
+    return bulk.Listing(
+        app_client.app_id, nft, world.token, AMOUNT, world.borrower.address
+    )
+
+
+def spread(algod: AlgodClient, accounts: list[LocalAccount]) -> None:
+    # Open up the gaps between the balances, so that every world built from the
+    # accounts gives them the same roles
+    def balance(account: LocalAccount) -> int:
+        info = algod.account_info(account.address)
+        assert isinstance(info, dict)
+        return info["amount"]
+
+    creator, _, lender = sorted(accounts, key=balance, reverse=True)[:3]
+    sp = algod.suggested_params()
+    txn = transaction.PaymentTxn(lender.address, sp, creator.address, 10_000_000)
+    algod.send_transaction(txn.sign(lender.private_key))
+    transaction.wait_for_confirmation(algod, txn.get_txid(), 3)
+
+
+def book_loan(world: World, nft: int) -> LoanRecord:
+    value = world.app_client.get_box_contents(nft.to_bytes(8, "big"))
+    return LoanRecord.decode(value)
+
+
+#####################
+# app.py, one per loan
+#####################
+
+
+@pytest.mark.bulk
+def test_accept_loans_across_apps(
+    algod: AlgodClient, accounts: list[LocalAccount], app_spec: ApplicationSpecification
+) -> None:
+    spread(algod, accounts)
+    worlds = [build_world(algod, accounts, app_spec) for _ in range(bulk.MAX_LOANS)]
+    listings = [list_loan(world, world.nft) for world in worlds]
+    lender = worlds[0].lender
+    before = last_round(algod)
+    bulk.accept_loans(algod, app_spec, lender, listings)
+    assert last_round(algod) == before + 1
+    for world in worlds:
+        assert world.app_client.get_global_state()["lender"] != ""
+        assert holding(algod, world.borrower.address, world.token) == AMOUNT
+
+
+@pytest.mark.bulk
+def test_accept_loans_is_all_or_none(
+    algod: AlgodClient, accounts: list[LocalAccount], app_spec: ApplicationSpecification
+) -> None:
+    spread(algod, accounts)
+    worlds = [build_world(algod, accounts, app_spec) for _ in range(3)]
+    listings = [list_loan(world, world.nft) for world in worlds]
+    # The last borrower asked for more than the lender offers
+    listings[-1] = bulk.Listing(**{**vars(listings[-1]), "amount": AMOUNT + 1})
+    with pytest.raises(Exception):
+        bulk.accept_loans(algod, app_spec, worlds[0].lender, listings)
+    for world in worlds:
+        assert world.app_client.get_global_state()["lender"] == ""
+        assert holding(algod, world.borrower.address, world.token) == 0
+
+
+@pytest.mark.bulk
+def test_group_limit(
+    app_spec: ApplicationSpecification, book_spec: ApplicationSpecification
+) -> None:
+    listing = bulk.Listing(1, 2, 3, 4, ZERO_ADDRESS)
+    with pytest.raises(ValueError):
+        bulk.accept_loans(
+            None,  # type: ignore[arg-type]
+            app_spec,
+            None,  # type: ignore[arg-type]
+            [listing] * (bulk.MAX_LOANS + 1),
+        )
+    with pytest.raises(ValueError):
+        bulk.accept_book_loans(None, book_spec, None, [])  # type: ignore[arg-type]
+
+
+##########################
+# loan_book.py, one for all
+##########################
+
+
+@pytest.mark.bulk
+def test_accept_book_loans(
+    make_world: Callable[..., World], book_spec: ApplicationSpecification
+) -> None:
+    world = make_world(
+        book_spec, nfts=bulk.MAX_BOOK_LOANS, token_total=20, fund=2_000_000
+    )
+    listings = [list_loan(world, nft, boxes=True) for nft in world.nfts]
+    bulk.accept_book_loans(world.app_client.client, book_spec, world.lender, listings)
+    for nft in world.nfts:
+        assert book_loan(world, nft).lender == world.lender.address
+    assert holding(
+        world.app_client.client, world.borrower.address, world.token
+    ) == AMOUNT * len(world.nfts)
+
+
+@pytest.mark.bulk
+def test_accept_book_loans_is_all_or_none(
+    make_world: Callable[..., World], book_spec: ApplicationSpecification
+) -> None:
+    world = make_world(book_spec, nfts=2, fund=1_000_000)
+    listings = [list_loan(world, nft, boxes=True) for nft in world.nfts]
+    listings[0] = bulk.Listing(**{**vars(listings[0]), "amount": AMOUNT + 1})
+    with pytest.raises(Exception):
+        bulk.accept_book_loans(
+            world.app_client.client, book_spec, world.lender, listings
+        )
+    for nft in world.nfts:
+        assert book_loan(world, nft).lender is None
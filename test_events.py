@@ -0,0 +1,147 @@
+from collections.abc import Callable
+from itertools import islice
+from typing import Any
+
+import msgpack
+import pytest
+from algokit_utils import ApplicationSpecification
+from algosdk import transaction
+from algosdk.atomic_transaction_composer import TransactionWithSigner
+from algosdk.v2client.algod import AlgodClient
+from beaker.localnet import LocalAccount
+
+import events
+from world import World
+
+# Set by the requested fixture
+world: World
+
+
+def last_round(algod: AlgodClient) -> int:
+    status = algod.status()
+    assert isinstance(status, dict)
+    return status["last-round"]
+
+
+def axfer(
+    sender: LocalAccount, receiver: str, asset: int, amount: int
+) -> TransactionWithSigner:
+    return TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=sender.address,
+            receiver=receiver,
+            index=asset,
+            amt=amount,
+            sp=world.app_client.get_suggested_params(),
+        ),
+        signer=sender.signer,
+    )
+
+
+def call(method: str, sender: LocalAccount, fee: int = 1, **kwargs: Any) -> None:
+    sp = world.app_client.get_suggested_params()
+    sp.flat_fee = True
+    sp.fee = sp.min_fee * fee
+    world.app_client.call(method, signer=sender.signer, suggested_params=sp, **kwargs)
+
+
+@pytest.fixture(scope="function")
+def requested(
+    make_world: Callable[..., World], app_spec: ApplicationSpecification
+) -> int:
+    global world
+    world = make_world(app_spec)
+    after = last_round(world.app_client.client)
+    call("opt_app_in_nft", world.borrower, fee=2, nft=world.nft)
+    call(
+        "request_loan",
+        world.borrower,
+        token=world.token,
+        amount=5,
+        duration=100,
+        interest=1,
+        axfer=axfer(world.borrower, world.app_addr, world.nft, 1),
+    )
+    return after
+
+
+@pytest.mark.events
+def test_selectors_are_arc28() -> None:
+    assert events.signature("LoanRepaid") == "LoanRepaid(uint64,uint64)"
+    assert len(events.SELECTORS) == len(events.EVENTS)
+
+
+@pytest.mark.events
+def test_lifecycle_events(requested: int) -> None:
+    stream = events.EventStream(
+        world.app_client.client, {world.app_client.app_id}, requested
+    )
+    found = stream.poll()
+    assert [event.name for event in found] == ["NftOptedIn", "LoanRequested"]
+    assert found[0].args == {"nft": world.nft, "borrower": world.borrower.address}
+    assert found[1].args == {
+        "nft": world.nft,
+        "token": world.token,
+        "amount": 5,
+        "duration": 100,
+        "interest": 1,
+    }
+    assert found[0].confirmed_round < found[1].confirmed_round
+    assert all(event.app_id == world.app_client.app_id for event in found)
+    # Nothing new until the next call
+    assert stream.poll() == []
+    call(
+        "accept_loan",
+        world.lender,
+        loan=axfer(world.lender, world.borrower.address, world.token, 5),
+    )
+    call(
+        "repay_loan",
+        world.borrower,
+        fee=2,
+        loan=axfer(world.borrower, world.lender.address, world.token, 5),
+        foreign_assets=[world.nft],
+    )
+    accepted, repaid = stream.poll()
+    assert accepted.name == "LoanAccepted"
+    assert accepted.args["lender"] == world.lender.address
+    block = world.app_client.client.block_info(accepted.confirmed_round - 1)
+    assert isinstance(block, dict)
+    assert accepted.args["start"] == block["block"]["ts"]
+    assert (repaid.name, repaid.args) == ("LoanRepaid", {"nft": world.nft, "paid": 5})
+
+
+@pytest.mark.events
+def test_follow(requested: int) -> None:
+    stream = events.EventStream(
+        world.app_client.client, {world.app_client.app_id}, requested
+    )
+    call("delete_request", world.borrower, fee=2, foreign_assets=[world.nft])
+    names = [event.name for event in islice(stream.follow(), 3)]
+    assert names == ["NftOptedIn", "LoanRequested", "RequestDeleted"]
+
+
+@pytest.mark.events
+def test_other_apps_are_ignored(requested: int) -> None:
+    stream = events.EventStream(
+        world.app_client.client, {world.app_client.app_id + 1}, requested
+    )
+    assert stream.poll() == []
+
+
+@pytest.mark.events
+def test_logs_are_packed_as_str(requested: int) -> None:
+    # Like algod, which packs logs as msgpack str whatever their bytes
+    algod = world.app_client.client
+    block = algod.block_info(requested + 1, response_format="msgpack")
+    txns = msgpack.unpackb(
+        block, raw=False, strict_map_key=False, unicode_errors="surrogateescape"
+    )["block"]["txns"]
+    logs = [log for stxn in txns for log in stxn.get("dt", {}).get("lg", [])]
+    assert logs and all(isinstance(log, str) for log in logs)
+    with pytest.raises(UnicodeDecodeError):
+        msgpack.unpackb(block, raw=False, strict_map_key=False)
+    stream = events.EventStream(algod, {world.app_client.app_id}, requested)
+    assert [event.name for event in stream.block_events(requested + 1)] == [
+        "NftOptedIn"
+    ]
@@ -0,0 +1,154 @@
+import asyncio
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import pytest
+from algokit_utils import ApplicationSpecification
+from algosdk.v2client.algod import AlgodClient
+
+from async_client import AsyncAlgod, HttpAlgod, LoanClient, LocalAlgod
+from instrumentation import Metrics, instrument, reason
+from world import World
+
+##########
+# fixtures
+##########
+
+
+class Span:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.attributes: dict[str, Any] = {}
+
+    def set_attribute(self, key: str, value: object) -> None:
+        self.attributes[key] = value
+
+
+class Tracer:
+    """Records the spans an OpenTelemetry tracer would have started."""
+
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+
+    @contextmanager
+    def start_as_current_span(self, name: str, **_: Any) -> Iterator[Span]:
+        span = Span(name)
+        self.spans.append(span)
+        yield span
+
+
+@pytest.fixture(scope="function")
+def aio(algod: AlgodClient, backend: str) -> AsyncAlgod:
+    if backend == "sim":
+        return LocalAlgod(algod)
+    return HttpAlgod.from_client(algod)
+
+
+def phases(metrics: Metrics, method: str) -> set[str]:
+    return {phase for name, phase in metrics.latency if name == method}
+
+
+#######
+# tests
+#######
+
+
+@pytest.mark.instrumentation
+def test_reason_drops_the_program_trace() -> None:
+    err = Exception(
+        f"transaction {'A' * 52}: logic eval error: assert failed pc=702. "
+        "Details: app=1, pc=702, opcodes=intc_0 // 0; ==; assert"
+    )
+    assert reason(err) == "transaction <txid>: logic eval error: assert failed pc=<n>"
+
+
+@pytest.mark.instrumentation
+def test_loan_client_records_each_phase(
+    make_world: Callable[..., World],
+    aio: AsyncAlgod,
+    app_spec: ApplicationSpecification,
+) -> None:
+    world = make_world(app_spec)
+    metrics = Metrics(simulate=True)
+    borrower = LoanClient(
+        aio, app_spec, world.app_client.app_id, world.borrower, metrics
+    )
+
+    async def run() -> None:
+        await borrower.opt_app_in_nft(world.nft)
+        await aio.close()
+
+    asyncio.run(run())
+    assert phases(metrics, "opt_app_in_nft") == {
+        "params",
+        "sign",
+        "simulate",
+        "submit",
+        "confirm",
+        "total",
+    }
+    assert metrics.calls["opt_app_in_nft", "ok"] == 1
+    assert metrics.fees["opt_app_in_nft"] == 2000
+    assert metrics.cost["opt_app_in_nft"].total > 0
+    text = metrics.prometheus()
+    assert 'nft_loan_calls_total{method="opt_app_in_nft",outcome="ok"} 1' in text
+    assert 'nft_loan_call_seconds_count{method="opt_app_in_nft",phase="sign"} 1' in text
+
+
+@pytest.mark.instrumentation
+def test_rejections_are_counted_by_reason(
+    make_world: Callable[..., World],
+    aio: AsyncAlgod,
+    app_spec: ApplicationSpecification,
+) -> None:
+    world = make_world(app_spec)
+    metrics = Metrics()
+    lender = LoanClient(aio, app_spec, world.app_client.app_id, world.lender, metrics)
+
+    async def run() -> None:
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await lender.liquidate_loan(world.nft)
+        await aio.close()
+
+    asyncio.run(run())
+    assert metrics.calls["liquidate_loan", "rejected"] == 2
+    ((method, why),) = metrics.rejections
+    assert method == "liquidate_loan"
+    assert metrics.rejections[method, why] == 2
+    assert "nft_loan_rejections_total" in metrics.prometheus()
+
+
+@pytest.mark.instrumentation
+def test_app_client_calls_are_traced(
+    make_world: Callable[..., World], app_spec: ApplicationSpecification
+) -> None:
+    world = make_world(app_spec)
+    tracer = Tracer()
+    metrics = Metrics(tracer)
+    app_client = instrument(
+        world.app_client.prepare(signer=world.borrower.signer), metrics
+    )
+    sp = app_client.get_suggested_params()
+    sp.flat_fee = True
+    sp.fee = sp.min_fee * 2
+    # Outside of a call nothing is recorded
+    app_client.get_global_state()
+    assert metrics.latency == {}
+
+    with metrics.call("opt_app_in_nft"):
+        result = app_client.call(
+            "opt_app_in_nft",
+            nft=world.nft,
+            suggested_params=sp,
+        )
+        metrics.record_confirmed(result.tx_info)
+        app_client.get_global_state()
+
+    assert {"sign", "submit", "confirm", "read", "total"} <= phases(
+        metrics, "opt_app_in_nft"
+    )
+    assert tracer.spans[0].name == "opt_app_in_nft"
+    assert tracer.spans[0].attributes == {"fee": 2000}
+    assert "opt_app_in_nft.submit" in {span.name for span in tracer.spans}
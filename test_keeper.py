@@ -0,0 +1,243 @@
+from collections.abc import Callable
+
+import pytest
+from algokit_utils import ApplicationSpecification
+from algosdk import transaction
+from algosdk.atomic_transaction_composer import TransactionWithSigner
+from algosdk.error import AlgodHTTPError
+from beaker import client
+from beaker.localnet import LocalAccount
+
+import build
+from keeper import RETRY_DELAY, Keeper
+from loan_book import LOAN_MBR
+from loan_index import LoanBookReader
+from world import World
+
+AMOUNT = 2
+DURATIONS = [1_000, 100, 10_000]
+
+# Set by the lent fixture
+world: World
+borrower: LocalAccount
+lender: LocalAccount
+app_client: client.ApplicationClient
+nfts: list[int]
+token: int
+keeper: Keeper
+
+##########
+# fixtures
+##########
+
+
+@pytest.fixture(scope="session")
+def expiry_book_spec() -> ApplicationSpecification:
+    # The loan book that only liquidates expired loans
+    return build.load("loan_book", {"expiry_check": "1"})
+
+
+def box(nft: int) -> list[tuple[int, bytes]]:
+    return [(0, nft.to_bytes(8, "big"))]
+
+
+def params(fee: int = 1) -> transaction.SuggestedParams:
+    sp = app_client.get_suggested_params()
+    sp.flat_fee = True
+    sp.fee = sp.min_fee * fee
+    return sp
+
+
+def axfer(sender: str, receiver: str, asset: int, amount: int) -> TransactionWithSigner:
+    signer = borrower.signer if sender == borrower.address else lender.signer
+    return TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=sender, sp=params(), receiver=receiver, amt=amount, index=asset
+        ),
+        signer=signer,
+    )
+
+
+def holding(address: str, asset: int) -> int:
+    info = app_client.client.account_asset_info(address, asset)
+    assert isinstance(info, dict)
+    return info["asset-holding"]["amount"]
+
+
+def last_round() -> int:
+    status = app_client.client.status()
+    assert isinstance(status, dict)
+    return status["last-round"]
+
+
+def advance(seconds: int) -> None:
+    # The next block is stamped `seconds` later; a payment makes that block
+    algod = app_client.client
+    algod.set_timestamp_offset(seconds)
+    txn = transaction.PaymentTxn(lender.address, params(), lender.address, 0)
+    algod.send_transaction(txn.sign(lender.private_key))
+    transaction.wait_for_confirmation(algod, txn.get_txid(), 3)
+    algod.set_timestamp_offset(0)
+
+
+def liquidate(nft: int) -> None:
+    app_client.call(
+        "liquidate_loan",
+        nft=nft,
+        signer=lender.signer,
+        suggested_params=params(3),
+        boxes=box(nft),
+        accounts=[borrower.address],
+    )
+
+
+@pytest.fixture(scope="function")
+def lent(
+    make_world: Callable[..., World], expiry_book_spec: ApplicationSpecification
+) -> None:
+    global world
+    global borrower
+    global lender
+    global app_client
+    global nfts
+    global token
+    global keeper
+    # Borrower borrows on 3 NFTs, each for a different duration, all from the
+    # lender, whose keeper then starts watching the loan book
+    world = make_world(expiry_book_spec, nfts=3, fund=1_000_000)
+    borrower = world.borrower
+    lender = world.lender
+    app_client = world.app_client
+    nfts = world.nfts
+    token = world.token
+    for nft, duration in zip(nfts, DURATIONS, strict=True):
+        app_client.call(
+            "opt_app_in_nft",
+            nft=nft,
+            pay=world.pay(borrower, LOAN_MBR),
+            signer=borrower.signer,
+            suggested_params=params(2),
+            boxes=box(nft),
+        )
+        app_client.call(
+            "request_loan",
+            nft=nft,
+            token=token,
+            amount=AMOUNT,
+            duration=duration,
+            interest=1,
+            axfer=axfer(borrower.address, world.app_addr, nft, 1),
+            signer=borrower.signer,
+            boxes=box(nft),
+        )
+        app_client.call(
+            "accept_loan",
+            nft=nft,
+            loan=axfer(lender.address, borrower.address, token, AMOUNT),
+            signer=lender.signer,
+            boxes=box(nft),
+        )
+    keeper = Keeper(
+        app_client.prepare(signer=lender.signer),
+        LoanBookReader(app_client.client, app_client.app_id),
+    )
+    keeper.start()
+
+
+#######
+# tests
+#######
+
+
+@pytest.mark.keeper
+def test_contract_enforces_the_deadline(lent: None) -> None:
+    with pytest.raises(Exception):
+        liquidate(nfts[1])
+    advance(DURATIONS[1])
+    liquidate(nfts[1])
+
+
+@pytest.mark.keeper
+def test_liquidates_loans_as_they_expire(lent: None) -> None:
+    assert keeper.step() == []
+    advance(DURATIONS[1])
+    assert keeper.step() == [nfts[1]]
+    assert holding(lender.address, nfts[1]) == 1
+    assert keeper.step() == []
+    advance(DURATIONS[0])
+    assert keeper.step() == [nfts[0]]
+    assert keeper.next_deadline() is not None
+
+
+@pytest.mark.keeper
+def test_batches_liquidations_in_one_group(lent: None) -> None:
+    advance(DURATIONS[0])
+    before = last_round()
+    assert keeper.step() == [nfts[1], nfts[0]]
+    assert last_round() == before + 1
+
+
+@pytest.mark.keeper
+def test_repaid_loans_leave_the_queue(lent: None) -> None:
+    app_client.call(
+        "repay_loan",
+        nft=nfts[2],
+        loan=axfer(borrower.address, lender.address, token, AMOUNT),
+        signer=borrower.signer,
+        suggested_params=params(3),
+        boxes=box(nfts[2]),
+    )
+    advance(DURATIONS[0])
+    assert keeper.step() == [nfts[1], nfts[0]]
+    assert keeper.next_deadline() is None
+
+
+@pytest.mark.keeper
+def test_lender_is_opted_in_to_the_nft(lent: None) -> None:
+    # Liquidating closes the NFT out to the lender, who no longer holds it
+    opt_out = transaction.AssetCloseOutTxn(
+        lender.address, params(), borrower.address, nfts[1]
+    )
+    app_client.client.send_transaction(opt_out.sign(lender.private_key))
+    transaction.wait_for_confirmation(app_client.client, opt_out.get_txid(), 3)
+    advance(DURATIONS[1])
+    assert keeper.step() == [nfts[1]]
+    assert holding(lender.address, nfts[1]) == 1
+
+
+@pytest.mark.keeper
+def test_failed_liquidations_are_retried_with_backoff(
+    lent: None, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def rejected(nfts: list[int]) -> None:
+        raise AlgodHTTPError("logic eval error")
+
+    advance(DURATIONS[1])
+    with monkeypatch.context() as patch:
+        patch.setattr(keeper, "_submit", rejected)
+        assert keeper.step() == []
+        now = keeper.latest_timestamp()
+        assert keeper.next_deadline() == now + RETRY_DELAY
+        advance(RETRY_DELAY)
+        assert keeper.step() == []
+        assert keeper.next_deadline() == keeper.latest_timestamp() + 2 * RETRY_DELAY
+    # Once the call goes through the loan is liquidated on the next retry
+    advance(2 * RETRY_DELAY)
+    assert keeper.step() == [nfts[1]]
+    assert keeper.failures == {}
+
+
+@pytest.mark.keeper
+def test_unexpected_errors_do_not_stop_the_keeper(
+    lent: None, monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    def unreachable(nfts: list[int]) -> None:
+        raise ConnectionError("algod is unreachable")
+
+    advance(DURATIONS[1])
+    with monkeypatch.context() as patch:
+        patch.setattr(keeper, "_submit", unreachable)
+        assert keeper.step() == []
+    assert "algod is unreachable" in caplog.text
+    advance(RETRY_DELAY)
+    assert keeper.step() == [nfts[1]]
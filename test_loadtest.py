@@ -0,0 +1,84 @@
+import asyncio
+from collections.abc import Sequence
+
+import pytest
+from algosdk.v2client.algod import AlgodClient
+from beaker.localnet import LocalAccount
+
+import loadtest
+from async_client import AsyncAlgod, HttpAlgod, LocalAlgod
+from world import World
+
+
+def run(
+    algod: AlgodClient,
+    backend: str,
+    worlds: Sequence[World],
+    concurrency: int,
+    close: str,
+) -> loadtest.Report:
+    aio: AsyncAlgod = (
+        LocalAlgod(algod) if backend == "sim" else HttpAlgod.from_client(algod)
+    )
+
+    async def measure() -> loadtest.Report:
+        try:
+            return await loadtest.run(aio, worlds, concurrency, close)
+        finally:
+            await aio.close()
+
+    return asyncio.run(measure())
+
+
+@pytest.mark.loadtest
+def test_percentile() -> None:
+    values = [float(v) for v in range(1, 101)]
+    assert loadtest.percentile(values, 50) == 50
+    assert loadtest.percentile(values, 99) == 99
+    assert loadtest.percentile(values, 100) == 100
+    assert loadtest.percentile([3.0], 95) == 3
+
+
+@pytest.mark.loadtest
+def test_reason_ignores_per_pair_details() -> None:
+    txid = "A" * 52
+    assert (
+        loadtest.reason(
+            Exception(f"transaction {txid}: logic eval error: assert failed pc=123")
+        )
+        == "transaction <txid>: logic eval error: assert failed pc=<n>"
+    )
+
+
+@pytest.mark.loadtest
+def test_mixed_lifecycles(
+    algod: AlgodClient, accounts: list[LocalAccount], backend: str
+) -> None:
+    worlds = loadtest.make_pairs(algod, accounts[0], 4)
+    assert len({world.borrower.address for world in worlds}) == 4
+    report = run(algod, backend, worlds, 2, "mixed")
+    assert report.cycles == 4
+    assert not report.failures
+    assert {method: len(values) for method, values in report.latencies.items()} == {
+        "opt_app_in_nft": 4,
+        "request_loan": 4,
+        "accept_loan": 4,
+        "repay_loan": 2,
+        "liquidate_loan": 2,
+    }
+    assert report.throughput > 0
+    assert "4/4 lifecycles" in loadtest.format_report(report)
+
+
+@pytest.mark.loadtest
+def test_failures_are_grouped_by_reason(
+    algod: AlgodClient, accounts: list[LocalAccount], backend: str
+) -> None:
+    worlds = loadtest.make_pairs(algod, accounts[0], 3)
+    assert run(algod, backend, worlds, 3, "liquidate").cycles == 3
+    # The borrowers lost their NFTs, so they cannot put them up again
+    report = run(algod, backend, worlds, 3, "liquidate")
+    assert report.cycles == 0
+    assert sum(report.failures.values()) == 3
+    assert len(report.failures) == 1
+    assert next(iter(report.failures)).startswith("request_loan: ")
@@ -0,0 +1,316 @@
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from algokit_utils import ApplicationSpecification
+from algosdk import abi, transaction
+from algosdk.atomic_transaction_composer import TransactionWithSigner
+from algosdk.constants import ZERO_ADDRESS
+from beaker import client
+from beaker.localnet import LocalAccount
+
+import terms
+import views
+from loan_book import LOAN_MBR, Loan
+from world import World
+
+LOAN_CODEC = abi.ABIType.from_string(str(Loan().type_spec()))
+AMOUNT = 5
+DURATION = 100
+INTEREST = 1
+
+# Set by the create_app fixture
+world: World
+borrower: LocalAccount
+lender: LocalAccount
+app_client: client.ApplicationClient
+nfts: list[int]
+token: int
+
+##########
+# fixtures
+##########
+
+
+def box(nft: int) -> list[tuple[int, bytes]]:
+    return [(0, nft.to_bytes(8, "big"))]
+
+
+def get_loan(nft: int) -> dict[str, Any]:
+    values = LOAN_CODEC.decode(app_client.get_box_contents(nft.to_bytes(8, "big")))
+    return dict(zip(Loan.__annotations__, values, strict=True))
+
+
+def holding(address: str, asset: int) -> int:
+    info = app_client.client.account_asset_info(address, asset)
+    assert isinstance(info, dict)
+    return info["asset-holding"]["amount"]
+
+
+def app_account() -> dict[str, Any]:
+    info = app_client.client.account_info(world.app_addr)
+    assert isinstance(info, dict)
+    return info
+
+
+@pytest.fixture(scope="function")
+def create_app(
+    make_world: Callable[..., World], book_spec: ApplicationSpecification
+) -> None:
+    global world
+    global borrower
+    global lender
+    global app_client
+    global nfts
+    global token
+    # Borrower creates 2 NFTs, Lender creates 10 Tokens
+    world = make_world(book_spec, nfts=2)
+    borrower = world.borrower
+    lender = world.lender
+    app_client = world.app_client
+    nfts = world.nfts
+    token = world.token
+
+
+def opt_app_in_nft(
+    nft: int, sender: LocalAccount | None = None, amount: int = LOAN_MBR
+) -> None:
+    sender = sender or borrower
+    sp = app_client.get_suggested_params()
+    sp.flat_fee = True
+    sp.fee = sp.min_fee * 2
+    app_client.call(
+        "opt_app_in_nft",
+        nft=nft,
+        pay=world.pay(sender, amount),
+        signer=sender.signer,
+        suggested_params=sp,
+        boxes=box(nft),
+    )
+
+
+def request_loan(nft: int) -> None:
+    sp = app_client.get_suggested_params()
+    axfer = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=borrower.address,
+            receiver=world.app_addr,
+            index=nft,
+            amt=1,
+            sp=sp,
+        ),
+        signer=borrower.signer,
+    )
+    app_client.call(
+        "request_loan",
+        nft=nft,
+        token=token,
+        amount=AMOUNT,
+        duration=DURATION,
+        interest=INTEREST,
+        axfer=axfer,
+        signer=borrower.signer,
+        boxes=box(nft),
+    )
+
+
+def accept_loan(nft: int) -> None:
+    sp = app_client.get_suggested_params()
+    axfer = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=lender.address,
+            receiver=borrower.address,
+            index=token,
+            amt=AMOUNT,
+            sp=sp,
+        ),
+        signer=lender.signer,
+    )
+    app_client.call(
+        "accept_loan", nft=nft, loan=axfer, signer=lender.signer, boxes=box(nft)
+    )
+
+
+def close_loan(method: str, nft: int, signer: LocalAccount) -> None:
+    sp = app_client.get_suggested_params()
+    sp.flat_fee = True
+    sp.fee = sp.min_fee * 3
+    app_client.call(
+        method,
+        nft=nft,
+        signer=signer.signer,
+        suggested_params=sp,
+        boxes=box(nft),
+        accounts=[borrower.address],
+    )
+
+
+@pytest.fixture(scope="function")
+def requested(create_app: None) -> None:
+    for nft in nfts:
+        opt_app_in_nft(nft)
+        request_loan(nft)
+
+
+@pytest.fixture(scope="function")
+def accepted(requested: None) -> None:
+    accept_loan(nfts[0])
+
+
+#######
+# tests
+#######
+
+
+@pytest.mark.create
+def test_create(create_app: None) -> None:
+    assert app_client.get_box_names() == []
+    assert app_account()["assets"] == []
+
+
+@pytest.mark.opt_app_in_nft
+def test_opt_app_in_nft(create_app: None) -> None:
+    for nft in nfts:
+        opt_app_in_nft(nft)
+        assert holding(world.app_addr, nft) == 0
+        loan = get_loan(nft)
+        assert loan["nft"] == nft
+        assert loan["token"] == 0
+        assert loan["borrower"] == borrower.address
+        assert loan["lender"] == ZERO_ADDRESS
+    assert len(app_client.get_box_names()) == len(nfts)
+    # The same NFT cannot back two loans
+    with pytest.raises(Exception):
+        opt_app_in_nft(nfts[0])
+
+
+@pytest.mark.opt_app_in_nft
+def test_opt_app_in_nft_is_paid_by_the_holder(create_app: None) -> None:
+    # Only the holder of the NFT can open its box, and pays for it and for the
+    # app's opt-in
+    with pytest.raises(Exception):
+        opt_app_in_nft(nfts[0], sender=lender)
+    with pytest.raises(Exception):
+        opt_app_in_nft(nfts[0], amount=LOAN_MBR - 1)
+    balance = app_account()["amount"]
+    opt_app_in_nft(nfts[0])
+    info = app_account()
+    assert info["amount"] == balance + LOAN_MBR
+    # On top of the app account's own minimum balance
+    assert info["min-balance"] == 100_000 + LOAN_MBR
+
+
+@pytest.mark.request_loan
+def test_request_loan(requested: None) -> None:
+    for nft in nfts:
+        loan = get_loan(nft)
+        assert loan["token"] == token
+        assert loan["amount"] == AMOUNT
+        assert loan["duration"] == DURATION
+        assert loan["interest"] == INTEREST
+        assert holding(world.app_addr, nft) == 1
+        assert holding(borrower.address, nft) == 0
+
+
+@pytest.mark.delete_request
+def test_delete_request(requested: None) -> None:
+    close_loan("delete_request", nfts[0], borrower)
+    assert app_client.get_box_names() == [nfts[1].to_bytes(8, "big")]
+    assert holding(borrower.address, nfts[0]) == 1
+    # The other loan is untouched
+    assert get_loan(nfts[1])["token"] == token
+    assert holding(world.app_addr, nfts[1]) == 1
+
+
+@pytest.mark.delete_request
+def test_delete_request_after_opt_in(create_app: None) -> None:
+    # Before the NFT is transferred the app holds none of it
+    info = app_account()
+    opt_app_in_nft(nfts[0])
+    close_loan("delete_request", nfts[0], borrower)
+    assert app_client.get_box_names() == []
+    assert holding(borrower.address, nfts[0]) == 1
+    # The opt-in and the box are closed and their minimum balance paid back
+    after = app_account()
+    assert after["amount"] == info["amount"]
+    assert after["min-balance"] == info["min-balance"]
+    assert after["assets"] == []
+
+
+@pytest.mark.accept_loan
+def test_accept_loan(accepted: None) -> None:
+    loan = get_loan(nfts[0])
+    assert loan["lender"] == lender.address
+    assert loan["start"] > 0
+    assert get_loan(nfts[1])["lender"] == ZERO_ADDRESS
+    assert holding(borrower.address, token) == AMOUNT
+    assert holding(lender.address, token) == 10 - AMOUNT
+    # A request that has been accepted cannot be deleted
+    with pytest.raises(Exception):
+        close_loan("delete_request", nfts[0], borrower)
+
+
+@pytest.mark.repay_loan
+def test_repay_loan(accepted: None) -> None:
+    sp = app_client.get_suggested_params()
+    sp.flat_fee = True
+    sp.fee = sp.min_fee * 3
+    axfer = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=borrower.address,
+            receiver=lender.address,
+            index=token,
+            amt=AMOUNT,
+            sp=app_client.get_suggested_params(),
+        ),
+        signer=borrower.signer,
+    )
+    app_client.call(
+        "repay_loan",
+        nft=nfts[0],
+        loan=axfer,
+        signer=borrower.signer,
+        suggested_params=sp,
+        boxes=box(nfts[0]),
+    )
+    assert app_client.get_box_names() == [nfts[1].to_bytes(8, "big")]
+    assert holding(borrower.address, nfts[0]) == 1
+    assert holding(borrower.address, token) == 0
+    assert holding(lender.address, token) == 10
+
+
+@pytest.mark.liquidate_loan
+def test_liquidate_loan(accepted: None) -> None:
+    # Only the lender of that loan may liquidate it
+    with pytest.raises(Exception):
+        close_loan("liquidate_loan", nfts[1], lender)
+    close_loan("liquidate_loan", nfts[0], lender)
+    assert app_client.get_box_names() == [nfts[1].to_bytes(8, "big")]
+    assert holding(lender.address, nfts[0]) == 1
+    assert holding(borrower.address, token) == AMOUNT
+    assert [a["asset-id"] for a in app_account()["assets"]] == [nfts[1]]
+
+
+@pytest.mark.view
+def test_view_loans(accepted: None, book_spec: ApplicationSpecification) -> None:
+    # The missing NFT has no box and reads as an empty loan on that NFT
+    missing = max(nfts) + 1
+    loans = views.book_views(
+        app_client.client,
+        book_spec,
+        borrower.address,
+        app_client.app_id,
+        [*nfts, missing],
+    )
+    assert [loan["nft"] for loan in loans] == [*nfts, missing]
+    assert [loan["status"] for loan in loans] == [
+        terms.ACTIVE,
+        terms.REQUESTED,
+        terms.EMPTY,
+    ]
+    assert loans[0]["lender"] == lender.address
+    assert loans[0]["start"] == get_loan(nfts[0])["start"]
+    assert loans[0]["owed"] == AMOUNT
+    assert loans[1]["borrower"] == borrower.address
+    assert loans[1]["lender"] == ZERO_ADDRESS
+    assert loans[2]["borrower"] == ZERO_ADDRESS
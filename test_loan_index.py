@@ -0,0 +1,175 @@
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from algokit_utils import ApplicationSpecification
+from algosdk import transaction
+from algosdk.atomic_transaction_composer import TransactionWithSigner
+
+from loan_book import LOAN_MBR
+from loan_index import LoanBookReader, LoanIndex, LoanRecord
+from world import World
+
+ALICE = "A" * 58
+BOB = "B" * 58
+
+
+def loan(
+    nft: int, lender: str | None = None, start: int = 0, token: int = 7
+) -> LoanRecord:
+    return LoanRecord(nft, token, 5, 1, start, 100, ALICE, lender)
+
+
+######################
+# LoanIndex unit tests
+######################
+
+
+@pytest.mark.loan_index
+def test_index_queries() -> None:
+    index = LoanIndex()
+    index.put(loan(1))
+    index.put(loan(2, lender=BOB, start=500))
+    index.put(loan(3, lender=BOB, start=100, token=8))
+    assert len(index) == 3
+    assert [r.nft for r in index.by_borrower(ALICE)] == [1, 2, 3]
+    assert [r.nft for r in index.by_lender(BOB)] == [2, 3]
+    assert [r.nft for r in index.by_token(7)] == [1, 2]
+    # Requests that nobody accepted have no expiry
+    assert [r.nft for r in index.expiring()] == [3, 2]
+    assert [r.nft for r in index.expiring(before=600)] == [3]
+    assert [r.nft for r in index.expiring(after=201)] == [2]
+
+
+@pytest.mark.loan_index
+def test_index_updates_and_removals() -> None:
+    index = LoanIndex()
+    index.put(loan(1))
+    index.put(loan(1, lender=BOB, start=10))
+    assert index.by_nft(1) == loan(1, lender=BOB, start=10)
+    assert [r.nft for r in index.expiring()] == [1]
+    index.remove(1)
+    index.remove(1)
+    assert len(index) == 0
+    assert index.by_borrower(ALICE) == []
+    assert index.by_lender(BOB) == []
+    assert index.expiring() == []
+
+
+#########################
+# LoanBookReader tests
+#########################
+
+
+def call(world: World, method: str, nft: int, signer_name: str, **kwargs: Any) -> None:
+    sp = world.app_client.get_suggested_params()
+    sp.flat_fee = True
+    sp.fee = sp.min_fee * 3
+    signer = getattr(world, signer_name)
+    world.app_client.call(
+        method,
+        nft=nft,
+        signer=signer.signer,
+        suggested_params=sp,
+        boxes=[(0, nft.to_bytes(8, "big"))],
+        **kwargs,
+    )
+
+
+def axfer(
+    world: World, sender_name: str, receiver: str, asset: int, amount: int
+) -> TransactionWithSigner:
+    sender = getattr(world, sender_name)
+    return TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=sender.address,
+            sp=world.app_client.get_suggested_params(),
+            receiver=receiver,
+            amt=amount,
+            index=asset,
+        ),
+        signer=sender.signer,
+    )
+
+
+def request(world: World, nft: int) -> None:
+    call(
+        world,
+        "opt_app_in_nft",
+        nft,
+        "borrower",
+        pay=world.pay(world.borrower, LOAN_MBR),
+    )
+    call(
+        world,
+        "request_loan",
+        nft,
+        "borrower",
+        token=world.token,
+        amount=5,
+        duration=100,
+        interest=1,
+        axfer=axfer(world, "borrower", world.app_addr, nft, 1),
+    )
+
+
+@pytest.mark.loan_index
+def test_box_refs_of_inner_calls() -> None:
+    reader = LoanBookReader(None, 7)  # type: ignore[arg-type]
+    # As events.unpack_block gives it, with strings as bytes
+    call = {
+        "type": b"appl",
+        "apid": 9,
+        "apfa": [7],
+        "apbx": [{"i": 1, "n": b"own"}, {"n": b"other"}, {"i": 1}],
+    }
+    inner = {"type": b"appl", "apid": 7, "apbx": [{"n": b"inner"}, {}]}
+    stxn = {"txn": call, "dt": {"itx": [{"txn": {"type": b"pay"}}, {"txn": inner}]}}
+    assert reader._box_refs(stxn) == {b"own", b"inner"}
+
+
+@pytest.mark.loan_index
+def test_reader_load_and_sync(
+    make_world: Callable[..., World], book_spec: ApplicationSpecification
+) -> None:
+    world = make_world(book_spec, nfts=3, fund=1_000_000)
+    first, second, third = world.nfts
+    request(world, first)
+    request(world, second)
+
+    reader = LoanBookReader(world.app_client.client, world.app_client.app_id)
+    reader.load()
+    assert {r.nft for r in reader.index.by_borrower(world.borrower.address)} == {
+        first,
+        second,
+    }
+    assert reader.index.expiring() == []
+
+    # Accept the first, delete the second and open a third
+    call(
+        world,
+        "accept_loan",
+        first,
+        "lender",
+        loan=axfer(world, "lender", world.borrower.address, world.token, 5),
+    )
+    call(world, "delete_request", second, "borrower")
+    request(world, third)
+    # A reference to no box, only there for its quota, is not a loan
+    world.app_client.call(
+        "view_loans",
+        nfts=[first],
+        boxes=[(0, first.to_bytes(8, "big")), (0, b"")],
+        signer=world.borrower.signer,
+    )
+    assert reader.sync() == {first, second, third}
+
+    accepted = reader.index.by_nft(first)
+    assert accepted is not None
+    assert accepted.lender == world.lender.address
+    assert reader.index.by_lender(world.lender.address) == [accepted]
+    assert reader.index.expiring() == [accepted]
+    assert reader.index.by_nft(second) is None
+    assert [r.nft for r in reader.index.by_token(world.token)] == [first, third]
+    # Nothing happened since
+    assert reader.sync() == set()
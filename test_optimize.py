@@ -0,0 +1,100 @@
+import pytest
+from algosdk.v2client.algod import AlgodClient
+from beaker.localnet import LocalAccount
+
+import benchmark
+import build
+import optimize
+from app import MAX_BUNDLE
+
+TEAL = """#pragma version 8
+txn ApplicationID
+bnz main_l2
+callsub pay_0
+int 1
+return
+main_l2:
+int 1
+return
+
+// pay
+pay_0:
+proto 0 0
+load 0
+pop
+itxn_begin
+byte "owner"
+app_global_get
+itxn_field Receiver
+byte "owner"
+app_global_get
+itxn_field CloseRemainderTo
+byte "owner"
+app_global_get
+log
+byte "count"
+app_global_get
+itob
+log
+pay_0_l1:
+byte "owner"
+app_global_get
+len
+bz pay_0_l2
+b pay_0_l1
+pay_0_l2:
+itxn_submit
+byte "count"
+int 1
+app_global_put
+byte "owner"
+app_global_get
+log
+retsub
+"""
+
+
+@pytest.mark.optimize
+def test_reads_before_first_write_are_cached() -> None:
+    lines = optimize.cache_reads(TEAL).splitlines()
+    start = lines.index("proto 0 0") + 1
+    # Slot 0 is taken, the prefetch goes above it
+    assert lines[start : start + 3] == ['byte "owner"', "app_global_get", "store 1"]
+    body = lines[start + 3 :]
+    assert body.count("load 1") == 4
+    # Read once only, written after, read after the write
+    assert body.count('byte "count"') == 2
+    assert body[body.index("app_global_put") + 1 :][:2] == [
+        'byte "owner"',
+        "app_global_get",
+    ]
+
+
+@pytest.mark.optimize
+def test_reads_in_a_loop_through_a_write_are_not_cached() -> None:
+    teal = TEAL.replace("log\nretsub", "log\nb pay_0_l1\nretsub")
+    lines = optimize.cache_reads(teal).splitlines()
+    assert "store 1" not in lines
+    dynamic = TEAL.replace("load 0", "int 0\nloads")
+    assert optimize.cache_reads(dynamic) == dynamic
+
+
+@pytest.mark.optimize
+def test_optimized_build_costs_no_more(
+    algod: AlgodClient, accounts: list[LocalAccount]
+) -> None:
+    before = benchmark.profile(algod, accounts)
+    after = benchmark.profile(algod, accounts, build.load("app", {"optimize": "1"}))
+    print(benchmark.compare(before, after))
+    for name, method in after.methods.items():
+        assert method.opcode_cost <= before.methods[name].opcode_cost
+    # Where it pays off: each NFT of a bundle released reads the receiver
+    for name in ("delete_request", "repay_loan", "liquidate_loan"):
+        saved = (
+            before.methods[f"{name}[bundle]"].opcode_cost
+            - after.methods[f"{name}[bundle]"].opcode_cost
+        )
+        assert saved >= MAX_BUNDLE
+    assert sum(m.opcode_cost for m in after.methods.values()) < sum(
+        m.opcode_cost for m in before.methods.values()
+    )
@@ -0,0 +1,222 @@
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from algokit_utils import ApplicationSpecification
+from algosdk import abi, transaction
+from algosdk.atomic_transaction_composer import TransactionWithSigner
+from algosdk.constants import ZERO_ADDRESS
+from beaker import client
+from beaker.localnet import LocalAccount
+
+import build
+from loan_book import Loan
+from world import World
+
+LOAN_CODEC = abi.ABIType.from_string(str(Loan().type_spec()))
+AMOUNT = 5
+DURATION = 100
+INTEREST = 1
+
+# Set by the create_app fixture
+world: World
+borrower: LocalAccount
+lender: LocalAccount
+app_client: client.ApplicationClient
+nft: int
+token: int
+
+##########
+# fixtures
+##########
+
+
+@pytest.fixture(scope="session")
+def packed_spec() -> ApplicationSpecification:
+    return build.load("packed_app")
+
+
+def inner_txn_params() -> transaction.SuggestedParams:
+    sp = app_client.get_suggested_params()
+    sp.flat_fee = True
+    sp.fee = sp.min_fee * 2
+    return sp
+
+
+def get_loan() -> dict[str, Any] | None:
+    record = app_client.get_global_state(raw=True)[b"loan"]
+    assert isinstance(record, bytes)
+    if record == b"":
+        return None
+    return dict(zip(Loan.__annotations__, LOAN_CODEC.decode(record), strict=True))
+
+
+def holding(address: str, asset: int) -> int:
+    info = app_client.client.account_asset_info(address, asset)
+    assert isinstance(info, dict)
+    return info["asset-holding"]["amount"]
+
+
+@pytest.fixture(scope="function")
+def create_app(
+    make_world: Callable[..., World], packed_spec: ApplicationSpecification
+) -> None:
+    global world
+    global borrower
+    global lender
+    global app_client
+    global nft
+    global token
+    world = make_world(packed_spec)
+    borrower = world.borrower
+    lender = world.lender
+    app_client = world.app_client
+    nft = world.nft
+    token = world.token
+
+
+@pytest.fixture(scope="function")
+def opt_app_in_nft(create_app: None) -> None:
+    app_client.call(
+        "opt_app_in_nft",
+        nft=nft,
+        signer=borrower.signer,
+        suggested_params=inner_txn_params(),
+    )
+
+
+@pytest.fixture(scope="function")
+def request_loan(opt_app_in_nft: None) -> None:
+    axfer = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=borrower.address,
+            receiver=world.app_addr,
+            index=nft,
+            amt=1,
+            sp=app_client.get_suggested_params(),
+        ),
+        signer=borrower.signer,
+    )
+    app_client.call(
+        "request_loan",
+        token=token,
+        amount=AMOUNT,
+        duration=DURATION,
+        interest=INTEREST,
+        axfer=axfer,
+        signer=borrower.signer,
+    )
+
+
+@pytest.fixture(scope="function")
+def accept_loan(request_loan: None) -> None:
+    axfer = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=lender.address,
+            receiver=borrower.address,
+            index=token,
+            amt=AMOUNT,
+            sp=app_client.get_suggested_params(),
+        ),
+        signer=lender.signer,
+    )
+    app_client.call("accept_loan", loan=axfer, signer=lender.signer)
+
+
+#######
+# tests
+#######
+
+
+@pytest.mark.create
+def test_create(create_app: None) -> None:
+    # The whole loan lives under a single key
+    assert app_client.get_global_state(raw=True) == {b"loan": b""}
+
+
+@pytest.mark.opt_app_in_nft
+def test_opt_app_in_nft(opt_app_in_nft: None) -> None:
+    assert get_loan() == {
+        "nft": nft,
+        "token": 0,
+        "amount": 0,
+        "interest": 0,
+        "start": 0,
+        "duration": 0,
+        "borrower": borrower.address,
+        "lender": ZERO_ADDRESS,
+    }
+    assert holding(world.app_addr, nft) == 0
+
+
+@pytest.mark.request_loan
+def test_request_loan(request_loan: None) -> None:
+    loan = get_loan()
+    assert loan is not None
+    assert loan["token"] == token
+    assert loan["amount"] == AMOUNT
+    assert loan["duration"] == DURATION
+    assert loan["interest"] == INTEREST
+    assert holding(world.app_addr, nft) == 1
+
+
+@pytest.mark.delete_request
+def test_delete_request(request_loan: None) -> None:
+    app_client.call(
+        "delete_request",
+        signer=borrower.signer,
+        foreign_assets=[nft],
+        suggested_params=inner_txn_params(),
+    )
+    assert get_loan() is None
+    info = app_client.client.account_info(world.app_addr)
+    assert isinstance(info, dict)
+    assert info["assets"] == []
+    assert holding(borrower.address, nft) == 1
+
+
+@pytest.mark.accept_loan
+def test_accept_loan(accept_loan: None) -> None:
+    loan = get_loan()
+    assert loan is not None
+    assert loan["lender"] == lender.address
+    assert loan["start"] > 0
+    assert holding(borrower.address, token) == AMOUNT
+    assert holding(lender.address, token) == 10 - AMOUNT
+
+
+@pytest.mark.repay_loan
+def test_repay_loan(accept_loan: None) -> None:
+    axfer = TransactionWithSigner(
+        txn=transaction.AssetTransferTxn(
+            sender=borrower.address,
+            receiver=lender.address,
+            index=token,
+            amt=AMOUNT,
+            sp=app_client.get_suggested_params(),
+        ),
+        signer=borrower.signer,
+    )
+    app_client.call(
+        "repay_loan",
+        loan=axfer,
+        signer=borrower.signer,
+        foreign_assets=[nft],
+        suggested_params=inner_txn_params(),
+    )
+    assert get_loan() is None
+    assert holding(borrower.address, nft) == 1
+    assert holding(lender.address, token) == 10
+
+
+@pytest.mark.liquidate_loan
+def test_liquidate_loan(accept_loan: None) -> None:
+    app_client.call(
+        "liquidate_loan",
+        signer=lender.signer,
+        foreign_assets=[nft],
+        suggested_params=inner_txn_params(),
+    )
+    assert get_loan() is None
+    assert holding(lender.address, nft) == 1
+    assert holding(borrower.address, token) == AMOUNT
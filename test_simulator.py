@@ -0,0 +1,182 @@
+import base64
+import random
+from typing import Any
+
+import pytest
+from algokit_utils import ApplicationSpecification
+from algosdk import transaction
+from algosdk.atomic_transaction_composer import TransactionWithSigner
+from algosdk.encoding import encode_address
+from beaker.localnet import LocalAccount
+
+import simulator
+from world import build_world
+
+AMOUNT = 5
+DURATION = 1_000_000
+SCENARIOS = 20
+STEPS = 30
+
+# Which loan phase each method needs to succeed, and the phase it leaves behind
+TRANSITIONS = {
+    "opt_app_in_nft": ("empty", "opted"),
+    "request_loan": ("opted", "requested"),
+    "delete_request": ("requested", "empty"),
+    "accept_loan": ("requested", "accepted"),
+    "repay_loan": ("accepted", "empty"),
+    "liquidate_loan": ("accepted", "liquidated"),
+}
+
+
+class Scenario:
+    def __init__(self, app_spec: ApplicationSpecification) -> None:
+        self.algod = simulator.SimAlgodClient()
+        world = build_world(self.algod, simulator.get_accounts(self.algod), app_spec)
+        self.app_client = world.app_client
+        self.app_addr = world.app_addr
+        self.borrower = world.borrower
+        self.lender = world.lender
+        self.nft = world.nft
+        self.token = world.token
+
+    def params(self, fee: int = 1) -> transaction.SuggestedParams:
+        sp = self.app_client.get_suggested_params()
+        sp.flat_fee = True
+        sp.fee = sp.min_fee * fee
+        return sp
+
+    def axfer(
+        self, sender: LocalAccount, receiver: str, asset: int, amount: int
+    ) -> TransactionWithSigner:
+        return TransactionWithSigner(
+            txn=transaction.AssetTransferTxn(
+                sender=sender.address,
+                sp=self.params(),
+                receiver=receiver,
+                amt=amount,
+                index=asset,
+            ),
+            signer=sender.signer,
+        )
+
+    def call(self, method: str) -> None:
+        borrower, lender = self.borrower, self.lender
+        args: dict[str, Any]
+        inner: dict[str, Any] = {
+            "foreign_assets": [self.nft],
+            "suggested_params": self.params(2),
+        }
+        match method:
+            case "opt_app_in_nft":
+                args = {"nft": self.nft, "suggested_params": self.params(2)}
+                signer = borrower
+            case "request_loan":
+                args = {
+                    "token": self.token,
+                    "amount": AMOUNT,
+                    "duration": DURATION,
+                    "interest": 1,
+                    "axfer": self.axfer(borrower, self.app_addr, self.nft, 1),
+                }
+                signer = borrower
+            case "delete_request":
+                args, signer = inner, borrower
+            case "accept_loan":
+                args = {
+                    "loan": self.axfer(lender, borrower.address, self.token, AMOUNT)
+                }
+                signer = lender
+            case "repay_loan":
+                args = {
+                    **inner,
+                    "loan": self.axfer(borrower, lender.address, self.token, AMOUNT),
+                }
+                signer = borrower
+            case "liquidate_loan":
+                args, signer = inner, lender
+        self.app_client.call(method, signer=signer.signer, **args)
+
+    def holding(self, address: str, asset: int) -> int:
+        info = self.algod.account_info(address)
+        assert isinstance(info, dict)
+        return sum(a["amount"] for a in info["assets"] if a["asset-id"] == asset)
+
+
+@pytest.mark.simulator
+@pytest.mark.parametrize("seed", range(SCENARIOS))
+def test_random_lifecycle(seed: int, app_spec: ApplicationSpecification) -> None:
+    rng = random.Random(seed)
+    scenario = Scenario(app_spec)
+    phase = "empty"
+    for _ in range(STEPS):
+        method = rng.choice(list(TRANSITIONS))
+        needs, leaves = TRANSITIONS[method]
+        if phase == needs:
+            scenario.call(method)
+            phase = leaves
+        else:
+            with pytest.raises(Exception):
+                scenario.call(method)
+        if phase == "liquidated":
+            break
+
+        state = scenario.app_client.get_global_state()
+        app_addr = scenario.app_addr
+        assert (state["nft"] != 0) == (phase != "empty")
+        assert (state["token"] != 0) == (phase in ("requested", "accepted"))
+        assert (state["lender"] != "") == (phase == "accepted")
+        if phase == "accepted":
+            lender = state["lender"]
+            assert isinstance(lender, str)
+            assert encode_address(bytes.fromhex(lender)) == scenario.lender.address
+        collateral = scenario.holding(app_addr, scenario.nft)
+        assert collateral == (1 if phase in ("requested", "accepted") else 0)
+        assert scenario.holding(scenario.borrower.address, scenario.nft) == (
+            1 - collateral
+        )
+
+    lent = AMOUNT if phase in ("accepted", "liquidated") else 0
+    assert scenario.holding(scenario.borrower.address, scenario.token) == lent
+    assert scenario.holding(scenario.lender.address, scenario.token) == 10 - lent
+    if phase == "liquidated":
+        assert scenario.holding(scenario.lender.address, scenario.nft) == 1
+
+
+# A PyTeal subroutine with locals buries its result at the frame base, under
+# the locals still on the stack when it returns
+RETSUB_WITH_LOCALS = """#pragma version 8
+int 7
+callsub double_0
+int 14
+==
+return
+
+double_0:
+proto 1 1
+int 0
+int 99
+int 98
+frame_dig -1
+dup
++
+frame_bury 0
+retsub
+"""
+
+
+@pytest.mark.simulator
+def test_retsub_returns_the_frame_base() -> None:
+    algod = simulator.SimAlgodClient()
+    (creator,) = simulator.get_accounts(algod, count=1)
+    program = base64.b64decode(algod.compile(RETSUB_WITH_LOCALS)["result"])
+    txn = transaction.ApplicationCreateTxn(
+        sender=creator.address,
+        sp=algod.suggested_params(),
+        on_complete=transaction.OnComplete.NoOpOC,
+        approval_program=program,
+        clear_program=program,
+        global_schema=transaction.StateSchema(0, 0),
+        local_schema=transaction.StateSchema(0, 0),
+    )
+    txid = algod.send_transaction(txn.sign(creator.private_key))
+    assert transaction.wait_for_confirmation(algod, txid, 3)["application-index"]
@@ -0,0 +1,122 @@
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from algokit_utils import ApplicationSpecification
+from algosdk.v2client.algod import AlgodClient
+from beaker.localnet import LocalAccount
+
+from loan_book import LOAN_MBR
+from simulator import SimAlgodClient
+from world import World, build_world, provision, roles
+
+
+def account(algod: AlgodClient, address: str) -> dict[str, Any]:
+    info = algod.account_info(address)
+    assert isinstance(info, dict)
+    return info
+
+
+def last_round(algod: AlgodClient) -> int:
+    status = algod.status()
+    assert isinstance(status, dict)
+    return status["last-round"]
+
+
+@pytest.mark.world
+def test_build_world_in_two_rounds(
+    algod: AlgodClient,
+    accounts: list[LocalAccount],
+    book_spec: ApplicationSpecification,
+) -> None:
+    start = last_round(algod)
+    world = build_world(algod, accounts, book_spec, nfts=3, fund=500_000)
+    assert last_round(algod) - start == 2
+
+    def holdings(address: str) -> dict[int, int]:
+        return {a["asset-id"]: a["amount"] for a in account(algod, address)["assets"]}
+
+    assert holdings(world.borrower.address) == {
+        **{nft: 1 for nft in world.nfts},
+        world.token: 0,
+    }
+    assert holdings(world.lender.address) == {
+        **{nft: 0 for nft in world.nfts},
+        world.token: 10,
+    }
+    assert account(algod, world.app_addr)["amount"] == 500_000
+
+
+@pytest.mark.world
+def test_make_world_starts_fresh(
+    make_world: Callable[..., World], book_spec: ApplicationSpecification
+) -> None:
+    world = make_world(book_spec, fund=1_000_000)
+    sp = world.app_client.get_suggested_params()
+    sp.flat_fee = True
+    sp.fee = sp.min_fee * 2
+    world.app_client.call(
+        "opt_app_in_nft",
+        nft=world.nft,
+        pay=world.pay(world.borrower, LOAN_MBR),
+        signer=world.borrower.signer,
+        suggested_params=sp,
+        boxes=[(0, world.nft.to_bytes(8, "big"))],
+    )
+    assert len(world.app_client.get_box_names()) == 1
+
+    # The next test's world knows nothing of the loan opened above
+    again = make_world(book_spec, fund=1_000_000)
+    assert again.app_client.get_box_names() == []
+
+
+@pytest.mark.world
+def test_provisioned_accounts_keep_their_roles(
+    algod: AlgodClient,
+    accounts: list[LocalAccount],
+    book_spec: ApplicationSpecification,
+) -> None:
+    # As each pytest-xdist worker gets its own accounts
+    first = provision(algod, accounts[0], amount=10_000_000)
+    second = provision(algod, accounts[0], amount=10_000_000)
+    assert {a.address for a in first}.isdisjoint(a.address for a in second)
+    assert [account(algod, a.address)["amount"] for a in first] == [
+        10_000_000,
+        9_999_999,
+        9_999_998,
+    ]
+    assert list(roles(algod, first[::-1])) == first
+    world = build_world(algod, second, book_spec)
+    assert (world.creator, world.borrower, world.lender) == tuple(second)
+
+
+@pytest.mark.world
+def test_stage_is_played_once_per_state(
+    make_world: Callable[..., World],
+    stage: Callable[..., None],
+    book_spec: ApplicationSpecification,
+) -> None:
+    world = make_world(book_spec, fund=1_000_000)
+    sp = world.app_client.get_suggested_params()
+    sp.flat_fee = True
+    sp.fee = sp.min_fee * 2
+    played = []
+
+    def opt_in() -> None:
+        played.append(1)
+        world.app_client.call(
+            "opt_app_in_nft",
+            nft=world.nft,
+            pay=world.pay(world.borrower, LOAN_MBR),
+            signer=world.borrower.signer,
+            suggested_params=sp,
+            boxes=[(0, world.nft.to_bytes(8, "big"))],
+        )
+
+    stage("opt_in", opt_in)
+    # A later test, on a fresh world, starts from the stage as it was left
+    world = make_world(book_spec, fund=1_000_000)
+    stage("opt_in", opt_in)
+    assert len(world.app_client.get_box_names()) == 1
+    on_sim = isinstance(world.app_client.client, SimAlgodClient)
+    assert len(played) == (1 if on_sim else 2)
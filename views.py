@@ -0,0 +1,107 @@
+"""Reading loans through the contracts' read-only methods.
+
+The calls are evaluated with algod's simulate endpoint: nothing is signed,
+sent or written, and a whole page of loans takes a single request, with up to
+16 calls in the simulated group.
+"""
+
+from collections.abc import Sequence
+from typing import Any
+
+from algokit_utils import ApplicationSpecification
+from algosdk.atomic_transaction_composer import (
+    AtomicTransactionComposer,
+    EmptySigner,
+)
+from algosdk.v2client.algod import AlgodClient
+from algosdk.v2client.models import SimulateRequest
+
+from terms import LoanView
+
+FIELDS = list(LoanView.__annotations__)
+MAX_CALLS = 16
+# Box references per view_loans call
+MAX_BOOK_LOANS = 8
+
+# (app_id, method, args, box references)
+Call = tuple[int, str, list[Any], list[tuple[int, bytes]]]
+
+
+def simulate_calls(
+    algod: AlgodClient,
+    app_spec: ApplicationSpecification,
+    sender: str,
+    calls: Sequence[Call],
+) -> list[Any]:
+    """The return values of `calls`, all simulated in one group on behalf of
+    `sender`, which needs no key."""
+    if not 0 < len(calls) <= MAX_CALLS:
+        raise ValueError(f"can simulate 1 to {MAX_CALLS} calls, not {len(calls)}")
+    sp = algod.suggested_params()
+    atc = AtomicTransactionComposer()
+    for app_id, method, args, boxes in calls:
+        atc.add_method_call(
+            app_id=app_id,
+            method=app_spec.contract.get_method_by_name(method),
+            sender=sender,
+            sp=sp,
+            signer=EmptySigner(),
+            method_args=args,
+            boxes=boxes,
+        )
+    result = atc.simulate(
+        algod, SimulateRequest(txn_groups=[], allow_empty_signatures=True)
+    )
+    if result.failure_message:
+        raise RuntimeError(result.failure_message)
+    return [abi_result.return_value for abi_result in result.abi_results]
+
+
+def loan_views(
+    algod: AlgodClient,
+    app_spec: ApplicationSpecification,
+    sender: str,
+    app_ids: Sequence[int],
+) -> list[dict[str, Any]]:
+    """The view of each NFTasCollateral app's loan."""
+    calls: list[Call] = [(app_id, "view", [], []) for app_id in app_ids]
+    return [
+        dict(zip(FIELDS, view, strict=True))
+        for view in simulate_calls(algod, app_spec, sender, calls)
+    ]
+
+
+def quote(
+    algod: AlgodClient,
+    app_spec: ApplicationSpecification,
+    sender: str,
+    app_id: int,
+    later: int = 0,
+) -> int:
+    """What the borrower repays `later` seconds after the latest block."""
+    (owed,) = simulate_calls(algod, app_spec, sender, [(app_id, "quote", [later], [])])
+    return owed
+
+
+def book_views(
+    algod: AlgodClient,
+    app_spec: ApplicationSpecification,
+    sender: str,
+    app_id: int,
+    nfts: Sequence[int],
+) -> list[dict[str, Any]]:
+    """The view of the loan on each of `nfts` on one loan book."""
+    calls: list[Call] = [
+        (
+            app_id,
+            "view_loans",
+            [list(nfts[at : at + MAX_BOOK_LOANS])],
+            [(0, nft.to_bytes(8, "big")) for nft in nfts[at : at + MAX_BOOK_LOANS]],
+        )
+        for at in range(0, len(nfts), MAX_BOOK_LOANS)
+    ]
+    return [
+        dict(zip(FIELDS, view, strict=True))
+        for views in simulate_calls(algod, app_spec, sender, calls)
+        for view in views
+    ]
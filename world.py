@@ -0,0 +1,202 @@
+"""Batched setup of everything a loan test starts from: the borrower's NFTs,
+the lender's tokens, the application and the opt-ins between them.
+
+The steps are composed into two atomic groups instead of one confirmed
+transaction per step, so setup takes two rounds however many NFTs it makes.
+"""
+
+import base64
+import hashlib
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from algokit_utils import ApplicationSpecification, num_extra_program_pages
+from algosdk import account, transaction
+from algosdk.atomic_transaction_composer import (
+    AtomicTransactionComposer,
+    TransactionWithSigner,
+)
+from algosdk.logic import get_application_address
+from algosdk.v2client.algod import AlgodClient
+from beaker import client
+from beaker.localnet import LocalAccount
+
+
+@dataclass
+class World:
+    app_client: client.ApplicationClient
+    creator: LocalAccount
+    borrower: LocalAccount
+    lender: LocalAccount
+    nfts: list[int]
+    token: int
+
+    @property
+    def nft(self) -> int:
+        return self.nfts[0]
+
+    @property
+    def app_addr(self) -> str:
+        return get_application_address(self.app_client.app_id)
+
+    def pay(self, sender: LocalAccount, amount: int) -> TransactionWithSigner:
+        """A payment of `amount` from `sender` to the app, to pass to a call."""
+        return TransactionWithSigner(
+            txn=transaction.PaymentTxn(
+                sender.address,
+                self.app_client.get_suggested_params(),
+                self.app_addr,
+                amount,
+            ),
+            signer=sender.signer,
+        )
+
+
+def roles(
+    algod: AlgodClient, accounts: Sequence[LocalAccount]
+) -> tuple[LocalAccount, LocalAccount, LocalAccount]:
+    """Creator, borrower and lender, richest first."""
+
+    def balance(account: LocalAccount) -> int:
+        info = algod.account_info(account.address)
+        assert isinstance(info, dict)
+        return info["amount"]
+
+    ranked = sorted(accounts, key=balance, reverse=True)
+    return ranked[0], ranked[1], ranked[2]
+
+
+def provision(
+    algod: AlgodClient, funder: LocalAccount, count: int = 3, amount: int = 10**9
+) -> list[LocalAccount]:
+    """`count` (up to 16) fresh accounts, funded by `funder` in one atomic
+    group, each a microAlgo poorer than the one before so `roles` keeps their
+    order."""
+    accounts = []
+    for _ in range(count):
+        private_key, address = account.generate_account()
+        accounts.append(LocalAccount(address=address, private_key=private_key))
+    sp = algod.suggested_params()
+    atc = AtomicTransactionComposer()
+    for i, funded in enumerate(accounts):
+        atc.add_transaction(
+            TransactionWithSigner(
+                txn=transaction.PaymentTxn(
+                    funder.address, sp, funded.address, amount - i
+                ),
+                signer=funder.signer,
+            )
+        )
+    atc.execute(algod, 3)
+    return accounts
+
+
+_compiled: dict[tuple[str, str], bytes] = {}
+
+
+def compile_program(algod: AlgodClient, source: str) -> bytes:
+    """algod's compile, done once per node and TEAL source."""
+    key = (algod.algod_address, hashlib.sha256(source.encode()).hexdigest())
+    if key not in _compiled:
+        _compiled[key] = base64.b64decode(algod.compile(source)["result"])
+    return _compiled[key]
+
+
+def build_world(
+    algod: AlgodClient,
+    accounts: Sequence[LocalAccount],
+    app_spec: ApplicationSpecification,
+    *,
+    nfts: int = 1,
+    token_total: int = 10,
+    fund: int = 200_000,
+) -> World:
+    creator, borrower, lender = roles(algod, accounts)
+    sp = algod.suggested_params()
+
+    # Group 1: Borrower creates the NFTs, Lender creates the Tokens, Creator
+    # creates the app
+    approval = compile_program(algod, app_spec.approval_program)
+    clear = compile_program(algod, app_spec.clear_program)
+    atc = AtomicTransactionComposer()
+    for i in range(nfts):
+        atc.add_transaction(
+            TransactionWithSigner(
+                txn=transaction.AssetCreateTxn(
+                    sender=borrower.address,
+                    total=1,
+                    decimals=0,
+                    default_frozen=False,
+                    unit_name="NFT",
+                    asset_name=f"Beaker NFT {i}",
+                    sp=sp,
+                ),
+                signer=borrower.signer,
+            )
+        )
+    atc.add_transaction(
+        TransactionWithSigner(
+            txn=transaction.AssetCreateTxn(
+                sender=lender.address,
+                total=token_total,
+                decimals=0,
+                default_frozen=False,
+                unit_name="TOKEN",
+                asset_name="Beaker TOKEN",
+                sp=sp,
+            ),
+            signer=lender.signer,
+        )
+    )
+    atc.add_transaction(
+        TransactionWithSigner(
+            txn=transaction.ApplicationCreateTxn(
+                sender=creator.address,
+                sp=sp,
+                on_complete=transaction.OnComplete.NoOpOC,
+                approval_program=approval,
+                clear_program=clear,
+                global_schema=app_spec.global_state_schema,
+                local_schema=app_spec.local_state_schema,
+                extra_pages=num_extra_program_pages(approval, clear),
+            ),
+            signer=creator.signer,
+        )
+    )
+    tx_ids = atc.execute(algod, 3).tx_ids
+    created = []
+    for tx_id in tx_ids:
+        info = algod.pending_transaction_info(tx_id)
+        assert isinstance(info, dict)
+        created.append(info.get("asset-index") or info["application-index"])
+    *nft_ids, token, app_id = created
+
+    # Group 2: opt-ins between the two parties and the app's funding
+    atc = AtomicTransactionComposer()
+    atc.add_transaction(
+        TransactionWithSigner(
+            txn=transaction.AssetOptInTxn(borrower.address, sp, token),
+            signer=borrower.signer,
+        )
+    )
+    for nft in nft_ids:
+        atc.add_transaction(
+            TransactionWithSigner(
+                txn=transaction.AssetOptInTxn(lender.address, sp, nft),
+                signer=lender.signer,
+            )
+        )
+    atc.add_transaction(
+        TransactionWithSigner(
+            txn=transaction.PaymentTxn(
+                creator.address, sp, get_application_address(app_id), fund
+            ),
+            signer=creator.signer,
+        )
+    )
+    atc.execute(algod, 3)
+
+    app_client = client.ApplicationClient(
+        algod, app_spec, app_id=app_id, signer=creator.signer
+    )
+    return World(app_client, creator, borrower, lender, nft_ids, token)